@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк накладных расходов аутентификации на один запрос
+
+Сравнивает:
+- decode: только проверка подписи и срока JWT (нижняя граница)
+- verify_token: JWT + проверка отзыва по фильтру Блума в памяти процесса
+- Redis на запрос: JWT + проверка отзыва в Redis на каждый запрос
+  (заглушка Redis с задержкой --rtt, как у сетевого round trip)
+
+Фильтр заполняется --revoked отозванными сессиями; доля запросов с
+отозванными токенами задается --revoked-share.
+
+Запуск:
+    cd api && python benchmarks/bench_auth.py [--requests 20000] [--revoked 100000] [--rtt 0.0003]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.utils import auth, revocation
+from src.utils.jwt_utils import jwt_manager
+from src.utils.revocation import RevocationList
+
+
+class SlowRedis:
+    """Заглушка Redis: ZSCORE по словарю с задержкой round trip"""
+
+    def __init__(self, rtt: float, revoked: dict):
+        self.rtt = rtt
+        self.revoked = revoked
+
+    async def zscore(self, key, member):
+        await asyncio.sleep(self.rtt)
+        return self.revoked.get(member)
+
+
+async def timed(label: str, fn, tokens) -> float:
+    start = time.perf_counter()
+    for token in tokens:
+        await fn(token)
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / len(tokens) * 1e6
+    print(f"{label:<40} {len(tokens):>6} calls  {elapsed:8.3f}s  {per_call:10.1f} us/call")
+    return per_call
+
+
+async def main(requests: int, revoked_count: int, revoked_share: float, rtt: float) -> None:
+    revoked_sids = {f"revoked-{i}": time.time() + 86400 for i in range(revoked_count)}
+    redis = SlowRedis(rtt, revoked_sids)
+    revocation.redis_manager.client = redis
+    revocations = RevocationList(max(revoked_count, 1000), 0.001)
+    for sid in revoked_sids:
+        revocations.filter.add(sid)
+    revocation.revocation_list = revocations
+    auth.revocation_list = revocations
+    print(
+        f"Bloom filter: {revoked_count} sessions, {len(revocations.filter.bits) / 1024:.0f} KiB, "
+        f"{revocations.filter.hashes} hashes\n"
+    )
+
+    users = [jwt_manager.create_token_pair(user_id)["token"] for user_id in range(1000)]
+    revoked_tokens = [
+        jwt_manager.encode_token(
+            {"user_id": i, "type": "access", "sid": f"revoked-{i}"},
+            expires_in=jwt_manager.access_ttl,
+        )
+        for i in range(min(1000, revoked_count))
+    ]
+    tokens = [
+        random.choice(revoked_tokens) if revoked_tokens and random.random() < revoked_share else random.choice(users)
+        for _ in range(requests)
+    ]
+
+    async def decode_only(token):
+        return jwt_manager.decode_token(token)
+
+    async def redis_per_request(token):
+        payload = jwt_manager.decode_token(token)
+        return payload and await redis.zscore(revocation.REVOKED_SESSIONS_KEY, payload["sid"]) is None
+
+    base = await timed("decode only", decode_only, tokens)
+    bloom = await timed("verify_token (bloom in-process)", auth.verify_token, tokens)
+    remote = await timed(f"revocation check in Redis (rtt {rtt * 1e6:.0f}us)", redis_per_request, tokens)
+    print(
+        f"\nRevocation overhead: bloom +{bloom - base:.1f} us/request, "
+        f"Redis +{remote - base:.1f} us/request"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--revoked", type=int, default=100_000)
+    parser.add_argument("--revoked-share", type=float, default=0.01)
+    parser.add_argument("--rtt", type=float, default=0.0003)
+    args = parser.parse_args()
+    # Предупреждения об отозванных токенах не должны попадать в замер
+    logging.disable(logging.WARNING)
+    asyncio.run(main(args.requests, args.revoked, args.revoked_share, args.rtt))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк проверки использования промокода на таблице promo_attempts в 1 млн строк
+
+Сравнивает:
+- старый вариант: SELECT полной строки PromoAttempt без индекса (полный скан)
+- has_user_used_promo: EXISTS по уникальному индексу (user_id, code)
+- claim_promo_code: INSERT ... ON CONFLICT DO NOTHING (проверка + запись)
+
+Запуск:
+    cd api && python benchmarks/bench_promo_attempts.py [--rows 1000000] [--checks 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.models import Base, PromoAttempt
+from src.utils.database import claim_promo_code, has_user_used_promo
+
+USERS = 100_000
+CODES = [f"PROMO{i}" for i in range(50)]
+
+
+def populate(db_path: str, rows: int) -> None:
+    """Заполнить таблицу попыток синтетическими данными через sqlite3 (быстро)"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany(
+        "INSERT INTO users (user_id, first_name, lang) VALUES (?, 'bench', 'ru')",
+        ((uid,) for uid in range(USERS)),
+    )
+    seen = set()
+    batch = []
+    while len(seen) < rows:
+        pair = (random.randrange(USERS), random.choice(CODES))
+        if pair in seen:
+            continue
+        seen.add(pair)
+        batch.append((*pair, "2025-01-01 00:00:00"))
+        if len(batch) >= 50_000:
+            conn.executemany(
+                "INSERT INTO promo_attempts (user_id, code, attempt_time) VALUES (?, ?, ?)",
+                batch,
+            )
+            batch.clear()
+    if batch:
+        conn.executemany(
+            "INSERT INTO promo_attempts (user_id, code, attempt_time) VALUES (?, ?, ?)",
+            batch,
+        )
+    conn.commit()
+    conn.close()
+
+
+async def legacy_has_user_used_promo(user_id: int, code: str, session: AsyncSession):
+    """Прежняя реализация: загрузка полной строки"""
+    query = select(PromoAttempt).where(
+        PromoAttempt.user_id == user_id, PromoAttempt.code == code
+    )
+    result = await session.execute(query)
+    return result.scalars().first() is not None
+
+
+async def timed(label: str, fn, session: AsyncSession, probes) -> float:
+    start = time.perf_counter()
+    for user_id, code in probes:
+        await fn(user_id, code, session)
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / len(probes) * 1e6
+    print(f"{label:<45} {len(probes):>6} calls  {elapsed:8.3f}s  {per_call:10.1f} us/call")
+    return per_call
+
+
+async def main(rows: int, checks: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        print(f"Populating promo_attempts with {rows} rows...")
+        start = time.perf_counter()
+        populate(db_path, rows)
+        print(f"Populated in {time.perf_counter() - start:.1f}s\n")
+
+        probes = [(random.randrange(USERS), random.choice(CODES)) for _ in range(checks)]
+        session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+        async with session_factory() as session:
+            indexed = await timed("EXISTS + unique index", has_user_used_promo, session, probes)
+        async with session_factory() as session:
+            await timed("INSERT ON CONFLICT DO NOTHING + index", claim_promo_code, session, probes)
+            await session.rollback()
+
+        # Для сравнения удаляем индекс и проверяем старый вариант
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql("DROP INDEX ix_promo_attempts_user_id_code")
+        legacy_probes = probes[: max(1, checks // 20)]
+        async with session_factory() as session:
+            legacy = await timed("SELECT row, no index (legacy)", legacy_has_user_used_promo, session, legacy_probes)
+
+        print(f"\nSpeedup EXISTS vs legacy: x{legacy / indexed:.0f}")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--checks", type=int, default=2_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.checks))
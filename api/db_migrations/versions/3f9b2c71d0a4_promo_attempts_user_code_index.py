@@ -0,0 +1,35 @@
+"""promo_attempts unique (user_id, code) index
+
+Revision ID: 3f9b2c71d0a4
+Revises: ea1134c4ea31
+Create Date: 2026-10-19 10:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '3f9b2c71d0a4'
+down_revision = 'ea1134c4ea31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Удаляем дубликаты, оставляя самую раннюю попытку, иначе уникальный индекс не создастся
+    op.execute(
+        sa.text(
+            "DELETE FROM promo_attempts WHERE id NOT IN ("
+            "SELECT MIN(id) FROM promo_attempts GROUP BY user_id, code)"
+        )
+    )
+    op.create_index(
+        'ix_promo_attempts_user_id_code',
+        'promo_attempts',
+        ['user_id', 'code'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_promo_attempts_user_id_code', table_name='promo_attempts')
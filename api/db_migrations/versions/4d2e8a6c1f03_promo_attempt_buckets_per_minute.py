@@ -0,0 +1,35 @@
+"""promo_attempt_buckets per-minute rollup
+
+Revision ID: 4d2e8a6c1f03
+Revises: b7d3f0c2a915
+Create Date: 2026-10-19 16:41:07.218394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '4d2e8a6c1f03'
+down_revision = 'b7d3f0c2a915'
+branch_labels = None
+depends_on = None
+
+
+def _rebuild(bucket_seconds: int) -> None:
+    # Бакеты пересобираются из promo_attempts с новым размером
+    op.execute(sa.text("DELETE FROM promo_attempt_buckets"))
+    op.execute(
+        sa.text(
+            "INSERT INTO promo_attempt_buckets (user_id, bucket, count) "
+            f"SELECT user_id, CAST(strftime('%s', attempt_time) AS INTEGER) / {bucket_seconds}, COUNT(*) "
+            "FROM promo_attempts GROUP BY 1, 2"
+        )
+    )
+
+
+def upgrade() -> None:
+    _rebuild(60)
+
+
+def downgrade() -> None:
+    _rebuild(3600)
@@ -0,0 +1,37 @@
+"""promo_attempt_buckets hourly rollup
+
+Revision ID: 8c41e5a9b2f7
+Revises: 3f9b2c71d0a4
+Create Date: 2026-10-19 11:02:13.540917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '8c41e5a9b2f7'
+down_revision = '3f9b2c71d0a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('promo_attempt_buckets',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'bucket')
+    )
+    # Переносим существующие попытки в почасовые бакеты
+    op.execute(
+        sa.text(
+            "INSERT INTO promo_attempt_buckets (user_id, bucket, count) "
+            "SELECT user_id, CAST(strftime('%s', attempt_time) AS INTEGER) / 3600, COUNT(*) "
+            "FROM promo_attempts GROUP BY 1, 2"
+        )
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('promo_attempt_buckets')
@@ -0,0 +1,27 @@
+"""subscriptions (active, end_date) index
+
+Revision ID: b7d3f0c2a915
+Revises: 8c41e5a9b2f7
+Create Date: 2026-10-19 11:20:51.907362
+
+"""
+from alembic import op
+
+
+revision = 'b7d3f0c2a915'
+down_revision = '8c41e5a9b2f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_subscriptions_active_end_date',
+        'subscriptions',
+        ['active', 'end_date'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_subscriptions_active_end_date', table_name='subscriptions')
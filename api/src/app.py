@@ -8,6 +8,7 @@ from pydantic import BaseModel
 import logging
 import os
 import msgspec
+import json
 from urllib.parse import urlencode
 from typing import Any
 
@@ -24,17 +25,21 @@ from src.models.models import (
     ProfileResponse,
 )
 from src.utils.database import db_manager, provide_transaction
-from src.utils.redis_manager import redis_manager
+from src.utils.redis_manager import redis_manager, IDEMPOTENCY_PENDING
 from src.utils.subscription import (
     activate_subscription,
     get_subscription,
     get_purchases,
     renew_subscription,
+    sweep_expired_subscriptions,
 )
-from src.utils.promo import apply_promo
-from src.utils.auth import authenticate_telegram_user
+from src.utils.promo import apply_promo, cleanup_promo_attempt_buckets
+from src.utils.auth import authenticate_telegram_user, refresh_session, revoke_session
+from src.utils.revocation import revocation_list
+from src.utils.entitlement import entitlement_signer
 from src.utils.decorators import require_auth
 from src.utils.rate_limit import check_rate_limit
+from src.utils.tasks import periodic_tasks
 from litestar.template.config import TemplateConfig
 from litestar.contrib.jinja import JinjaTemplateEngine
 
@@ -74,10 +79,50 @@ cors_config = CORSConfig(
 )
 
 
+# Фоновые задачи
+async def promo_buckets_retention() -> None:
+    async with db_config.get_session() as session:
+        await cleanup_promo_attempt_buckets(session)
+
+
+periodic_tasks.register(
+    "promo_buckets_retention",
+    config.promo.cleanup_interval or 3600,
+    promo_buckets_retention,
+)
+
+
+async def subscription_sweeper() -> None:
+    async with db_config.get_session() as session:
+        await sweep_expired_subscriptions(session)
+
+
+periodic_tasks.register(
+    "subscription_sweeper",
+    config.sweeper.interval or 300,
+    subscription_sweeper,
+)
+
+
+async def revocation_sync() -> None:
+    await revocation_list.sync()
+
+
+periodic_tasks.register(
+    "revocation_sync",
+    config.jwt.revocation_sync_interval or 300,
+    revocation_sync,
+)
+
+
 class PromoRequest(BaseModel):
     promo_code: str
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 @get("/")
 async def index_page() -> Template:
     return Template(
@@ -145,6 +190,7 @@ async def get_user_purchases(
 async def activate_user_subscription(
     request: Request, transaction: AsyncSession, **kwargs: Any
 ) -> dict:
+    idempotency_key = None
     try:
         user_id = kwargs.get("user_id")
         if not user_id:
@@ -155,6 +201,19 @@ async def activate_user_subscription(
         if not subscription_type:
             raise HTTPException(status_code=400, detail="subscription_type is required")
 
+        # Повтор платежа из outbox бота не должен активировать подписку дважды
+        if request.headers.get("Idempotency-Key"):
+            idempotency_key = f"activate:{user_id}:{request.headers['Idempotency-Key']}"
+            stored = await redis_manager.begin_idempotent(idempotency_key)
+            if stored == IDEMPOTENCY_PENDING:
+                idempotency_key = None
+                raise HTTPException(
+                    status_code=409, detail="Request with this Idempotency-Key is in progress"
+                )
+            if stored:
+                logger.info(f"Replaying activation result for user {user_id}")
+                return json.loads(stored)
+
         success = await activate_subscription(user_id, subscription_type, transaction)
         if not success:
             raise HTTPException(
@@ -162,11 +221,21 @@ async def activate_user_subscription(
             )
 
         logger.info(f"Subscription {subscription_type} activated for user {user_id}")
-        return {"message": "Subscription activated successfully"}
+        result = {"message": "Subscription activated successfully"}
+        if idempotency_key:
+            # Ответ сохраняется только после коммита: иначе повтор получил бы
+            # успех для подписки, которая не записана
+            await transaction.commit()
+            await redis_manager.complete_idempotent(idempotency_key, result)
+        return result
 
     except HTTPException:
+        if idempotency_key:
+            await redis_manager.release_idempotent(idempotency_key)
         raise
     except Exception as e:
+        if idempotency_key:
+            await redis_manager.release_idempotent(idempotency_key)
         logger.error(f"Error activating subscription for user {user_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
@@ -247,6 +316,30 @@ async def telegram_auth(request: Request, transaction: AsyncSession) -> dict:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@post("/api/v1/auth/refresh")
+async def refresh_auth(data: RefreshRequest) -> dict:
+    try:
+        tokens = await refresh_session(data.refresh_token)
+    except Exception as e:
+        logger.error(f"Error refreshing session: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+    if not tokens:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return tokens
+
+
+@post("/api/v1/auth/logout")
+async def logout(data: RefreshRequest) -> dict:
+    try:
+        revoked = await revoke_session(data.refresh_token)
+    except Exception as e:
+        logger.error(f"Error revoking session: {e}")
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+    if not revoked:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return {"message": "Logged out"}
+
+
 @get("/api/v1/telegram-callback")
 async def telegram_callback(ext: str, **params) -> Response:
     query = urlencode(params)
@@ -301,6 +394,27 @@ async def get_profile(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@get("/api/v1/entitlement")
+@require_auth
+async def get_entitlement(
+    request: Request, transaction: AsyncSession, **kwargs: Any
+) -> dict:
+    """Подписанный снимок подписки для кэширования в расширении"""
+    user_id = kwargs.get("user_id")
+    if not entitlement_signer.available:
+        raise HTTPException(status_code=503, detail="Entitlement snapshots are disabled")
+    subscription = await db_manager.get_subscription(user_id, transaction)
+    return entitlement_signer.issue(user_id, subscription)
+
+
+@get("/api/v1/entitlement/keys")
+async def get_entitlement_keys() -> Response:
+    return Response(
+        content=entitlement_signer.public_jwks(),
+        headers={"Cache-Control": "public, max-age=86400"},
+    )
+
+
 @get("/extension-auth")
 async def extension_auth_page(request: Request) -> Template:
     # Пробрасываем все query параметры в шаблон
@@ -335,13 +449,18 @@ app = Litestar(
         apply_promo_code,
         telegram_login,
         telegram_auth,
+        refresh_auth,
+        logout,
         get_profile,
+        get_entitlement,
+        get_entitlement_keys,
         extension_auth_page,
         favicon,
         web_manifest,
     ],
     cors_config=cors_config,
     dependencies={"transaction": provide_transaction},
+    lifespan=[periodic_tasks.lifespan, revocation_list.lifespan],
     plugins=[SQLAlchemyPlugin(db_config)],
     logging_config=logging_config,
     template_config=TemplateConfig(
@@ -20,6 +20,10 @@ class JWTConfig(Struct):
     secret: str | None = None
     algorithm: str | None = None
     expiry_days: int | None = None
+    access_ttl_minutes: int | None = None
+    revocation_capacity: int | None = None
+    revocation_error_rate: float | None = None
+    revocation_sync_interval: int | None = None
 
 
 class DatabaseConfig(Struct):
@@ -46,11 +50,34 @@ class RedisConfig(Struct):
     default_ttl: int | None = None
 
 
+class AuthConfig(Struct):
+    token_cache_ttl: float | None = None
+    token_negative_ttl: float | None = None
+    token_cache_size: int | None = None
+
+
+class EntitlementConfig(Struct):
+    private_key: str | None = None
+    key_id: str | None = None
+    ttl_minutes: int | None = None
+    inactive_ttl_minutes: int | None = None
+
+
 class RateLimitConfig(Struct):
     window: int | None = None
     max_requests: int | None = None
 
 
+class PromoConfig(Struct):
+    attempts_retention_hours: int | None = None
+    cleanup_interval: int | None = None
+
+
+class SweeperConfig(Struct):
+    interval: int | None = None
+    batch_size: int | None = None
+
+
 class CORSConfig(Struct):
     allow_origins: tuple | None = None
     allow_methods: tuple | None = None
@@ -79,7 +106,11 @@ class APIConfig(BaseConfig):
     jwt: JWTConfig = field(default_factory=JWTConfig)
     database: DatabaseConfig = field(default_factory=DatabaseConfig)
     redis: RedisConfig = field(default_factory=RedisConfig)
+    auth: AuthConfig = field(default_factory=AuthConfig)
+    entitlement: EntitlementConfig = field(default_factory=EntitlementConfig)
     rate_limit: RateLimitConfig = field(default_factory=RateLimitConfig)
+    promo: PromoConfig = field(default_factory=PromoConfig)
+    sweeper: SweeperConfig = field(default_factory=SweeperConfig)
     cors: CORSConfig = field(default_factory=CORSConfig)
     logging: LoggingConfig = field(default_factory=LoggingConfig)
     security: SecurityConfig = field(default_factory=SecurityConfig)
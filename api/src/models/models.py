@@ -1,6 +1,6 @@
 from datetime import datetime, UTC
 from typing import Optional, List
-from sqlalchemy import ForeignKey, String, Integer, Boolean, DateTime, func
+from sqlalchemy import ForeignKey, String, Integer, Boolean, DateTime, Index, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from msgspec import Struct
 from enum import Enum
@@ -41,6 +41,9 @@ class SubscriptionType(str, Enum):
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        Index("ix_subscriptions_active_end_date", "active", "end_date"),
+    )
 
     user_id: Mapped[int] = mapped_column(ForeignKey("users.user_id"), primary_key=True)
     end_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
@@ -69,6 +72,9 @@ class PromoCode(Base):
 
 class PromoAttempt(Base):
     __tablename__ = "promo_attempts"
+    __table_args__ = (
+        Index("ix_promo_attempts_user_id_code", "user_id", "code", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.user_id"))
@@ -83,6 +89,20 @@ class PromoAttempt(Base):
     user: Mapped["User"] = relationship(back_populates="promo_attempts")
 
 
+class PromoAttemptBucket(Base):
+    """Поминутный счётчик попыток применения промокода (rollup по promo_attempts)"""
+
+    __tablename__ = "promo_attempt_buckets"
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.user_id"), primary_key=True
+    )
+    bucket: Mapped[int] = mapped_column(
+        Integer, primary_key=True
+    )  # Номер минуты от начала эпохи (unix_time // 60)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+
 class TelegramAuthData(Struct):
     id: int
     first_name: str
@@ -0,0 +1,128 @@
+"""
+Redis в памяти для тестов API
+
+Значения хранятся строками, как при decode_responses=True; реализованы
+только команды, которыми пользуются RedisManager и RevocationList.
+"""
+
+import time
+
+
+class FakePipeline:
+    """Команды копятся и выполняются по execute(); выполненные пачки пишутся в redis.pipelines"""
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._redis, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((name, method, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        self._redis.pipelines.append([name for name, *_ in self._commands])
+        results = [await method(*args, **kwargs) for _, method, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.strings = {}
+        self.expires = {}
+        self.hashes = {}
+        self.zsets = {}
+        self.pipelines = []
+        self.published = []
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.time():
+            self.strings.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.strings
+
+    async def ping(self):
+        return True
+
+    async def get(self, key):
+        return self.strings[key] if self._alive(key) else None
+
+    async def set(self, key, value, ex=None, nx=False, exat=None):
+        if nx and self._alive(key):
+            return None
+        self.strings[key] = str(value)
+        self.expires.pop(key, None)
+        if ex is not None:
+            self.expires[key] = time.time() + int(ex)
+        if exat is not None:
+            self.expires[key] = float(exat)
+        return True
+
+    async def pttl(self, key):
+        if not self._alive(key):
+            return -2
+        if key not in self.expires:
+            return -1
+        return int((self.expires[key] - time.time()) * 1000)
+
+    async def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            for store in (self.strings, self.hashes, self.zsets):
+                if store.pop(key, None) is not None:
+                    deleted += 1
+            self.expires.pop(key, None)
+        return deleted
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(str(field))
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        values = self.hashes.setdefault(key, {})
+        for name, item in items.items():
+            values[str(name)] = str(item)
+        return len(items)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def hdel(self, key, *fields):
+        values = self.hashes.get(key, {})
+        return sum(values.pop(str(field), None) is not None for field in fields)
+
+    async def zadd(self, key, mapping):
+        members = self.zsets.setdefault(key, {})
+        added = sum(str(member) not in members for member in mapping)
+        members.update({str(member): float(score) for member, score in mapping.items()})
+        return added
+
+    async def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(str(member))
+
+    async def zrange(self, key, start, end):
+        members = [member for member, _ in sorted(self.zsets.get(key, {}).items(), key=lambda item: (item[1], item[0]))]
+        return members[start:] if end == -1 else members[start:end + 1]
+
+    async def zremrangebyscore(self, key, min, max):
+        low, high = float(min), float(max)
+        members = self.zsets.get(key, {})
+        expired = [member for member, score in members.items() if low <= score <= high]
+        for member in expired:
+            del members[member]
+        return len(expired)
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
@@ -0,0 +1,41 @@
+import pytest
+from datetime import datetime, timedelta
+from src.utils.entitlement import EntitlementSigner, generate_private_key_pem
+
+
+def test_signer_without_key_is_disabled():
+    signer = EntitlementSigner(private_key_pem=None)
+    signer._private_key = None
+    assert not signer.available
+    assert signer.public_jwks() == {"keys": []}
+    with pytest.raises(RuntimeError):
+        signer.issue(1, None)
+
+
+@pytest.fixture
+def signer():
+    return EntitlementSigner(generate_private_key_pem(), "k1", ttl_minutes=60, inactive_ttl_minutes=5)
+
+
+def test_snapshot_verifies_with_published_key(signer):
+    import jwt
+
+    now = datetime.now()
+    subscription = {"end_date": (now + timedelta(days=10)).isoformat(), "active": True, "subtype": "month"}
+    issued = signer.issue(42, subscription, now=now.timestamp())
+
+    jwk = signer.public_jwks()["keys"][0]
+    assert jwt.get_unverified_header(issued["snapshot"])["kid"] == jwk["kid"] == "k1"
+    key = jwt.PyJWK(jwk).key
+    claims = jwt.decode(issued["snapshot"], key, algorithms=["ES256"])
+    assert (claims["uid"], claims["plan"], claims["act"]) == (42, "month", True)
+    assert claims["exp"] == issued["refresh_at"] == int(now.timestamp()) + 3600
+
+
+def test_refresh_deadline(signer):
+    now = datetime.now()
+    # Подписка кончается раньше обычного срока — обновиться к ее окончанию
+    ending = {"end_date": (now + timedelta(minutes=10)).isoformat(), "active": True, "subtype": "month"}
+    assert signer.issue(1, ending, now=now.timestamp())["refresh_at"] == int((now + timedelta(minutes=10)).timestamp())
+    # Без подписки — короткий срок, чтобы покупка появилась быстро
+    assert signer.issue(1, None, now=now.timestamp())["refresh_at"] == int(now.timestamp()) + 300
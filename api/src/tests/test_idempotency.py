@@ -0,0 +1,38 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from src.tests.fake_redis import FakeRedis
+from src.utils.redis_manager import RedisManager, IDEMPOTENCY_PENDING
+
+
+@pytest.fixture
+def manager():
+    with patch.object(RedisManager, "_init_client"):
+        manager = RedisManager("redis://test")
+    manager.client = FakeRedis()
+    manager._connected = True
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_idempotent_request_lifecycle(manager):
+    # Первый запрос захватывает ключ, параллельный видит "в обработке"
+    assert await manager.begin_idempotent("activate:1:charge") is None
+    assert await manager.begin_idempotent("activate:1:charge") == IDEMPOTENCY_PENDING
+
+    # После успеха повтор получает сохраненный ответ
+    await manager.complete_idempotent("activate:1:charge", {"message": "ok"})
+    assert json.loads(await manager.begin_idempotent("activate:1:charge")) == {"message": "ok"}
+
+
+@pytest.mark.asyncio
+async def test_released_key_can_be_retried(manager):
+    assert await manager.begin_idempotent("activate:2:charge") is None
+    await manager.release_idempotent("activate:2:charge")
+    assert await manager.begin_idempotent("activate:2:charge") is None
+
+
+@pytest.mark.asyncio
+async def test_redis_unavailable_does_not_block_request(manager):
+    manager._ensure_connection = AsyncMock(return_value=False)
+    assert await manager.begin_idempotent("activate:3:charge") is None
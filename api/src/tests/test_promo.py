@@ -102,3 +102,68 @@ async def test_apply_expired_promo(async_session):
     # Пользователь не должен применять истёкший промокод (логика проверки в app, тут только факт наличия)
     # Не добавляем попытку, т.к. в app.py будет ошибка до этого места
     assert not await db_manager.has_user_used_promo(3, "EXPIRED", async_session)
+
+
+@pytest.mark.asyncio
+async def test_claim_promo_code_is_atomic(async_session):
+    async_session.add(User(user_id=4, first_name="Claim"))
+    await async_session.commit()
+
+    # Первая попытка фиксирует промокод, повторная упирается в уникальный индекс
+    assert await db_manager.claim_promo_code(4, "PROMO2", async_session)
+    assert not await db_manager.claim_promo_code(4, "PROMO2", async_session)
+    assert await db_manager.has_user_used_promo(4, "PROMO2", async_session)
+
+    # Другой код тем же пользователем применяется независимо
+    assert await db_manager.claim_promo_code(4, "PROMO3", async_session)
+
+
+@pytest.mark.asyncio
+async def test_promo_attempt_buckets_count_and_purge(async_session):
+    from src.models.models import PromoAttemptBucket
+    from src.utils.database import promo_attempt_bucket, purge_promo_attempt_buckets
+
+    async_session.add(User(user_id=5, first_name="Buckets"))
+    await async_session.commit()
+
+    for code in ("A", "B", "C"):
+        await db_manager.add_promo_attempt(5, code, async_session)
+    current = promo_attempt_bucket()
+    # Попытки двухчасовой и недельной давности
+    async_session.add_all(
+        [
+            PromoAttemptBucket(user_id=5, bucket=current - 2 * 60, count=4),
+            PromoAttemptBucket(user_id=5, bucket=current - 7 * 24 * 60, count=10),
+        ]
+    )
+    await async_session.flush()
+
+    assert await db_manager.get_promo_attempts_count(5, 1, async_session) == 3
+    assert await db_manager.get_promo_attempts_count(5, 3, async_session) == 7
+    assert await db_manager.get_promo_attempts_count(5, 24 * 8, async_session) == 17
+
+    assert await purge_promo_attempt_buckets(24, async_session) == 1
+    assert await db_manager.get_promo_attempts_count(5, 24 * 8, async_session) == 7
+
+
+@pytest.mark.asyncio
+async def test_promo_attempt_window_slides_by_minute(async_session):
+    from src.models.models import PromoAttemptBucket
+    from src.utils.database import promo_attempt_bucket
+
+    async_session.add(User(user_id=6, first_name="Window"))
+    await async_session.commit()
+
+    current = promo_attempt_bucket()
+    # 90 и 150 минут назад: почасовые бакеты для окна в 2 часа теряли первую попытку
+    async_session.add_all(
+        [
+            PromoAttemptBucket(user_id=6, bucket=current - 90, count=2),
+            PromoAttemptBucket(user_id=6, bucket=current - 150, count=5),
+        ]
+    )
+    await async_session.flush()
+
+    assert await db_manager.get_promo_attempts_count(6, 1, async_session) == 0
+    assert await db_manager.get_promo_attempts_count(6, 2, async_session) == 2
+    assert await db_manager.get_promo_attempts_count(6, 3, async_session) == 7
@@ -0,0 +1,149 @@
+import time
+import jwt
+import pytest
+from unittest.mock import patch
+from src.tests.fake_redis import FakeRedis
+from src.utils import auth, revocation
+from src.utils.auth import refresh_session, revoke_session, verify_token
+from src.utils.jwt_utils import JWTManager
+from src.utils.revocation import BloomFilter, RevocationList
+
+
+# Свои настройки JWT: тесты не зависят от config.yaml
+jwt_manager = JWTManager(secret="test-secret", algorithm="HS256", expiry_days=30)
+
+
+@pytest.fixture
+def fake_redis():
+    redis = FakeRedis()
+    with patch.object(auth, "jwt_manager", jwt_manager), \
+            patch.object(revocation.redis_manager, "client", redis), \
+            patch.object(revocation, "revocation_list", RevocationList(1000, 0.001)), \
+            patch("src.utils.auth.revocation_list", revocation.revocation_list):
+        yield redis
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(10_000, 0.01)
+    for i in range(10_000):
+        bloom.add(f"sid-{i}")
+    assert all(f"sid-{i}" in bloom for i in range(10_000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10_000))
+    assert false_positives < 300
+    # ~9.6 бит на элемент при 1% ошибок
+    assert len(bloom.bits) < 10_000 * 10 // 8 + 8
+
+
+@pytest.mark.asyncio
+async def test_access_and_refresh_tokens(fake_redis):
+    tokens = jwt_manager.create_token_pair(42)
+    with patch.object(fake_redis, "zscore", wraps=fake_redis.zscore) as zscore:
+        assert await verify_token(tokens["token"]) == (True, 42)
+        # Токен обновления не принимается как токен доступа
+        assert await verify_token(tokens["refresh_token"]) == (False, None)
+
+        refreshed = await refresh_session(tokens["refresh_token"])
+        assert await verify_token(refreshed["token"]) == (True, 42)
+    assert jwt_manager.decode_token(refreshed["token"])["sid"] == jwt_manager.decode_token(tokens["token"])["sid"]
+    # Неотозванные сессии проверяются без обращения к Redis
+    zscore.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_is_single_use(fake_redis):
+    tokens = jwt_manager.create_token_pair(42)
+    refreshed = await refresh_session(tokens["refresh_token"])
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+
+    # Повтор старого токена обновления — признак кражи: сессия отзывается целиком
+    assert await refresh_session(tokens["refresh_token"]) is None
+    assert await verify_token(refreshed["token"]) == (False, None)
+    assert await refresh_session(refreshed["refresh_token"]) is None
+
+
+def issued_at(user_id, token_type, iat):
+    """Токен сессии с заданным iat (целые секунды, как у выданных API)"""
+    return jwt.encode(
+        {"user_id": user_id, "type": token_type, "sid": f"old-{user_id}", "jti": "old",
+         "iat": iat, "exp": int(time.time()) + 600},
+        jwt_manager.secret,
+        algorithm=jwt_manager.algorithm,
+    )
+
+
+def issued_ago(user_id, token_type, seconds):
+    """Токен сессии, выданный seconds секунд назад"""
+    return issued_at(user_id, token_type, int(time.time()) - seconds)
+
+
+@pytest.mark.asyncio
+async def test_revoke_user_rejects_earlier_tokens(fake_redis):
+    await revocation.revocation_list.revoke_user(42, time.time() - 5)
+
+    assert await verify_token(issued_ago(42, "access", 10)) == (False, None)
+    assert await refresh_session(issued_ago(42, "refresh", 10)) is None
+    assert await verify_token(issued_ago(43, "access", 10)) == (True, 43)
+    # Токен, выданный после отзыва (новый вход), принимается
+    assert await verify_token(jwt_manager.create_token_pair(42)["token"]) == (True, 42)
+
+    # Другой процесс узнает об отзыве из канала и при sync
+    listener = RevocationList(1000, 0.001)
+    listener._handle_message(fake_redis.published[-1][1])
+    assert listener.is_user_revoked(42, time.time() - 10)
+    restarted = RevocationList(1000, 0.001)
+    await restarted.sync()
+    assert restarted.is_user_revoked(42, time.time() - 10)
+    assert not restarted.is_user_revoked(43, time.time() - 10)
+
+
+@pytest.mark.asyncio
+async def test_token_issued_in_revocation_second_is_accepted(fake_redis):
+    # Отзыв в середине секунды: iat нового входа в ту же секунду не меньше момента отзыва
+    revoked_at = int(time.time()) + 0.5
+    await revocation.revocation_list.revoke_user(42, revoked_at)
+
+    assert await verify_token(issued_at(42, "access", int(revoked_at))) == (True, 42)
+    assert await verify_token(issued_at(42, "access", int(revoked_at) - 1)) == (False, None)
+
+    # Другие процессы получают тот же момент отзыва в целых секундах
+    listener = RevocationList(1000, 0.001)
+    listener._handle_message(fake_redis.published[-1][1])
+    assert listener.users == {42: int(revoked_at)}
+    restarted = RevocationList(1000, 0.001)
+    await restarted.sync()
+    assert restarted.users == {42: int(revoked_at)}
+
+
+@pytest.mark.asyncio
+async def test_logout_revokes_whole_session(fake_redis):
+    tokens = jwt_manager.create_token_pair(42)
+    other = jwt_manager.create_token_pair(43)
+    refreshed = await refresh_session(tokens["refresh_token"])
+
+    assert await revoke_session(tokens["refresh_token"])
+    assert await verify_token(tokens["token"]) == (False, None)
+    assert await verify_token(refreshed["token"]) == (False, None)
+    assert await refresh_session(refreshed["refresh_token"]) is None
+    assert await verify_token(other["token"]) == (True, 43)
+
+
+@pytest.mark.asyncio
+async def test_other_process_learns_revocation(fake_redis):
+    tokens = jwt_manager.create_token_pair(42)
+    await revoke_session(tokens["refresh_token"])
+
+    # Другой процесс: по сообщению канала и по полному sync
+    sid = jwt_manager.decode_token(tokens["token"])["sid"]
+    listener = RevocationList(1000, 0.001)
+    _, message = fake_redis.published[-1]
+    listener._handle_message(message)
+    assert listener.might_be_revoked(sid)
+
+    restarted = RevocationList(1000, 0.001)
+    assert await restarted.sync() == 1
+    assert await restarted.is_revoked(sid)
+
+
+@pytest.mark.asyncio
+async def test_legacy_user_token_still_accepted(fake_redis):
+    assert await verify_token(jwt_manager.create_user_token(7)) == (True, 7)
@@ -0,0 +1,76 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from src.models.models import Base, User, Subscription
+from src.utils.subscription import sweep_expired_subscriptions
+
+
+@pytest_asyncio.fixture(scope="function")
+async def async_session():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    AsyncSessionLocal = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession
+    )
+    async with AsyncSessionLocal() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_sweeper_deactivates_only_expired(async_session):
+    now = datetime.now()
+    for user_id in range(1, 8):
+        async_session.add(User(user_id=user_id, first_name=f"User {user_id}"))
+    # 1-5 истекли, 6 активна, 7 уже неактивна
+    for user_id in range(1, 6):
+        async_session.add(
+            Subscription(
+                user_id=user_id,
+                end_date=now - timedelta(hours=user_id),
+                active=True,
+                subtype="monthly",
+            )
+        )
+    async_session.add(
+        Subscription(
+            user_id=6, end_date=now + timedelta(days=3), active=True, subtype="monthly"
+        )
+    )
+    async_session.add(
+        Subscription(
+            user_id=7, end_date=now - timedelta(days=3), active=False, subtype="monthly"
+        )
+    )
+    await async_session.commit()
+
+    publish = AsyncMock(return_value=True)
+    with patch(
+        "src.utils.subscription.redis_manager.publish_subscription_invalidation",
+        publish,
+    ):
+        swept = await sweep_expired_subscriptions(async_session, batch_size=2)
+
+    assert swept == 5
+    # Пачки по 2 строки: 2 + 2 + 1
+    assert publish.await_count == 3
+    published = sorted(uid for call in publish.await_args_list for uid in call.args[0])
+    assert published == [1, 2, 3, 4, 5]
+
+    result = await async_session.execute(
+        select(Subscription.user_id).where(Subscription.active == True)  # noqa: E712
+    )
+    assert list(result.scalars().all()) == [6]
+    await async_session.commit()
+
+    # Повторный прогон ничего не находит
+    with patch(
+        "src.utils.subscription.redis_manager.publish_subscription_invalidation",
+        publish,
+    ):
+        assert await sweep_expired_subscriptions(async_session, batch_size=2) == 0
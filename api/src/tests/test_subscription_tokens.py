@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from src.tests.fake_redis import FakeRedis
+from src.utils import auth
+from src.utils.auth import subscription_token_cache, verify_token
+from src.utils.jwt_utils import JWTManager
+from src.utils.redis_manager import RedisManager
+
+
+TRIAL_TOKEN = "trial-3f1c0a2e-1111-4000-8000-000000000042"
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    subscription_token_cache.clear()
+    yield
+    subscription_token_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_lookup_subscription_token():
+    with patch.object(RedisManager, "_init_client"):
+        manager = RedisManager("redis://test")
+    manager.client = FakeRedis()
+    await manager.client.set(f"token:{TRIAL_TOKEN}", 42, ex=5)
+
+    user_id, pttl = await manager.lookup_subscription_token(TRIAL_TOKEN)
+    assert user_id == 42
+    assert 4000 < pttl <= 5000
+    assert await manager.lookup_subscription_token("unknown") is None
+    # GET и PTTL уходят одним pipeline
+    assert manager.client.pipelines == [["get", "pttl"], ["get", "pttl"]]
+
+
+@pytest.mark.asyncio
+async def test_valid_token_is_cached():
+    lookup = AsyncMock(return_value=(42, 60_000))
+    with patch.object(auth.redis_manager, "lookup_subscription_token", lookup):
+        assert await verify_token(TRIAL_TOKEN) == (True, 42)
+        assert await verify_token(TRIAL_TOKEN) == (True, 42)
+    assert lookup.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_invalid_token_is_negatively_cached():
+    lookup = AsyncMock(return_value=None)
+    with patch.object(auth.redis_manager, "lookup_subscription_token", lookup):
+        assert await verify_token("3f1c0a2e-0000-4000-8000-000000000000") == (False, None)
+        assert await verify_token("3f1c0a2e-0000-4000-8000-000000000000") == (False, None)
+    assert lookup.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_does_not_outlive_redis_key():
+    # Ключ истекает через 50 мс — после этого токен снова проверяется в Redis
+    lookup = AsyncMock(side_effect=[(42, 50), None])
+    with patch.object(auth.redis_manager, "lookup_subscription_token", lookup):
+        assert await verify_token(TRIAL_TOKEN) == (True, 42)
+        await asyncio.sleep(0.06)
+        assert await verify_token(TRIAL_TOKEN) == (False, None)
+    assert lookup.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_error_is_not_cached():
+    lookup = AsyncMock(side_effect=[ConnectionError("down"), (42, 60_000)])
+    with patch.object(auth.redis_manager, "lookup_subscription_token", lookup):
+        assert await verify_token(TRIAL_TOKEN) == (False, None)
+        assert await verify_token(TRIAL_TOKEN) == (True, 42)
+
+
+@pytest.mark.asyncio
+async def test_guessable_trial_token_is_rejected():
+    # trial-{user_id} выводится из Telegram ID — даже при наличии ключа в Redis не принимается
+    lookup = AsyncMock(return_value=(42, 60_000))
+    with patch.object(auth.redis_manager, "lookup_subscription_token", lookup):
+        assert await verify_token("trial-42") == (False, None)
+    lookup.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_jwt_does_not_touch_redis():
+    lookup = AsyncMock()
+    manager = JWTManager(secret="test-secret", algorithm="HS256", expiry_days=30)
+    token = manager.create_user_token(7)
+    with patch.object(auth, "jwt_manager", manager), \
+            patch.object(auth.redis_manager, "lookup_subscription_token", lookup):
+        assert await verify_token(token) == (True, 7)
+    lookup.assert_not_awaited()
@@ -1,13 +1,71 @@
 import logging
+import re
+import time
+from collections import OrderedDict
 from typing import Optional, Dict, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from .database import db_manager
-from .jwt_utils import jwt_manager, verify_telegram_signature, verify_telegram_auth_time
+from .jwt_utils import (
+    jwt_manager,
+    verify_telegram_signature,
+    verify_telegram_auth_time,
+    REFRESH_TOKEN_TYPE,
+)
+from .redis_manager import redis_manager
+from .revocation import revocation_list
 from src.configs.config import config
 
 
 logger = logging.getLogger(__name__)
 
+# Время жизни локального кэша токенов подписки (секунды), если не задано в конфиге
+DEFAULT_TOKEN_CACHE_TTL = 30.0
+DEFAULT_TOKEN_NEGATIVE_TTL = 5.0
+DEFAULT_TOKEN_CACHE_SIZE = 10000
+# Токены бота — trial-{uuid} или UUID; более длинные строки в Redis не ищем
+MAX_SUBSCRIPTION_TOKEN_LENGTH = 64
+# Старые триальные токены trial-{user_id}: угадываются по Telegram ID, не принимаются
+LEGACY_TRIAL_TOKEN = re.compile(r"trial-\d+")
+
+
+class TokenCache:
+    """LRU-кэш результатов проверки токенов подписки в памяти процесса
+
+    Для действительного токена хранится user_id не дольше, чем осталось жить
+    ключу token:{token} в Redis, поэтому истекший токен перестает приниматься
+    вместе с ключом. Неверные токены кэшируются на короткое время (None).
+    """
+
+    def __init__(self, max_size: int = DEFAULT_TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, Optional[int]]]" = OrderedDict()
+
+    def get(self, token: str) -> Tuple[bool, Optional[int]]:
+        """(найдено, user_id); user_id None — токен недействителен"""
+        entry = self._entries.get(token)
+        if entry is None:
+            return False, None
+        if entry[0] <= time.monotonic():
+            del self._entries[token]
+            return False, None
+        self._entries.move_to_end(token)
+        return True, entry[1]
+
+    def set(self, token: str, user_id: Optional[int], ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self._entries[token] = (time.monotonic() + ttl, user_id)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# Создаем глобальный кэш токенов подписки
+subscription_token_cache = TokenCache(config.auth.token_cache_size or DEFAULT_TOKEN_CACHE_SIZE)
+
 
 async def authenticate_telegram_user(
     auth_data: Dict[str, Any], session: AsyncSession
@@ -49,26 +107,111 @@ async def authenticate_telegram_user(
             logger.error(f"Failed to create/update user {user_id}")
             return None
 
-        # Создаем JWT токен
-        token = jwt_manager.create_user_token(user_id)
+        # Создаем пару JWT: короткий токен доступа и токен обновления
+        tokens = jwt_manager.create_token_pair(user_id)
 
         await session.commit()
         logger.info(f"User {user_id} authenticated successfully")
 
-        return {"token": token, "user_id": user_id, **user_data}
+        return {**tokens, "user_id": user_id, **user_data}
 
     except Exception as e:
         logger.error(f"Error during Telegram authentication: {e}")
         return None
 
 
+async def refresh_session(refresh_token: str) -> Optional[Dict[str, Any]]:
+    """Обменять токен обновления на новую пару токенов той же сессии
+
+    Токен обновления одноразовый (jti): повторное предъявление означает,
+    что токен скопирован, и отзывает всю сессию. Ошибка Redis пробрасывается.
+    """
+    payload = jwt_manager.decode_token(refresh_token)
+    if not payload or payload.get("type") != REFRESH_TOKEN_TYPE or "sid" not in payload or "jti" not in payload:
+        return None
+    sid = payload["sid"]
+    if revocation_list.is_user_revoked(payload["user_id"], payload.get("iat", 0)):
+        logger.warning(f"Refresh for revoked user {payload['user_id']} rejected")
+        return None
+    if await revocation_list.is_revoked(sid):
+        logger.warning(f"Refresh for revoked session {sid} rejected")
+        return None
+    if not await revocation_list.consume_refresh_token(payload["jti"], payload["exp"]):
+        logger.warning(f"Refresh token reuse in session {sid}, revoking the session")
+        await revocation_list.revoke(sid, time.time() + jwt_manager.expiry_days * 86400)
+        return None
+    return jwt_manager.create_token_pair(payload["user_id"], sid)
+
+
+async def revoke_session(refresh_token: str) -> bool:
+    """Отозвать сессию токена обновления (выход); токены доступа перестают приниматься сразу"""
+    payload = jwt_manager.decode_token(refresh_token)
+    if not payload or payload.get("type") != REFRESH_TOKEN_TYPE or "sid" not in payload:
+        return False
+    # Более новый токен обновления этой сессии может жить до now + expiry_days
+    await revocation_list.revoke(
+        payload["sid"], time.time() + jwt_manager.expiry_days * 86400
+    )
+    return True
+
+
+async def verify_subscription_token(token: str) -> Tuple[bool, Optional[int]]:
+    """Проверить токен подписки, выданный ботом (trial-{uuid} или UUID)
+
+    Повторные проверки обслуживаются из subscription_token_cache, промах —
+    одно чтение token:{token} из Redis. При недоступности Redis токен
+    отклоняется, но результат не кэшируется.
+    """
+    if not token or len(token) > MAX_SUBSCRIPTION_TOKEN_LENGTH:
+        return False, None
+    if LEGACY_TRIAL_TOKEN.fullmatch(token):
+        logger.warning("Legacy trial token rejected")
+        return False, None
+    found, user_id = subscription_token_cache.get(token)
+    if found:
+        return user_id is not None, user_id
+
+    try:
+        result = await redis_manager.lookup_subscription_token(token)
+    except Exception as e:
+        logger.error(f"Error verifying subscription token: {e}")
+        return False, None
+
+    if result is None:
+        subscription_token_cache.set(
+            token, None, config.auth.token_negative_ttl or DEFAULT_TOKEN_NEGATIVE_TTL
+        )
+        return False, None
+
+    user_id, pttl = result
+    ttl = config.auth.token_cache_ttl or DEFAULT_TOKEN_CACHE_TTL
+    if pttl >= 0:
+        ttl = min(ttl, pttl / 1000)
+    subscription_token_cache.set(token, user_id, ttl)
+    return True, user_id
+
+
 async def verify_token(token: str) -> Tuple[bool, Optional[int]]:
-    """Проверить JWT токен"""
+    """Проверить токен: JWT или токен подписки из бота"""
+    # У JWT три части через точку, у токенов бота точек нет
+    if token.count(".") != 2:
+        return await verify_subscription_token(token)
     try:
         payload = jwt_manager.decode_token(token)
-        if payload and "user_id" in payload:
-            return True, payload["user_id"]
-        return False, None
+        if not payload or "user_id" not in payload:
+            return False, None
+        # Токен обновления годится только для /api/v1/auth/refresh
+        if payload.get("type") == REFRESH_TOKEN_TYPE:
+            return False, None
+        # Проверка отзыва — в памяти процесса, Redis только при срабатывании фильтра
+        if revocation_list.is_user_revoked(payload["user_id"], payload.get("iat", 0)):
+            logger.warning(f"Token of revoked user {payload['user_id']} rejected")
+            return False, None
+        sid = payload.get("sid")
+        if sid and await revocation_list.is_revoked(sid):
+            logger.warning(f"Token of revoked session {sid} rejected")
+            return False, None
+        return True, payload["user_id"]
     except Exception as e:
         logger.error(f"Error verifying token: {e}")
         return False, None
@@ -1,8 +1,9 @@
 from collections.abc import AsyncGenerator
 import logging
-from datetime import datetime, UTC
+from datetime import datetime, timedelta, UTC
 from typing import Optional, Dict, Any, List
-from sqlalchemy import select
+from sqlalchemy import select, exists, delete, update, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from litestar.exceptions import ClientException
@@ -14,6 +15,7 @@ from src.models.models import (
     Subscription,
     PromoCode,
     PromoAttempt,
+    PromoAttemptBucket,
     SubscriptionType,
     Purchase,
 )
@@ -21,6 +23,10 @@ from src.models.models import (
 
 logger = logging.getLogger(__name__)
 
+# Размер бакета счётчиков попыток применения промокода (1 минута): окно в
+# `hours` часов скользит с точностью до минуты
+PROMO_BUCKET_SECONDS = 60
+
 
 def is_alembic_context() -> bool:
     """Определить, запущен ли код в контексте Alembic"""
@@ -105,7 +111,7 @@ async def get_promo_attempts_by_user_id(
     user_id: int, hours: int, session: AsyncSession
 ) -> List[PromoAttempt]:
     """Получить попытки использования промокода за последние часы"""
-    cutoff_time = datetime.now(UTC).replace(hour=datetime.now(UTC).hour - hours)
+    cutoff_time = datetime.now(UTC) - timedelta(hours=hours)
     query = select(PromoAttempt).where(
         PromoAttempt.user_id == user_id, PromoAttempt.attempt_time > cutoff_time
     )
@@ -113,13 +119,80 @@ async def get_promo_attempts_by_user_id(
     return list(result.scalars().all())
 
 
+def promo_attempt_bucket(moment: Optional[datetime] = None) -> int:
+    """Номер поминутного бакета для момента времени"""
+    moment = moment or datetime.now(UTC)
+    return int(moment.timestamp()) // PROMO_BUCKET_SECONDS
+
+
+async def increment_promo_attempt_bucket(user_id: int, session: AsyncSession) -> None:
+    """Увеличить счётчик попыток пользователя в текущем бакете (upsert)"""
+    query = (
+        sqlite_insert(PromoAttemptBucket)
+        .values(user_id=user_id, bucket=promo_attempt_bucket(), count=1)
+        .on_conflict_do_update(
+            index_elements=["user_id", "bucket"],
+            set_={"count": PromoAttemptBucket.count + 1},
+        )
+    )
+    await session.execute(query)
+
+
+async def count_promo_attempts(user_id: int, hours: int, session: AsyncSession) -> int:
+    """Количество попыток за последние `hours` часов по поминутным бакетам
+
+    Бакет, в который попадает начало окна, учитывается целиком: окно может
+    захватить лишнюю минуту, но не пропустить попытки. Читается не более
+    `hours * 60 + 1` строк по первичному ключу (user_id, bucket), независимо
+    от числа самих попыток.
+    """
+    first_bucket = promo_attempt_bucket(datetime.now(UTC) - timedelta(hours=hours))
+    query = select(func.coalesce(func.sum(PromoAttemptBucket.count), 0)).where(
+        PromoAttemptBucket.user_id == user_id,
+        PromoAttemptBucket.bucket >= first_bucket,
+    )
+    return int(await session.scalar(query))
+
+
+async def purge_promo_attempt_buckets(keep_hours: int, session: AsyncSession) -> int:
+    """Удалить бакеты старше `keep_hours` часов
+
+    Returns:
+        int: Количество удалённых бакетов
+    """
+    cutoff_bucket = promo_attempt_bucket(datetime.now(UTC) - timedelta(hours=keep_hours))
+    result = await session.execute(
+        delete(PromoAttemptBucket).where(PromoAttemptBucket.bucket < cutoff_bucket)
+    )
+    return result.rowcount
+
+
 async def has_user_used_promo(user_id: int, code: str, session: AsyncSession) -> bool:
-    """Проверить, применял ли пользователь этот промокод"""
-    query = select(PromoAttempt).where(
-        PromoAttempt.user_id == user_id, PromoAttempt.code == code
+    """Проверить, применял ли пользователь этот промокод
+
+    EXISTS по индексу ix_promo_attempts_user_id_code, строки не загружаются.
+    """
+    query = select(
+        exists().where(PromoAttempt.user_id == user_id, PromoAttempt.code == code)
+    )
+    return bool(await session.scalar(query))
+
+
+async def claim_promo_code(user_id: int, code: str, session: AsyncSession) -> bool:
+    """Атомарно проверить и зафиксировать использование промокода
+
+    Один INSERT ... ON CONFLICT DO NOTHING по уникальному индексу (user_id, code).
+    Returns:
+        bool: True, если промокод применяется пользователем впервые
+    """
+    query = (
+        sqlite_insert(PromoAttempt)
+        .values(user_id=user_id, code=code, attempt_time=datetime.now(UTC))
+        .on_conflict_do_nothing(index_elements=["user_id", "code"])
     )
     result = await session.execute(query)
-    return result.scalar_one_or_none() is not None
+    await increment_promo_attempt_bucket(user_id, session)
+    return result.rowcount == 1
 
 
 async def add_promo_attempt(user_id: int, code: str, session: AsyncSession) -> bool:
@@ -128,12 +201,39 @@ async def add_promo_attempt(user_id: int, code: str, session: AsyncSession) -> b
         attempt = PromoAttempt(user_id=user_id, code=code)
         session.add(attempt)
         await session.flush()
+        await increment_promo_attempt_bucket(user_id, session)
         return True
     except Exception as e:
         logger.error(f"Error adding promo attempt for user {user_id}, code {code}: {e}")
         return False
 
 
+async def deactivate_expired_subscriptions(
+    batch_size: int, now: datetime, session: AsyncSession
+) -> List[int]:
+    """Деактивировать пачку истёкших подписок одним UPDATE
+
+    Подзапрос идёт по индексу ix_subscriptions_active_end_date.
+    Returns:
+        List[int]: user_id деактивированных подписок (не более batch_size)
+    """
+    expired = (
+        select(Subscription.user_id)
+        .where(Subscription.active == True, Subscription.end_date <= now)  # noqa: E712
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    query = (
+        update(Subscription)
+        .where(Subscription.user_id.in_(expired))
+        .values(active=False)
+        .returning(Subscription.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(query)
+    return list(result.scalars().all())
+
+
 class DatabaseManager:
     """Менеджер для работы с базой данных через SQLAlchemy"""
 
@@ -263,8 +363,7 @@ class DatabaseManager:
     ) -> int:
         """Получить количество попыток использования промокода за последние часы"""
         try:
-            attempts = await get_promo_attempts_by_user_id(user_id, hours, session)
-            return len(attempts)
+            return await count_promo_attempts(user_id, hours, session)
         except Exception as e:
             logger.error(f"Error getting promo attempts count for user {user_id}: {e}")
             return 0
@@ -321,6 +420,11 @@ class DatabaseManager:
     ) -> bool:
         return await add_promo_attempt(user_id, code, session)
 
+    async def claim_promo_code(
+        self, user_id: int, code: str, session: AsyncSession
+    ) -> bool:
+        return await claim_promo_code(user_id, code, session)
+
     async def add_purchase(
         self, user_id: int, subscription_type: str, price: int, session: AsyncSession
     ) -> bool:
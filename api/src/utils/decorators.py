@@ -11,7 +11,8 @@ logger = logging.getLogger(__name__)
 def require_auth(func: Callable) -> Callable:
     """
     Декоратор для проверки аутентификации пользователя.
-    Проверяет наличие и валидность JWT токена в заголовке Authorization.
+    Проверяет наличие и валидность JWT токена или токена подписки из бота
+    в заголовке Authorization.
     В случае успеха добавляет user_id в kwargs.
     """
 
@@ -0,0 +1,125 @@
+import base64
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from src.configs.config import config
+
+# ECDSA P-256: подпись проверяется в расширении через WebCrypto
+ENTITLEMENT_ALGORITHM = "ES256"
+# Сколько снимок действует без обращения к серверу
+DEFAULT_TTL_MINUTES = 360
+# Без активной подписки снимок обновляется чаще, чтобы покупка появилась быстро
+DEFAULT_INACTIVE_TTL_MINUTES = 15
+
+
+def _b64url(value: int) -> str:
+    return base64.urlsafe_b64encode(value.to_bytes(32, "big")).rstrip(b"=").decode()
+
+
+class EntitlementSigner:
+    """Подписанные снимки права доступа для офлайн-проверки в расширении
+
+    Снимок — компактный JWS (ES256) с user_id, типом и окончанием подписки,
+    временем выпуска и сроком обновления (exp). Расширение хранит его и
+    проверяет подпись открытым ключом, зафиксированным при сборке (JWKS из
+    /api/v1/entitlement/keys); до exp запросы к серверу не нужны. При смене
+    ключа нужна новая сборка расширения. Для активной подписки exp не позже ее
+    окончания. Без ключа в config.entitlement.private_key (PEM) выдача
+    отключена.
+    """
+
+    def __init__(
+        self,
+        private_key_pem: str = None,
+        key_id: str = None,
+        ttl_minutes: int = None,
+        inactive_ttl_minutes: int = None,
+    ):
+        self.key_id = key_id or config.entitlement.key_id or "default"
+        self.ttl = 60 * (ttl_minutes or config.entitlement.ttl_minutes or DEFAULT_TTL_MINUTES)
+        self.inactive_ttl = 60 * (
+            inactive_ttl_minutes
+            or config.entitlement.inactive_ttl_minutes
+            or DEFAULT_INACTIVE_TTL_MINUTES
+        )
+        self._private_key = None
+        pem = private_key_pem or config.entitlement.private_key
+        if pem:
+            # В переменной окружения переводы строк PEM обычно записаны как \n
+            pem = pem.replace("\\n", "\n")
+            self._private_key = serialization.load_pem_private_key(pem.encode(), password=None)
+
+    @property
+    def available(self) -> bool:
+        return self._private_key is not None
+
+    def issue(
+        self, user_id: int, subscription: Optional[Dict[str, Any]], now: float = None
+    ) -> Dict[str, Any]:
+        """Подписать снимок по данным db_manager.get_subscription"""
+        if not self.available:
+            raise RuntimeError("Entitlement signing key is not configured")
+        now = int(now or time.time())
+        end = None
+        if subscription and subscription.get("end_date"):
+            end = int(datetime.fromisoformat(subscription["end_date"]).timestamp())
+        active = bool(subscription and subscription.get("active") and end and end > now)
+        refresh_at = now + (self.ttl if active else self.inactive_ttl)
+        if active:
+            refresh_at = min(refresh_at, end)
+        claims = {
+            "uid": user_id,
+            "plan": subscription.get("subtype") if subscription else None,
+            "end": end,
+            "act": active,
+            "iat": now,
+            "exp": refresh_at,
+        }
+        snapshot = jwt.encode(
+            claims,
+            self._private_key,
+            algorithm=ENTITLEMENT_ALGORITHM,
+            headers={"kid": self.key_id},
+        )
+        return {"snapshot": snapshot, "refresh_at": refresh_at}
+
+    def public_jwks(self) -> Dict[str, Any]:
+        """Открытый ключ в формате JWKS"""
+        if not self.available:
+            return {"keys": []}
+        numbers = self._private_key.public_key().public_numbers()
+        return {
+            "keys": [
+                {
+                    "kty": "EC",
+                    "crv": "P-256",
+                    "x": _b64url(numbers.x),
+                    "y": _b64url(numbers.y),
+                    "kid": self.key_id,
+                    "alg": ENTITLEMENT_ALGORITHM,
+                    "use": "sig",
+                }
+            ]
+        }
+
+
+def generate_private_key_pem() -> str:
+    """Новый ключ P-256 в PEM для ENTITLEMENT_PRIVATE_KEY"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+# Создаем глобальный экземпляр подписи снимков
+entitlement_signer = EntitlementSigner()
+
+
+if __name__ == "__main__":
+    # Генерация ключа: python -m src.utils.entitlement
+    print(generate_private_key_pem())
@@ -6,10 +6,16 @@ from src.configs.config import config
 import hmac
 import hashlib
 import time
+import uuid
 
 
 logger = logging.getLogger(__name__)
 
+# Короткоживущий токен доступа и долгоживущий токен обновления (expiry_days)
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+DEFAULT_ACCESS_TTL_MINUTES = 15
+
 
 class JWTManager:
     """Менеджер для работы с JWT токенами"""
@@ -20,15 +26,23 @@ class JWTManager:
         self.secret = secret or config.jwt.secret
         self.algorithm = algorithm or config.jwt.algorithm
         self.expiry_days = expiry_days or config.jwt.expiry_days
-
-    def encode_token(self, payload: Dict[str, Any], expiry_days: int = None) -> str:
+        self.access_ttl = timedelta(
+            minutes=config.jwt.access_ttl_minutes or DEFAULT_ACCESS_TTL_MINUTES
+        )
+
+    def encode_token(
+        self,
+        payload: Dict[str, Any],
+        expiry_days: int = None,
+        expires_in: timedelta = None,
+    ) -> str:
         """Закодировать JWT токен"""
         try:
             # Добавляем время истечения
-            expiry = expiry_days or self.expiry_days
+            lifetime = expires_in or timedelta(days=expiry_days or self.expiry_days)
             payload_with_exp = {
                 **payload,
-                "exp": datetime.now(UTC) + timedelta(days=expiry),
+                "exp": datetime.now(UTC) + lifetime,
                 "iat": datetime.now(UTC),
             }
 
@@ -70,6 +84,34 @@ class JWTManager:
 
         return self.encode_token(payload)
 
+    def create_token_pair(
+        self, user_id: int, session_id: str = None
+    ) -> Dict[str, Any]:
+        """Создать токен доступа и токен обновления одной сессии
+
+        Токен доступа живет access_ttl и проверяется без обращения к базе;
+        токен обновления живет expiry_days и меняется на новую пару через
+        /api/v1/auth/refresh. Отзыв сессии (sid) отключает оба.
+        """
+        sid = session_id or uuid.uuid4().hex
+        access = self.encode_token(
+            {"user_id": user_id, "type": ACCESS_TOKEN_TYPE, "sid": sid},
+            expires_in=self.access_ttl,
+        )
+        refresh = self.encode_token(
+            {
+                "user_id": user_id,
+                "type": REFRESH_TOKEN_TYPE,
+                "sid": sid,
+                "jti": uuid.uuid4().hex,
+            }
+        )
+        return {
+            "token": access,
+            "refresh_token": refresh,
+            "expires_in": int(self.access_ttl.total_seconds()),
+        }
+
     def get_user_id_from_token(self, token: str) -> Optional[int]:
         """Получить user_id из токена"""
         payload = self.decode_token(token)
@@ -2,10 +2,14 @@ from datetime import datetime, timedelta
 import logging
 from typing import Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
-from .database import db_manager
+from .database import db_manager, purge_promo_attempt_buckets
+from src.configs.config import config
 
 logger = logging.getLogger(__name__)
 
+# Сколько часов хранить счётчики попыток, если не задано в конфиге
+DEFAULT_ATTEMPTS_RETENTION_HOURS = 24 * 7
+
 
 async def apply_promo(
     user_id: int, promo_code: str, session: AsyncSession
@@ -25,8 +29,8 @@ async def apply_promo(
                 logger.warning(f"Promo code {promo_code} expired for user {user_id}")
                 return None
 
-        # Проверяем, использовал ли пользователь этот промокод ранее
-        if await db_manager.has_user_used_promo(user_id, promo_code, session):
+        # Проверяем и сразу фиксируем использование промокода одним INSERT ... ON CONFLICT
+        if not await db_manager.claim_promo_code(user_id, promo_code, session):
             logger.warning(f"User {user_id} already used promo code {promo_code}")
             return None
 
@@ -34,6 +38,7 @@ async def apply_promo(
         subscription = await db_manager.get_subscription(user_id, session)
         if not subscription:
             logger.warning(f"No subscription found for user {user_id}")
+            await session.rollback()
             return None
 
         # Вычисляем новую дату окончания подписки
@@ -53,10 +58,9 @@ async def apply_promo(
         )
         if not success:
             logger.error(f"Failed to update subscription for user {user_id}")
+            await session.rollback()
             return None
 
-        # Фиксируем использование промокода
-        await db_manager.add_promo_attempt(user_id, promo_code, session)
         await session.commit()
 
         logger.info(f"Promo code {promo_code} applied successfully for user {user_id}")
@@ -102,3 +106,14 @@ async def get_promo_info(code: str, session: AsyncSession) -> Optional[Dict[str,
     except Exception as e:
         logger.error(f"Error getting promo code info for {code}: {e}")
         return None
+
+
+async def cleanup_promo_attempt_buckets(session: AsyncSession) -> int:
+    """Удалить устаревшие счётчики попыток применения промокодов"""
+    keep_hours = (
+        config.promo.attempts_retention_hours or DEFAULT_ATTEMPTS_RETENTION_HOURS
+    )
+    async with session.begin():
+        deleted = await purge_promo_attempt_buckets(keep_hours, session)
+    logger.info(f"Purged {deleted} promo attempt buckets older than {keep_hours}h")
+    return deleted
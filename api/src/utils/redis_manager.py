@@ -1,11 +1,19 @@
 import redis.asyncio as redis
+import json
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from src.configs.config import config
 
 
 logger = logging.getLogger(__name__)
 
+# Канал, в который публикуются user_id с изменившимся состоянием подписки
+SUBSCRIPTION_INVALIDATION_CHANNEL = "subscription:invalidate"
+# Идемпотентность запросов: маркер "в обработке" и срок хранения готового ответа
+IDEMPOTENCY_PENDING = "pending"
+IDEMPOTENCY_PENDING_TTL = 60
+IDEMPOTENCY_RESULT_TTL = 7 * 86400
+
 
 class RedisManager:
     """Менеджер для работы с Redis"""
@@ -19,10 +27,8 @@ class RedisManager:
     def _init_client(self):
         """Инициализация клиента Redis"""
         try:
-            self.client = redis.Redis(
-                host="localhost",
-                port=6379,
-                db=0,
+            self.client = redis.from_url(
+                self.redis_url or "redis://localhost:6379/0",
                 decode_responses=config.redis.decode_responses,
             )
             self._connected = True
@@ -88,6 +94,20 @@ class RedisManager:
             logger.error(f"Error getting user by token: {e}")
             return None
 
+    async def lookup_subscription_token(self, token: str) -> Optional[Tuple[int, int]]:
+        """Найти выданный ботом токен подписки: (user_id, оставшийся TTL в мс) или None
+
+        GET и PTTL идут одним pipeline без предварительного ping — один round trip.
+        Ошибки Redis пробрасываются, чтобы недоступность не путалась с неверным токеном.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(f"token:{token}")
+        pipe.pttl(f"token:{token}")
+        user_id, pttl = await pipe.execute()
+        if not user_id or pttl == -2:
+            return None
+        return int(user_id), pttl
+
     async def set_token_user(self, token: str, user_id: int, ttl: int = None) -> bool:
         """Установить связь токен-пользователь"""
         try:
@@ -210,6 +230,66 @@ class RedisManager:
             logger.error(f"Error deleting user data for {user_id}: {e}")
             return False
 
+    async def publish_subscription_invalidation(self, user_ids: List[int]) -> bool:
+        """Опубликовать инвалидацию кэшированного состояния подписок пользователей"""
+        try:
+            if not user_ids:
+                return True
+            if not await self._ensure_connection():
+                logger.warning("Redis not available, skipping invalidation publish")
+                return False
+
+            await self.client.publish(
+                SUBSCRIPTION_INVALIDATION_CHANNEL, json.dumps(user_ids)
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error publishing subscription invalidation: {e}")
+            return False
+
+    async def begin_idempotent(self, key: str) -> Optional[str]:
+        """Захватить ключ идемпотентности
+
+        Returns:
+            None, если ключ захвачен (запрос нужно выполнить) или Redis недоступен;
+            IDEMPOTENCY_PENDING, если такой же запрос выполняется;
+            иначе сохраненный JSON ответа
+        """
+        try:
+            if not await self._ensure_connection():
+                logger.warning("Redis not available, processing request without idempotency check")
+                return None
+
+            redis_key = f"idempotency:{key}"
+            if await self.client.set(
+                redis_key, IDEMPOTENCY_PENDING, nx=True, ex=IDEMPOTENCY_PENDING_TTL
+            ):
+                return None
+            return await self.client.get(redis_key) or IDEMPOTENCY_PENDING
+        except Exception as e:
+            logger.error(f"Error checking idempotency key {key}: {e}")
+            return None
+
+    async def complete_idempotent(self, key: str, response: Dict[str, Any]) -> bool:
+        """Сохранить ответ для повторов с тем же ключом"""
+        try:
+            await self.client.set(
+                f"idempotency:{key}", json.dumps(response), ex=IDEMPOTENCY_RESULT_TTL
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error storing idempotency result {key}: {e}")
+            return False
+
+    async def release_idempotent(self, key: str) -> bool:
+        """Освободить ключ после неуспешной обработки, чтобы запрос можно было повторить"""
+        try:
+            await self.client.delete(f"idempotency:{key}")
+            return True
+        except Exception as e:
+            logger.error(f"Error releasing idempotency key {key}: {e}")
+            return False
+
     async def get_ttl(self, key: str) -> int:
         """Получить TTL ключа"""
         try:
@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, Iterable, List, Optional
+from litestar import Litestar
+from src.configs.config import config
+from .redis_manager import redis_manager
+
+
+logger = logging.getLogger(__name__)
+
+# Sorted set отозванных сессий: sid -> unix-время, после которого их токены истекают сами
+REVOKED_SESSIONS_KEY = "auth:revoked"
+# Канал, в который публикуются только что отозванные sid
+REVOCATION_CHANNEL = "auth:revoked"
+# Hash user_id -> unix-время: токены пользователя, выданные раньше, не принимаются
+REVOKED_USERS_KEY = "auth:revoked_users"
+# Использованные токены обновления (jti); ключ живет до истечения токена
+USED_REFRESH_PREFIX = "auth:refresh_used:"
+DEFAULT_CAPACITY = 100_000
+DEFAULT_ERROR_RATE = 0.001
+# Сколько хранить отзыв пользователя, если expiry_days не задан: дольше токены не живут
+DEFAULT_USER_REVOCATION_DAYS = 30
+
+
+class BloomFilter:
+    """Фильтр Блума для строк: ложноположительные ответы возможны, ложноотрицательные — нет"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Двойное хеширование: k позиций из двух 64-битных половин одного blake2b
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """Отозванные сессии (sid) с проверкой в памяти процесса
+
+    Источник истины — sorted set REVOKED_SESSIONS_KEY в Redis; каждый
+    процесс держит построенный по нему фильтр Блума, пополняет его по
+    сообщениям REVOCATION_CHANNEL и периодически перестраивает, убирая
+    записи, чьи токены уже истекли. Отсутствие sid в фильтре означает, что
+    сессия не отозвана, — это ответ без обращения к сети; редкие
+    положительные ответы подтверждаются в Redis.
+
+    Отзыв всех сессий пользователя — момент в REVOKED_USERS_KEY: токены с
+    более ранним iat отклоняются. iat в JWT — целые секунды, поэтому и
+    момент отзыва округляется вниз до секунды: токен нового входа, выданный в
+    ту же секунду, что и отзыв, принимается. Эти записи немногочисленны и
+    целиком хранятся в памяти, синхронизируясь тем же каналом и sync.
+    """
+
+    def __init__(self, capacity: int = None, error_rate: float = None):
+        self.capacity = capacity or config.jwt.revocation_capacity or DEFAULT_CAPACITY
+        self.error_rate = error_rate or config.jwt.revocation_error_rate or DEFAULT_ERROR_RATE
+        self.filter = BloomFilter(self.capacity, self.error_rate)
+        self.users: Dict[int, int] = {}
+        self.user_ttl = 86400 * (config.jwt.expiry_days or DEFAULT_USER_REVOCATION_DAYS)
+        self._pending: Optional[List[str]] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def _add(self, sid: str) -> None:
+        self.filter.add(sid)
+        # Во время sync новые sid попадают и в строящийся фильтр
+        if self._pending is not None:
+            self._pending.append(sid)
+
+    def might_be_revoked(self, sid: str) -> bool:
+        return sid in self.filter
+
+    def is_user_revoked(self, user_id: int, issued_at: float) -> bool:
+        """Выдан ли токен пользователя до отзыва всех его сессий"""
+        return issued_at < self.users.get(user_id, 0)
+
+    def _add_user(self, user_id: int, revoked_before: float) -> None:
+        self.users[user_id] = max(self.users.get(user_id, 0), int(revoked_before))
+
+    async def is_revoked(self, sid: str) -> bool:
+        """Отозвана ли сессия; при недоступности Redis подозрительный sid считается отозванным"""
+        if not self.might_be_revoked(sid):
+            return False
+        try:
+            return await redis_manager.client.zscore(REVOKED_SESSIONS_KEY, sid) is not None
+        except Exception as e:
+            logger.error(f"Error confirming session revocation: {e}")
+            return True
+
+    async def revoke(self, sid: str, expires_at: float) -> None:
+        """Отозвать сессию до expires_at (времени истечения ее refresh-токена)"""
+        self._add(sid)
+        pipe = redis_manager.client.pipeline(transaction=False)
+        pipe.zadd(REVOKED_SESSIONS_KEY, {sid: expires_at})
+        pipe.publish(REVOCATION_CHANNEL, json.dumps([sid]))
+        await pipe.execute()
+        logger.info(f"Session {sid} revoked")
+
+    async def revoke_user(self, user_id: int, revoked_before: float = None) -> None:
+        """Отозвать все сессии пользователя, выданные до revoked_before (по умолчанию — сейчас)"""
+        revoked_before = int(revoked_before or time.time())
+        self._add_user(user_id, revoked_before)
+        pipe = redis_manager.client.pipeline(transaction=False)
+        pipe.hset(REVOKED_USERS_KEY, str(user_id), revoked_before)
+        pipe.publish(REVOCATION_CHANNEL, json.dumps({"users": {str(user_id): revoked_before}}))
+        await pipe.execute()
+        logger.info(f"All sessions of user {user_id} revoked")
+
+    async def consume_refresh_token(self, jti: str, expires_at: float) -> bool:
+        """Отметить токен обновления использованным; False — он уже был использован"""
+        return bool(await redis_manager.client.set(
+            f"{USED_REFRESH_PREFIX}{jti}", 1, nx=True, exat=max(int(expires_at), int(time.time()) + 1)
+        ))
+
+    async def sync(self) -> int:
+        """Перестроить фильтр по Redis, удалив истекшие отзывы; возвращает число записей"""
+        self._pending = []
+        try:
+            pipe = redis_manager.client.pipeline(transaction=False)
+            pipe.zremrangebyscore(REVOKED_SESSIONS_KEY, "-inf", time.time())
+            pipe.zrange(REVOKED_SESSIONS_KEY, 0, -1)
+            pipe.hgetall(REVOKED_USERS_KEY)
+            _, sids, users = await pipe.execute()
+            rebuilt = BloomFilter(max(self.capacity, len(sids) * 2), self.error_rate)
+            for sid in [*sids, *self._pending]:
+                rebuilt.add(sid)
+            self.filter = rebuilt
+        finally:
+            self._pending = None
+        await self._sync_users(users)
+        if len(sids) > self.capacity:
+            logger.warning(f"Revocation list holds {len(sids)} sessions, over capacity {self.capacity}")
+        return len(sids)
+
+    async def _sync_users(self, users: Dict[str, str]) -> None:
+        # Отзывы старше срока жизни токенов больше ничего не отклоняют
+        cutoff = time.time() - self.user_ttl
+        stale = [user_id for user_id, revoked_before in users.items() if float(revoked_before) < cutoff]
+        if stale:
+            await redis_manager.client.hdel(REVOKED_USERS_KEY, *stale)
+        self.users = {user_id: ts for user_id, ts in self.users.items() if ts >= cutoff}
+        for user_id, revoked_before in users.items():
+            if float(revoked_before) >= cutoff:
+                self._add_user(int(user_id), float(revoked_before))
+
+    def _handle_message(self, data) -> None:
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning(f"Malformed revocation message: {data!r}")
+            return
+        # Список — отозванные sid, объект — отзыв всех сессий пользователей
+        if isinstance(message, dict):
+            for user_id, revoked_before in message.get("users", {}).items():
+                self._add_user(int(user_id), float(revoked_before))
+            return
+        for sid in message:
+            self._add(sid)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with redis_manager.client.pubsub() as pubsub:
+                    await pubsub.subscribe(REVOCATION_CHANNEL)
+                    # Отзывы, опубликованные до подписки, подтягиваем из sorted set
+                    await self.sync()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._handle_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Revocation listener failed: {e}, reconnecting")
+                await asyncio.sleep(5)
+
+    @asynccontextmanager
+    async def lifespan(self, app: Litestar) -> AsyncGenerator[None, None]:
+        self._listener = asyncio.create_task(self._listen(), name="revocation_listener")
+        try:
+            yield
+        finally:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+# Создаем глобальный список отозванных сессий
+revocation_list = RevocationList()
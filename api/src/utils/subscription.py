@@ -1,11 +1,17 @@
 from datetime import datetime, timedelta
 import logging
+import time
 from typing import Optional, Dict, Any, List
 from sqlalchemy.ext.asyncio import AsyncSession
-from .database import db_manager
+from .database import db_manager, deactivate_expired_subscriptions
+from .redis_manager import redis_manager
+from src.configs.config import config
 
 logger = logging.getLogger(__name__)
 
+# Размер пачки для фонового деактиватора, если не задан в конфиге
+DEFAULT_SWEEPER_BATCH_SIZE = 500
+
 
 async def save_purchase(
     user_id: int, subscription_type: str, price: int, session: AsyncSession
@@ -53,6 +59,7 @@ async def activate_subscription(
         )
         if success:
             await session.commit()
+            await redis_manager.publish_subscription_invalidation([user_id])
             logger.info(
                 f"Subscription {subscription_type} activated for user {user_id}"
             )
@@ -129,8 +136,46 @@ async def renew_subscription(
         )
         if success:
             await session.commit()
+            await redis_manager.publish_subscription_invalidation([user_id])
             logger.info(f"Subscription renewed for user {user_id} until {new_end_date}")
         return success
     except Exception as e:
         logger.error(f"Error renewing subscription for user {user_id}: {e}")
         return False
+
+
+async def sweep_expired_subscriptions(
+    session: AsyncSession, batch_size: int = None, max_batches: int = 100
+) -> int:
+    """Деактивировать подписки с истёкшим end_date
+
+    Работает пачками по batch_size строк, каждая пачка — один UPDATE в отдельной
+    транзакции, чтобы не держать блокировку записи SQLite. По каждой пачке
+    публикуется инвалидация кэша для затронутых пользователей.
+
+    Returns:
+        int: Количество деактивированных подписок за прогон
+    """
+    batch_size = batch_size or config.sweeper.batch_size or DEFAULT_SWEEPER_BATCH_SIZE
+    now = datetime.now()
+    started = time.perf_counter()
+    swept = 0
+    batches = 0
+
+    while batches < max_batches:
+        async with session.begin():
+            user_ids = await deactivate_expired_subscriptions(batch_size, now, session)
+        if not user_ids:
+            break
+        batches += 1
+        swept += len(user_ids)
+        await redis_manager.publish_subscription_invalidation(user_ids)
+        if len(user_ids) < batch_size:
+            break
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"Subscription sweeper deactivated {swept} subscriptions "
+        f"in {batches} batches ({elapsed_ms:.1f} ms)"
+    )
+    return swept
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Awaitable, Callable, List, Optional
+from litestar import Litestar
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Фоновая задача, выполняемая с фиксированным интервалом"""
+
+    def __init__(
+        self, name: str, interval: float, func: Callable[[], Awaitable[None]]
+    ):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        # Первый запуск через интервал: к этому моменту on_startup-хуки
+        # (в т.ч. create_all плагина SQLAlchemy) уже отработали
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.func()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Periodic task {self.name} failed: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=self.name)
+            logger.info(f"Periodic task {self.name} started (every {self.interval}s)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info(f"Periodic task {self.name} stopped")
+
+
+class PeriodicTaskManager:
+    """Менеджер фоновых задач, привязанный к lifespan приложения"""
+
+    def __init__(self):
+        self.tasks: List[PeriodicTask] = []
+
+    def register(
+        self, name: str, interval: float, func: Callable[[], Awaitable[None]]
+    ) -> PeriodicTask:
+        """Зарегистрировать задачу; запускается при старте приложения"""
+        task = PeriodicTask(name, interval, func)
+        self.tasks.append(task)
+        return task
+
+    @asynccontextmanager
+    async def lifespan(self, app: Litestar) -> AsyncGenerator[None, None]:
+        for task in self.tasks:
+            task.start()
+        try:
+            yield
+        finally:
+            for task in self.tasks:
+                await task.stop()
+
+
+# Создаем глобальный экземпляр менеджера фоновых задач
+periodic_tasks = PeriodicTaskManager()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк восстановления на момент времени: полный бэкап плюс сегменты WAL
+
+Синтетическая база подписок заполняется, снимается полный бэкап, затем
+идут транзакции покупок (upsert подписки) с проходом архиватора каждые
+--commits-per-segment коммитов. Замеряется время восстановления на середину
+и на конец журнала, а также объем архива.
+
+Запуск:
+    cd bot && python benchmarks/bench_pitr_restore.py [--users 200000] [--commits 20000] [--commits-per-segment 500]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.utils.backup import BackupManager
+from src.utils.db import SQLitePool
+from src.utils.wal_archive import WalArchiver, list_segments, restore_to_time
+
+UPSERT_SQL = """
+    INSERT INTO subscriptions (user_id, end_date, active, trial_used, auto_renewal, lang, subtype)
+    VALUES (?, '2030-01-01 00:00:00', 1, 1, 1, 'ru', 'month')
+    ON CONFLICT(user_id) DO UPDATE SET end_date=excluded.end_date, active=excluded.active
+"""
+
+
+def populate(db_path: str, users: int) -> None:
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE subscriptions (user_id INTEGER PRIMARY KEY, end_date TEXT, active INTEGER, "
+        "trial_used INTEGER, auto_renewal INTEGER, lang TEXT, subtype TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO subscriptions VALUES (?, '2030-01-01 00:00:00', 1, 1, 1, 'ru', 'trial')",
+        ((uid,) for uid in range(users)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+async def write_history(pool: SQLitePool, archiver: WalArchiver, users: int, commits: int, per_segment: int):
+    moments = []
+    for i in range(commits):
+        async with pool.write() as db:
+            await db.execute(UPSERT_SQL, (random.randrange(users * 2),))
+        if (i + 1) % per_segment == 0:
+            segment = await archiver.archive()
+            moments.append(datetime.fromtimestamp(segment.archived_at))
+    await archiver.stop()
+    return moments
+
+
+def timed_restore(label: str, target, output: str, archive_dir: str, manager: BackupManager) -> None:
+    start = time.perf_counter()
+    _, applied = restore_to_time(target, output, archive_dir, manager)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(output) / 1024 / 1024
+    print(f"{label:<28} {applied:>5} segments  {elapsed:8.3f}s  ({size:.1f} MB database)")
+
+
+def main(users: int, commits: int, per_segment: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        backup_dir = os.path.join(tmp, "backups")
+        archive_dir = os.path.join(backup_dir, "wal")
+        output = os.path.join(tmp, "restored.db")
+        populate(db_path, users)
+
+        manager = BackupManager(database_path=db_path, backup_dir=backup_dir)
+        manager.create_backup()
+        print(f"Full backup: {manager.last_report.summary()}")
+
+        async def run():
+            pool = SQLitePool(db_path)
+            try:
+                archiver = WalArchiver(pool, archive_dir)
+                return await write_history(pool, archiver, users, commits, per_segment)
+            finally:
+                await pool.close()
+
+        start = time.perf_counter()
+        moments = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        print(
+            f"Archived {commits} commits in {len(list_segments(archive_dir))} segments "
+            f"({dir_size(archive_dir) / 1024 / 1024:.1f} MB) in {elapsed:.2f}s\n"
+        )
+
+        timed_restore("restore to middle", moments[len(moments) // 2], output, archive_dir, manager)
+        timed_restore("restore to latest", None, output, archive_dir, manager)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--commits", type=int, default=20_000)
+    parser.add_argument("--commits-per-segment", type=int, default=500)
+    args = parser.parse_args()
+    main(args.users, args.commits, args.commits_per_segment)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк доступа к SQLite из бота: новое соединение на каждый запрос против SQLitePool
+
+Нагрузка имитирует команды бота: на каждую команду чтение подписки
+(как в get_user_subscription), каждая десятая команда — upsert подписки
+(как в save_subscription_to_sqlite). Команды выполняются конкурентно.
+
+Запуск:
+    cd bot && python benchmarks/bench_sqlite_pool.py [--users 10000] [--commands 5000] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import aiosqlite
+
+from src.utils.db import SQLitePool
+
+SELECT_SQL = (
+    "SELECT end_date, active, trial_used, auto_renewal, lang, subtype "
+    "FROM subscriptions WHERE user_id = ?"
+)
+UPSERT_SQL = """
+    INSERT INTO subscriptions (user_id, end_date, active, trial_used, auto_renewal, lang, subtype)
+    VALUES (?, '2030-01-01 00:00:00', 1, 1, 1, 'ru', 'month')
+    ON CONFLICT(user_id) DO UPDATE SET end_date=excluded.end_date, active=excluded.active
+"""
+
+
+def populate(db_path: str, users: int) -> None:
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE subscriptions (user_id INTEGER PRIMARY KEY, end_date TEXT, active INTEGER, "
+        "trial_used INTEGER, auto_renewal INTEGER, lang TEXT, subtype TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO subscriptions VALUES (?, '2030-01-01 00:00:00', 1, 1, 1, 'ru', 'trial')",
+        ((uid,) for uid in range(users)),
+    )
+    conn.commit()
+    conn.close()
+
+
+async def legacy_command(db_path: str, user_id: int, write: bool) -> None:
+    """Прежний вариант: aiosqlite.connect на каждое обращение"""
+    async with aiosqlite.connect(db_path) as db:
+        async with db.execute(SELECT_SQL, (user_id,)) as cursor:
+            await cursor.fetchone()
+    if write:
+        async with aiosqlite.connect(db_path) as db:
+            await db.execute(UPSERT_SQL, (user_id,))
+            await db.commit()
+
+
+async def pooled_command(pool: SQLitePool, user_id: int, write: bool) -> None:
+    async with pool.read() as db:
+        async with db.execute(SELECT_SQL, (user_id,)) as cursor:
+            await cursor.fetchone()
+    if write:
+        async with pool.write() as db:
+            await db.execute(UPSERT_SQL, (user_id,))
+
+
+async def run(label: str, command, commands, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(user_id, write):
+        async with semaphore:
+            await command(user_id, write)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(user_id, write) for user_id, write in commands))
+    elapsed = time.perf_counter() - start
+    rate = len(commands) / elapsed
+    print(f"{label:<35} {len(commands):>6} commands  {elapsed:8.3f}s  {rate:10.0f} cmd/s")
+    return rate
+
+
+async def main(users: int, count: int, concurrency: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        populate(db_path, users)
+        commands = [(random.randrange(users), i % 10 == 0) for i in range(count)]
+
+        legacy = await run(
+            "connect per call (legacy)",
+            lambda user_id, write: legacy_command(db_path, user_id, write),
+            commands, concurrency,
+        )
+        pool = SQLitePool(db_path)
+        try:
+            pooled = await run(
+                f"SQLitePool ({pool.readers} readers + writer)",
+                lambda user_id, write: pooled_command(pool, user_id, write),
+                commands, concurrency,
+            )
+        finally:
+            await pool.close()
+
+        print(f"\nSpeedup: x{pooled / legacy:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--commands", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.commands, args.concurrency))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк переводов: чтение JSON с диска на каждую строку против TranslationCatalog
+
+Сравнивает:
+- get_translation: отдельный вызов (ключ без полей и с полями)
+- обработчик: рендер страницы /active_subscriptions (21+ переводов на ответ)
+  с данными из заглушек, чтобы мерить только переводы и форматирование
+
+Запуск:
+    cd bot && python benchmarks/bench_translations.py [--calls 20000] [--renders 500]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.join(os.path.dirname(__file__), ".."))
+
+from src.handlers import handlers
+from src.utils.i18n import translations
+
+
+def legacy_load_translations(lang: str) -> dict:
+    """Прежняя реализация: чтение файла локали на каждый вызов"""
+    with open(f"src/locales/{lang}.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def legacy_get_translation(update, key: str, **kwargs) -> str:
+    lang = update.effective_user.language_code or "en"
+    value = legacy_load_translations("ru" if lang.startswith("ru") else "en")
+    for k in key.split("."):
+        value = value.get(k)
+        if value is None:
+            return key
+    return value.format(**kwargs)
+
+
+def make_update(lang: str = "ru"):
+    update = MagicMock()
+    update.effective_user.language_code = lang
+    return update
+
+
+def timed(label: str, fn, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / count * 1e6
+    print(f"{label:<45} {count:>6} calls  {elapsed:8.3f}s  {per_call:10.1f} us/call")
+    return per_call
+
+
+async def timed_async(label: str, fn, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        await fn()
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / count * 1e6
+    print(f"{label:<45} {count:>6} calls  {elapsed:8.3f}s  {per_call:10.1f} us/call")
+    return per_call
+
+
+async def main(calls: int, renders: int) -> None:
+    translations.load()
+    update = make_update()
+    item = dict(user_id=42, type="month", days_left=12, token="abc")
+
+    legacy_static = timed("legacy: static key", lambda: legacy_get_translation(update, "subscription_expiring"), calls)
+    catalog_static = timed("catalog: static key", lambda: handlers.get_translation(update, "subscription_expiring"), calls)
+    legacy_fmt = timed(
+        "legacy: formatted key",
+        lambda: legacy_get_translation(update, "active_subscriptions.item", **item), calls,
+    )
+    catalog_fmt = timed(
+        "catalog: formatted key",
+        lambda: handlers.get_translation(update, "active_subscriptions.item", **item), calls,
+    )
+
+    page = [
+        {"user_id": i, "token": f"token-{i}", "subscription_type": "month", "days_left": i % 30}
+        for i in range(handlers.ACTIVE_SUBSCRIPTIONS_PAGE_SIZE)
+    ]
+
+    async def fake_page(offset=0, limit=20):
+        return page, 500
+
+    async def fake_counts():
+        return {"month": 400, "trial": 100}
+
+    def render():
+        return handlers._render_active_subscriptions_page(update, 1)
+
+    with patch.object(handlers, "get_active_subscriptions", fake_page), \
+            patch.object(handlers, "get_active_plan_counts", fake_counts):
+        with patch.object(handlers, "get_translation", legacy_get_translation):
+            legacy_handler = await timed_async("legacy: /active_subscriptions page", render, renders)
+        catalog_handler = await timed_async("catalog: /active_subscriptions page", render, renders)
+
+    print(
+        f"\nSpeedup: static x{legacy_static / catalog_static:.0f}, "
+        f"formatted x{legacy_fmt / catalog_fmt:.0f}, handler x{legacy_handler / catalog_handler:.0f}"
+    )
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=20_000)
+    parser.add_argument("--renders", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.renders))
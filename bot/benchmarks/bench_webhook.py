@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк приема обновлений: вебхук (ASGI) против long polling
+
+Локальная заглушка Telegram отправляет записанные обновления (JSON-файл со
+списком update или синтетические /status) в ASGI-приложение вебхука —
+по HTTP через uvicorn, если он установлен, иначе прямым вызовом ASGI.
+Для polling моделируется цикл getUpdates: ответ приходит через --rtt
+секунд и содержит до 100 накопившихся обновлений. В обоих случаях
+замеряется время от отправки обновления до его появления в update_queue.
+
+Запуск:
+    cd bot && python benchmarks/bench_webhook.py [--updates 5000] [--concurrency 50] [--rtt 0.05] [--recorded updates.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from telegram import Update
+from telegram.ext import Application
+
+from src.webhook import DEFAULT_PATH, create_webhook_app, uvicorn
+
+SECRET = "bench-secret"
+POLL_LIMIT = 100
+
+
+def synthetic_updates(count: int):
+    return [
+        {
+            "update_id": i,
+            "message": {
+                "message_id": i,
+                "date": 1700000000,
+                "chat": {"id": 1000 + i % 500, "type": "private"},
+                "from": {"id": 1000 + i % 500, "is_bot": False, "first_name": "User"},
+                "text": "/status",
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def report(label: str, latencies, elapsed: float) -> None:
+    ordered = sorted(latencies)
+    print(
+        f"{label:<28} {len(ordered):>6} updates  {elapsed:7.3f}s  {len(ordered) / elapsed:9.0f} upd/s  "
+        f"p50={statistics.median(ordered) * 1000:7.2f}ms  p99={ordered[int(len(ordered) * 0.99) - 1] * 1000:7.2f}ms"
+    )
+
+
+async def drain(application: Application, sent_at: dict, count: int, latencies: list) -> None:
+    for _ in range(count):
+        update = await application.update_queue.get()
+        latencies.append(time.perf_counter() - sent_at[update.update_id])
+
+
+async def bench_webhook(updates, concurrency: int) -> None:
+    application = Application.builder().token("123456:BENCH").updater(None).build()
+    app = create_webhook_app(application, SECRET)
+    bodies = [json.dumps(update).encode() for update in updates]
+    sent_at, latencies = {}, []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    if uvicorn is not None:
+        import aiohttp
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="error"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        session = aiohttp.ClientSession(headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+        label = "webhook (uvicorn, HTTP)"
+
+        async def post(update, body):
+            async with semaphore:
+                sent_at[update["update_id"]] = time.perf_counter()
+                async with session.post(f"http://127.0.0.1:{port}{DEFAULT_PATH}", data=body) as response:
+                    assert response.status == 200
+    else:
+        label = "webhook (in-process ASGI)"
+
+        async def post(update, body):
+            async with semaphore:
+                sent_at[update["update_id"]] = time.perf_counter()
+                messages = [{"type": "http.request", "body": body, "more_body": False}]
+                scope = {
+                    "type": "http", "method": "POST", "path": DEFAULT_PATH,
+                    "headers": [(b"x-telegram-bot-api-secret-token", SECRET.encode())],
+                }
+
+                async def receive():
+                    return messages.pop()
+
+                async def send(message):
+                    pass
+
+                await app(scope, receive, send)
+
+    start = time.perf_counter()
+    consumer = asyncio.create_task(drain(application, sent_at, len(updates), latencies))
+    await asyncio.gather(*(post(update, body) for update, body in zip(updates, bodies)))
+    await consumer
+    elapsed = time.perf_counter() - start
+
+    if uvicorn is not None:
+        await session.close()
+        server.should_exit = True
+        await serving
+    report(label, latencies, elapsed)
+
+
+async def bench_polling(updates, rtt: float) -> None:
+    """getUpdates: каждый запрос занимает rtt и забирает до POLL_LIMIT обновлений"""
+    application = Application.builder().token("123456:BENCH").updater(None).build()
+    pending = asyncio.Queue()
+    sent_at, latencies = {}, []
+
+    async def telegram():
+        for update in updates:
+            sent_at[update["update_id"]] = time.perf_counter()
+            pending.put_nowait(update)
+            await asyncio.sleep(0)
+
+    async def poller():
+        received = 0
+        while received < len(updates):
+            await asyncio.sleep(rtt)
+            batch = []
+            while not pending.empty() and len(batch) < POLL_LIMIT:
+                batch.append(pending.get_nowait())
+            for data in batch:
+                await application.update_queue.put(Update.de_json(data, application.bot))
+            received += len(batch)
+
+    start = time.perf_counter()
+    consumer = asyncio.create_task(drain(application, sent_at, len(updates), latencies))
+    await asyncio.gather(telegram(), poller())
+    await consumer
+    report(f"polling (rtt {rtt * 1000:.0f}ms)", latencies, time.perf_counter() - start)
+
+
+async def main(count: int, concurrency: int, rtt: float, recorded: str) -> None:
+    if recorded:
+        with open(recorded, "r", encoding="utf-8") as f:
+            updates = json.load(f)
+    else:
+        updates = synthetic_updates(count)
+    await bench_webhook(updates, concurrency)
+    await bench_polling(updates, rtt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--updates", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=0.05)
+    parser.add_argument("--recorded", help="JSON-файл со списком записанных обновлений")
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.concurrency, args.rtt, args.recorded))
@@ -5,12 +5,24 @@ from telegram.ext import Application, CommandHandler, PreCheckoutQueryHandler, M
 
 from src.configs.config import config
 from src.utils.backup import backup_manager
+from src.utils.subscription import plan_catalog, subscription_cache
+from src.utils.i18n import translations
+from src.utils.db import db_pool
+from src.utils.api_client import api_client
+from src.utils.outbox import payment_outbox
+from src.utils.wal_archive import wal_archiver
+from src.utils.broadcast import broadcaster
+from src.webhook import run_webhook
+from src.utils.update_processor import OrderedUpdateProcessor, DEFAULT_CONCURRENCY
 from src.handlers.handlers import (
     start, subscribe, apply_promo, pre_checkout_query, successful_payment,
     check_subscriptions, status, help_command, unsubscribe, subscriptions,
     subscriptions_callback, create_promo_cmd, delete_promo_cmd,
     create_subscription_cmd, delete_subscription_cmd, get_trial,
-    create_backup, scheduled_backup, send_backup
+    create_backup, scheduled_backup, send_backup,
+    active_subscriptions_cmd, active_subscriptions_callback, metrics_cmd,
+    drain_payment_outbox, broadcast_cmd, broadcast_status_cmd, broadcast_cancel_cmd,
+    revoke_sessions_cmd,
 )
 
 # Настройка логирования
@@ -33,8 +45,45 @@ bot = Bot(token=config.telegram.bot_token)
 # Передаем экземпляр бота в BackupManager
 backup_manager.set_bot(bot)
 
+async def post_init(application: Application):
+    translations.load()
+    await api_client.start()
+    await payment_outbox.ensure_schema()
+    # В разработке переводы перечитываются при изменении файлов локалей
+    if config.locales.watch:
+        translations.start_watcher(config.locales.watch_interval or 1.0)
+    # Каталог тарифов загружаем заранее и держим в памяти до сообщения об изменении
+    plan_catalog.start_listener()
+    await plan_catalog.load()
+    # Кэш состояния подписок сбрасывается сообщениями API об изменениях
+    subscription_cache.start_listener()
+    # Непрерывная отправка WAL для восстановления на момент времени
+    if config.wal_archive.enabled:
+        wal_archiver.start()
+    # Рассылка, прерванная перезапуском, продолжается с сохраненного места
+    await broadcaster.resume(application.bot)
+
+async def post_shutdown(application: Application):
+    await broadcaster.stop()
+    await translations.stop_watcher()
+    await api_client.close()
+    # Последние коммиты отправляются в архив до закрытия пула (закрытие сбрасывает WAL)
+    if config.wal_archive.enabled:
+        await wal_archiver.stop()
+    await db_pool.close()
+    await plan_catalog.stop_listener()
+    await subscription_cache.stop_listener()
+
 async def main():
-    application = Application.builder().token(config.telegram.bot_token).build()
+    application = (
+        Application.builder()
+        .token(config.telegram.bot_token)
+        # Разные пользователи обрабатываются параллельно, обновления одного — по порядку
+        .concurrent_updates(OrderedUpdateProcessor(config.telegram.concurrent_updates or DEFAULT_CONCURRENCY))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Автоматическое восстановление базы данных из последнего бэкапа, если основной файл отсутствует
     if not await backup_manager.auto_restore_if_needed():
@@ -61,13 +110,26 @@ async def main():
     application.add_handler(CallbackQueryHandler(subscriptions_callback, pattern="^subscribe_"))
     application.add_handler(CommandHandler("backup", create_backup))
     application.add_handler(CommandHandler("send_backup", send_backup))
+    application.add_handler(CommandHandler("active_subscriptions", active_subscriptions_cmd))
+    application.add_handler(CallbackQueryHandler(active_subscriptions_callback, pattern="^active_subs_"))
+    application.add_handler(CommandHandler("metrics", metrics_cmd))
+    application.add_handler(CommandHandler("broadcast", broadcast_cmd))
+    application.add_handler(CommandHandler("broadcast_status", broadcast_status_cmd))
+    application.add_handler(CommandHandler("broadcast_cancel", broadcast_cancel_cmd))
+    application.add_handler(CommandHandler("revoke_sessions", revoke_sessions_cmd))
 
     # Периодические задачи
     application.job_queue.run_repeating(check_subscriptions, interval=86400)  # Раз в сутки
     application.job_queue.run_repeating(scheduled_backup, interval=86400)    # Автоматический бэкап раз в сутки
+    application.job_queue.run_repeating(drain_payment_outbox, interval=config.outbox.interval or 30)  # Недоставленные платежи
 
-    logger.info("Starting bot polling")
-    await application.run_polling()
+    # В режиме вебхука обновления приходят через ASGI-эндпоинт, иначе — long polling
+    if config.webhook.enabled:
+        logger.info("Starting bot webhook")
+        await run_webhook(application)
+    else:
+        logger.info("Starting bot polling")
+        await application.run_polling()
 
 if __name__ == "__main__":
     import asyncio
@@ -6,12 +6,15 @@ class TelegramConfig(Struct):
     bot_token: str | None = None
     payment_provider_token: str | None = None
     admin_ids: List[int] = 0,
+    concurrent_updates: int | None = None
 
 class DatabaseConfig(Struct):
     path: str | None = None
     default_lang: str | None = None
     default_trial_used: bool = False
     default_auto_renewal: bool = True
+    pool_size: int | None = None
+    busy_timeout: int | None = None
 
 class RedisConfig(Struct):
     host: str | None = None
@@ -27,12 +30,52 @@ class RateLimitConfig(Struct):
 class SubscriptionConfig(Struct):
     trial_days: int | None = None
     price: int | None = None
+    cache_ttl: float | None = None
 
 class LoggingConfig(Struct):
     level: str | None = None
     format: str | None = "%(asctime)s %(levelname)s %(name)s %(message)s"
     file: str | None = None
 
+class LocalesConfig(Struct):
+    watch: bool | None = None
+    watch_interval: float | None = None
+
+class ApiConfig(Struct):
+    url: str | None = None
+    timeout: float | None = None
+    connect_timeout: float | None = None
+    max_retries: int | None = None
+    pool_size: int | None = None
+
+class OutboxConfig(Struct):
+    interval: int | None = None
+    batch_size: int | None = None
+    concurrency: int | None = None
+    max_attempts: int | None = None
+
+class WebhookConfig(Struct):
+    enabled: bool | None = None
+    url: str | None = None
+    path: str | None = None
+    secret_token: str | None = None
+    host: str | None = None
+    port: int | None = None
+
+class BackupConfig(Struct):
+    dir: str | None = None
+    full_interval_days: int | None = None
+    keep_daily: int | None = None
+    keep_weekly: int | None = None
+    keep_monthly: int | None = None
+    max_total_mb: int | None = None
+
+class WalArchiveConfig(Struct):
+    enabled: bool | None = None
+    dir: str | None = None
+    interval: float | None = None
+    checkpoint_pages: int | None = None
+
 class BotConfig(BaseConfig):
     telegram: TelegramConfig = field(default_factory=TelegramConfig)
     database: DatabaseConfig = field(default_factory=DatabaseConfig)
@@ -40,6 +83,12 @@ class BotConfig(BaseConfig):
     rate_limit: RateLimitConfig = field(default_factory=RateLimitConfig)
     subscription: SubscriptionConfig = field(default_factory=SubscriptionConfig)
     logging: LoggingConfig = field(default_factory=LoggingConfig)
+    locales: LocalesConfig = field(default_factory=LocalesConfig)
+    api: ApiConfig = field(default_factory=ApiConfig)
+    outbox: OutboxConfig = field(default_factory=OutboxConfig)
+    wal_archive: WalArchiveConfig = field(default_factory=WalArchiveConfig)
+    backup: BackupConfig = field(default_factory=BackupConfig)
+    webhook: WebhookConfig = field(default_factory=WebhookConfig)
 
 # Загружаем конфиг из YAML/ENV/CLI
 config = BotConfig.load()
@@ -1,17 +1,24 @@
-import json
+import asyncio
 import logging
-import aiohttp
 import os
-from telegram import Update, LabeledPrice, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, PreCheckoutQueryHandler, MessageHandler, filters, ContextTypes
+from telegram import Update, LabeledPrice, InlineKeyboardButton, InlineKeyboardMarkup, MessageEntity
+from telegram.ext import Application, CommandHandler, PreCheckoutQueryHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from src.utils.subscription import (
     activate_trial, create_promo, get_promo_discount, get_users_with_expiring_tokens,
     can_use_promo, set_promo_cooldown, create_subscription_type, get_subscription_types, get_subscription_price,
     get_active_subscriptions, delete_subscription_type, get_user_subscription, disable_auto_renewal,
+    get_active_plan_counts, expire_subscriptions_registry, revoke_api_sessions,
 )
 from src.configs.config import config
-from src.utils.backup import backup_manager
-import aiosqlite
+from src.utils.backup import backup_manager, is_delta_backup
+from src.utils.sender import RateLimitedSender
+from src.utils.i18n import translations
+from src.utils.db import db_pool
+from src.utils.metrics import metrics
+from src.utils.outbox import payment_outbox
+from src.utils.wal_archive import wal_archiver
+from src.utils.broadcast import AUDIENCES, broadcaster
+import time
 from datetime import datetime, timedelta
 import redis.asyncio as redis
 
@@ -25,34 +32,15 @@ redis_client = redis.Redis(
         decode_responses=config.redis.decode_responses
     )
 
+# За сколько дней до окончания подписки напоминать о продлении
+EXPIRY_NOTICE_DAYS = 3
+# Размер страницы списка активных подписок для админов
+ACTIVE_SUBSCRIPTIONS_PAGE_SIZE = 20
 
-def load_translations(lang: str) -> dict:
-    try:
-        with open(f"src/locales/{lang}.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        logger.warning(f"Failed to load translations for {lang}, falling back to English")
-        return load_translations("en")
 
 def get_translation(update: Update, key: str, **kwargs) -> str:
-    lang = update.effective_user.language_code or "en"
-    translations = load_translations("ru" if lang.startswith("ru") else "en")
-    keys = key.split(".")
-    value = translations
-    for k in keys:
-        if not isinstance(value, dict):
-            logger.warning(f"Invalid translation key path: {key}")
-            return key
-        value = value.get(k)
-        if value is None:
-            logger.warning(f"Translation key not found: {key}")
-            return key
-
-    if isinstance(value, str):
-        return value.format(**kwargs)
-
-    logger.warning(f"Translation key '{key}' does not point to a string.")
-    return key
+    lang = translations.resolve_lang(update.effective_user.language_code)
+    return translations.translate(lang, key, **kwargs)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -181,51 +169,95 @@ async def pre_checkout_query(update: Update, context: ContextTypes.DEFAULT_TYPE)
     logger.info(f"Pre-checkout query for user {update.pre_checkout_query.from_user.id}")
     await update.pre_checkout_query.answer(ok=True)
 
+async def _payment_success_text(lang: str, user_id: int, is_renewal: bool, data: dict | None) -> str:
+    token = (data or {}).get("token") or await redis_client.get(f"user:{user_id}:token") or "—"
+    message_key = "buy.renew_success" if is_renewal else "payment_success"
+    return translations.translate(lang, message_key, token=token)
+
 async def successful_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    payload = update.message.successful_payment.invoice_payload
+    payment = update.message.successful_payment
+    payload = payment.invoice_payload
     sub_type = payload.split("_")[2]
     is_renewal = payload.endswith("_renew")
-    price = update.message.successful_payment.total_amount
+    price = payment.total_amount
+    lang = translations.resolve_lang(update.effective_user.language_code)
     logger.info(f"Successful payment by user {user_id} for {sub_type} (renewal: {is_renewal}, price: {price})")
 
     try:
-        # Активируем подписку через API
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{config.api.url}/api/v1/subscription/activate",
-                json={
-                    "subscription_type": sub_type,
-                    "price": price,
-                    "is_renewal": is_renewal
-                },
-                headers={"Authorization": f"Bearer {context.bot_data.get('api_token')}"}
-            ) as response:
-                if not response.ok:
-                    error_text = await response.text()
-                    logger.error(f"Failed to activate subscription: {error_text}")
-                    await update.message.reply_text(
-                        get_translation(update, "payment.error"),
-                        parse_mode="Markdown"
-                    )
-                    return
-
-                data = await response.json()
-                logger.info(f"Subscription activated: {data}")
-
-                # Отправляем сообщение пользователю
-                message_key = "buy.renew_success" if is_renewal else "payment_success"
-                await update.message.reply_text(
-                    get_translation(update, message_key),
-                    parse_mode="Markdown"
-                )
-
+        # Сначала фиксируем платеж: если API недоступен, активацию доставит drain_payment_outbox
+        entry = await payment_outbox.record(
+            idempotency_key=payment.telegram_payment_charge_id,
+            user_id=user_id,
+            chat_id=update.effective_chat.id,
+            subscription_type=sub_type,
+            price=price,
+            is_renewal=is_renewal,
+            lang=lang,
+        )
     except Exception as e:
-        logger.error(f"Error processing payment for user {user_id}: {e}")
+        logger.error(f"Failed to record payment for user {user_id}: {e}")
         await update.message.reply_text(
             get_translation(update, "payment.error"),
             parse_mode="Markdown"
         )
+        return
+
+    try:
+        if not await payment_outbox.deliver(entry, context.bot_data.get('api_token')):
+            await update.message.reply_text(get_translation(update, "payment.pending"))
+            return
+        await payment_outbox.mark_notified([entry.id])
+        logger.info(f"Subscription {sub_type} activated for user {user_id}")
+        await update.message.reply_text(
+            await _payment_success_text(lang, user_id, is_renewal, None),
+            parse_mode="Markdown"
+        )
+    except Exception as e:
+        logger.error(f"Error processing payment for user {user_id}: {e}")
+        await update.message.reply_text(get_translation(update, "payment.pending"))
+
+async def drain_payment_outbox(context: ContextTypes.DEFAULT_TYPE):
+    """Доставка в API платежей, которые не удалось активировать сразу"""
+    try:
+        report = await payment_outbox.drain(context.bot_data.get('api_token'))
+    except Exception as e:
+        logger.error(f"Error draining payment outbox: {e}")
+        return
+    sender = RateLimitedSender(context.bot)
+    confirmed = report.delivered + report.unnotified
+    if confirmed:
+        messages = [
+            (entry.chat_id, await _payment_success_text(entry.lang or "en", entry.user_id, entry.is_renewal, None))
+            for entry in confirmed
+        ]
+        sent = await sender.send_many(messages, parse_mode="Markdown")
+        # После временной ошибки сообщим в следующий проход; заблокировавшим бота
+        # (Forbidden) и несуществующим чатам (BadRequest) повторять бесполезно
+        retry = set(sent.failed_chat_ids) - set(sent.undeliverable_chat_ids)
+        await payment_outbox.mark_notified([entry.id for entry in confirmed if entry.chat_id not in retry])
+    if report.failed:
+        await _notify_failed_payments(sender, report.failed)
+    if confirmed or report.failed or report.retried:
+        logger.info(
+            f"Payment outbox: {len(report.delivered)} delivered, {len(report.unnotified)} late notices, "
+            f"{len(report.failed)} failed, {report.retried} retry later, "
+            f"backlog {report.backlog}, {report.rate:.1f} payments/s"
+        )
+
+async def _notify_failed_payments(sender: RateLimitedSender, entries: list):
+    """Сообщить пользователям об окончательно не активированных платежах и предупредить админов"""
+    await sender.send_many(
+        [(entry.chat_id, translations.translate(entry.lang or "en", "payment.failed")) for entry in entries]
+    )
+    lines = [
+        f"{entry.idempotency_key}: user {entry.user_id}, {entry.subscription_type}, {entry.price} — {entry.last_error}"
+        for entry in entries
+    ]
+    alert = ("⚠️ Оплаченные подписки не активированы / Paid subscriptions were not activated:\n" + "\n".join(lines))[:4000]
+    await sender.send_many([(admin_id, alert) for admin_id in config.telegram.admin_ids])
+    # Админы узнали в любом случае, поэтому повторно не сообщаем
+    await payment_outbox.mark_notified([entry.id for entry in entries])
 
 async def apply_promo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -251,7 +283,7 @@ async def apply_promo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # --- Защита от подбора промокода (SQLite) ---
         import datetime
         now = datetime.datetime.now()
-        async with aiosqlite.connect(config.database.path) as db:
+        async with db_pool.write() as db:
             await db.execute(
                 "CREATE TABLE IF NOT EXISTS promo_attempts (user_id INTEGER, attempt_time DATETIME)"
             )
@@ -259,67 +291,114 @@ async def apply_promo(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "DELETE FROM promo_attempts WHERE attempt_time < ?",
                 ((now - datetime.timedelta(minutes=config.rate_limit.block_minutes)).strftime('%Y-%m-%d %H:%M:%S'),)
             )
-            await db.commit()
             async with db.execute(
                 "SELECT COUNT(*) FROM promo_attempts WHERE user_id = ?",
                 (user_id,)
             ) as cursor:
                 row = await cursor.fetchone()
                 attempts = row[0] if row else 0
-            if attempts >= config.rate_limit.max_attempts:
-                await update.message.reply_text(
-                    f"Слишком много попыток. Попробуйте через {config.rate_limit.block_minutes} минут. / Too many attempts. Try again in {config.rate_limit.block_minutes} minutes."
+            if attempts < config.rate_limit.max_attempts:
+                await db.execute(
+                    "INSERT INTO promo_attempts (user_id, attempt_time) VALUES (?, ?)",
+                    (user_id, now.strftime('%Y-%m-%d %H:%M:%S'))
                 )
-                return
-            await db.execute(
-                "INSERT INTO promo_attempts (user_id, attempt_time) VALUES (?, ?)",
-                (user_id, now.strftime('%Y-%m-%d %H:%M:%S'))
+        if attempts >= config.rate_limit.max_attempts:
+            await update.message.reply_text(
+                f"Слишком много попыток. Попробуйте через {config.rate_limit.block_minutes} минут. / Too many attempts. Try again in {config.rate_limit.block_minutes} minutes."
             )
-            await db.commit()
+            return
     # --- Дальнейшая логика применения промокода (как была) ---
     if not promo_code:
         await update.message.reply_text("Укажите промокод: /promo <код>")
         return
     try:
-        async with aiosqlite.connect(config.database.path) as db:
+        # Проверка и отметка промокода под одной блокировкой записи; ответ — уже после нее
+        async with db_pool.write() as db:
             async with db.execute("SELECT discount, expiration_date, used FROM promo_codes WHERE code = ?", (promo_code,)) as cursor:
                 promo = await cursor.fetchone()
-            if not promo:
-                logger.warning(f"Promo code {promo_code} not found for user {user_id}")
-                await update.message.reply_text("Промокод не найден")
-                return
-            discount, expiration_date_str, used = promo
-            from datetime import datetime
-            expiration_date = datetime.strptime(expiration_date_str, "%Y-%m-%d %H:%M:%S")
-            if used:
-                await update.message.reply_text("Этот промокод уже был использован")
-                return
-            if expiration_date < datetime.now():
-                await update.message.reply_text("Срок действия промокода истёк")
-                return
-            await db.execute("UPDATE promo_codes SET used = 1 WHERE code = ?", (promo_code,))
-            await db.commit()
-            await update.message.reply_text(f"Промокод применён! Скидка {discount}%")
-            logger.info(f"User {user_id} successfully applied promo code {promo_code} with discount {discount}%")
+            if promo:
+                discount, expiration_date_str, used = promo
+                from datetime import datetime
+                expiration_date = datetime.strptime(expiration_date_str, "%Y-%m-%d %H:%M:%S")
+                if not used and expiration_date >= datetime.now():
+                    await db.execute("UPDATE promo_codes SET used = 1 WHERE code = ?", (promo_code,))
+        if not promo:
+            logger.warning(f"Promo code {promo_code} not found for user {user_id}")
+            await update.message.reply_text("Промокод не найден")
+            return
+        if used:
+            await update.message.reply_text("Этот промокод уже был использован")
+            return
+        if expiration_date < datetime.now():
+            await update.message.reply_text("Срок действия промокода истёк")
+            return
+        await update.message.reply_text(f"Промокод применён! Скидка {discount}%")
+        logger.info(f"User {user_id} successfully applied promo code {promo_code} with discount {discount}%")
     except Exception as e:
         logger.error(f"Error applying promo code {promo_code} for user {user_id}: {e}")
         await update.message.reply_text("Произошла ошибка при применении промокода. Попробуйте позже.")
 
 async def check_subscriptions(context: ContextTypes.DEFAULT_TYPE):
+    """Напоминание об окончании подписки в ближайшие EXPIRY_NOTICE_DAYS дней
+
+    Выбирает только диапазон [now, now + EXPIRY_NOTICE_DAYS] по индексу
+    ix_subscriptions_active_end_date, пропускает уже уведомленных о текущем
+    end_date и рассылает через RateLimitedSender.
+    """
     logger.info("Checking subscriptions for expiration")
+    started = time.monotonic()
+    now = datetime.now()
+    try:
+        expired = await expire_subscriptions_registry()
+        if expired:
+            logger.info(f"Removed {expired} expired subscriptions from registry")
+    except Exception as e:
+        logger.error(f"Failed to expire subscriptions registry: {e}")
     try:
-        async with aiosqlite.connect(config.database.path) as db:
-            async with db.execute("SELECT user_id, end_date FROM subscriptions WHERE active = ?", (True,)) as cursor:
+        async with db_pool.read() as db:
+            async with db.execute(
+                "SELECT user_id, end_date FROM subscriptions "
+                "WHERE active = 1 AND end_date >= ? AND end_date <= ?",
+                (
+                    now.strftime("%Y-%m-%d %H:%M:%S"),
+                    (now + timedelta(days=EXPIRY_NOTICE_DAYS)).strftime("%Y-%m-%d %H:%M:%S"),
+                ),
+            ) as cursor:
                 subs = await cursor.fetchall()
 
-            for user_id, end_date in subs:
-                end = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
-                if end < datetime.now() + timedelta(days=3):
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text="Ваша подписка скоро истекает! Оформите продление с помощью /subscribe",
-                    )
-                    logger.info(f"Sent expiration notification to user {user_id}")
+        if not subs:
+            logger.info("No subscriptions expiring soon")
+            return
+
+        # Отмечаем уведомление по (user_id, end_date) атомарно: SET NX вернет None для уже уведомленных
+        pipe = redis_client.pipeline()
+        for user_id, end_date in subs:
+            pipe.set(
+                f"expiry_notice:{user_id}:{end_date}", 1,
+                nx=True, ex=(EXPIRY_NOTICE_DAYS + 1) * 86400,
+            )
+        marks = await pipe.execute()
+        pending = [(user_id, end_date) for (user_id, end_date), marked in zip(subs, marks) if marked]
+
+        sender = RateLimitedSender(context.bot)
+        report = await sender.send_many(
+            (user_id, "Ваша подписка скоро истекает! Оформите продление с помощью /subscribe")
+            for user_id, _ in pending
+        )
+
+        # После временной ошибки снимаем отметку, чтобы повторить при следующем запуске;
+        # заблокировавшим бота (Forbidden) и несуществующим чатам (BadRequest) не повторяем
+        retry = set(report.failed_chat_ids) - set(report.undeliverable_chat_ids)
+        if retry:
+            await redis_client.delete(*(
+                f"expiry_notice:{user_id}:{end_date}" for user_id, end_date in pending if user_id in retry
+            ))
+
+        logger.info(
+            f"Expiry reminders: {len(subs)} expiring, {len(subs) - len(pending)} already notified, "
+            f"{report.sent} sent, {report.failed} failed in {time.monotonic() - started:.2f}s "
+            f"({report.throughput:.1f} msg/s)"
+        )
     except Exception as e:
         logger.error(f"Error checking subscriptions: {e}")
 
@@ -379,7 +458,7 @@ async def delete_subscription_cmd(update: Update, context: ContextTypes.DEFAULT_
         await update.message.reply_text(get_translation(update, "delete_subscription.invalid_format"))
 
 async def get_subscription_lists_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    subs = await get_subscription_types(context)
+    subs = await get_subscription_types()
     if not subs:
         await update.message.reply_text(get_translation(update, "list_subscriptions.active"))
         logger.info("No subscription types available")
@@ -396,17 +475,23 @@ async def get_subscription_lists_cmd(update: Update, context: ContextTypes.DEFAU
     await update.message.reply_text(message)
     logger.info(f"User {update.effective_user.id} viewed subscription types")
 
-async def active_subscriptions_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id not in config.telegram.admin_ids:
-        logger.warning(f"Unauthorized access to /active_subscriptions by user {update.effective_user.id}")
-        await update.message.reply_text(get_translation(update, "active_subscriptions.no_access"))
-        return
-    subs = await get_active_subscriptions()
-    if not subs:
-        await update.message.reply_text(get_translation(update, "active_subscriptions.empty"))
-        logger.info("No active subscriptions found")
-        return
+async def _render_active_subscriptions_page(update: Update, page: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Текст и клавиатура навигации для страницы активных подписок"""
+    subs, total = await get_active_subscriptions(
+        offset=page * ACTIVE_SUBSCRIPTIONS_PAGE_SIZE, limit=ACTIVE_SUBSCRIPTIONS_PAGE_SIZE
+    )
+    if not total:
+        return get_translation(update, "active_subscriptions.empty"), None
+
+    pages = (total + ACTIVE_SUBSCRIPTIONS_PAGE_SIZE - 1) // ACTIVE_SUBSCRIPTIONS_PAGE_SIZE
+    counts = await get_active_plan_counts()
     message = get_translation(update, "active_subscriptions.header") + "\n"
+    message += get_translation(
+        update,
+        "active_subscriptions.totals",
+        total=total,
+        counts=", ".join(f"{plan}: {count}" for plan, count in sorted(counts.items())),
+    ) + "\n\n"
     for sub in subs:
         message += get_translation(
             update,
@@ -416,9 +501,34 @@ async def active_subscriptions_cmd(update: Update, context: ContextTypes.DEFAULT
             days_left=sub["days_left"],
             token=sub["token"]
         ) + "\n"
-    await update.message.reply_text(message, parse_mode="Markdown")
+    message += "\n" + get_translation(update, "active_subscriptions.page", page=page + 1, pages=pages)
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"active_subs_{page - 1}"))
+    if page + 1 < pages:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"active_subs_{page + 1}"))
+    return message, InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def active_subscriptions_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in config.telegram.admin_ids:
+        logger.warning(f"Unauthorized access to /active_subscriptions by user {update.effective_user.id}")
+        await update.message.reply_text(get_translation(update, "active_subscriptions.no_access"))
+        return
+    message, reply_markup = await _render_active_subscriptions_page(update, 0)
+    await update.message.reply_text(message, parse_mode="Markdown", reply_markup=reply_markup)
     logger.info(f"Admin {update.effective_user.id} viewed active subscriptions")
 
+async def active_subscriptions_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if query.from_user.id not in config.telegram.admin_ids:
+        await query.answer(get_translation(update, "active_subscriptions.no_access"))
+        return
+    await query.answer()
+    page = int(query.data.replace("active_subs_", ""))
+    message, reply_markup = await _render_active_subscriptions_page(update, page)
+    await query.edit_message_text(message, parse_mode="Markdown", reply_markup=reply_markup)
+
 async def my_subscription_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     sub = await get_user_subscription(user_id)
@@ -438,12 +548,13 @@ async def my_subscription_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE
     logger.info(f"User {user_id} viewed their subscription")
 
 async def notify_expiring_subscriptions(context: ContextTypes.DEFAULT_TYPE):
+    await expire_subscriptions_registry()
     users = await get_users_with_expiring_tokens()
     for user in users:
         try:
             await context.bot.send_message(
                 chat_id=user["chat_id"],
-                text=get_translation({"effective_user": {"language_code": "ru"}}, "subscription_expiring")
+                text=translations.translate("ru", "subscription_expiring")
             )
             logger.info(f"Sent expiration notification to user {user['user_id']}")
         except Exception as e:
@@ -474,17 +585,35 @@ async def delete_promo_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        async with aiosqlite.connect(config.database.path) as db:
+        async with db_pool.write() as db:
             cursor = await db.execute("DELETE FROM promo_codes WHERE code = ?", (promo_code,))
-            await db.commit()
-            if cursor.rowcount > 0:
-                await update.message.reply_text(f"Промокод '{promo_code}' успешно удален.")
-            else:
-                await update.message.reply_text(f"Промокод '{promo_code}' не найден.")
+        if cursor.rowcount > 0:
+            await update.message.reply_text(f"Промокод '{promo_code}' успешно удален.")
+        else:
+            await update.message.reply_text(f"Промокод '{promo_code}' не найден.")
     except Exception as e:
         logger.error(f"Error deleting promo code {promo_code}: {e}")
         await update.message.reply_text("Произошла ошибка при удалении промокода.")
 
+async def distribute_backup(bot, backup_path: str, caption: str):
+    """Разослать бэкап админам: файл загружается один раз, остальным уходит file_id"""
+    sender = RateLimitedSender(bot)
+    report = await sender.send_file_to_many(config.telegram.admin_ids, backup_path, caption=caption)
+    backup_manager.record_deliveries(backup_path, report.deliveries, report.file_id)
+    metrics.incr("backup uploads", report.uploads)
+    if not is_delta_backup(backup_path):
+        # Закрепленный полный бэкап находится через get_chat и при вебхуке (восстановление без get_updates)
+        for chat_id, message_id in report.message_ids.items():
+            try:
+                await bot.pin_chat_message(chat_id=chat_id, message_id=message_id, disable_notification=True)
+            except Exception as e:
+                logger.warning(f"Failed to pin backup in chat {chat_id}: {e}")
+    logger.info(
+        f"Backup {os.path.basename(backup_path)} sent to {report.sent} admins "
+        f"({report.uploads} upload attempts, {report.failed} failed) in {report.duration:.2f}s"
+    )
+    return report
+
 async def create_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Создает бэкап базы данных и отправляет его админам"""
     user_id = update.effective_user.id
@@ -496,41 +625,37 @@ async def create_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         # Создаем бэкап
-        success, backup_path = backup_manager.create_backup(include_time=True)
+        success, backup_path = await backup_manager.create_backup_async(include_time=True)
 
         if not success:
             await update.message.reply_text("❌ Произошла ошибка при создании бэкапа / Error creating backup")
             return
 
         # Отправляем файл всем админам
-        success_count = 0
-        for admin_id in config.telegram.admin_ids:
-            try:
-                with open(backup_path, 'rb') as backup_file:
-                    backup_filename = os.path.basename(backup_path)
-                    await context.bot.send_document(
-                        chat_id=admin_id,
-                        document=backup_file,
-                        caption=f"📦 Бэкап базы данных\n"
-                                f"📅 Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                                f"📁 Файл: {backup_filename}\n\n"
-                                f"📦 Database backup\n"
-                                f"📅 Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                                f"📁 File: {backup_filename}"
-                    )
-                success_count += 1
-                logger.info(f"Backup sent to admin {admin_id}")
-            except Exception as e:
-                logger.error(f"Failed to send backup to admin {admin_id}: {e}")
+        backup_filename = os.path.basename(backup_path)
+        delivery = await distribute_backup(
+            context.bot,
+            backup_path,
+            caption=f"📦 Бэкап базы данных\n"
+                    f"📅 Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    f"📁 Файл: {backup_filename}\n\n"
+                    f"📦 Database backup\n"
+                    f"📅 Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    f"📁 File: {backup_filename}\n"
+                    f"🔒 SHA256: {backup_manager.last_report.sha256}",
+        )
+        success_count = delivery.sent
 
         # Отправляем подтверждение пользователю
         if success_count > 0:
-            backup_filename = os.path.basename(backup_path)
+            report = backup_manager.last_report
             await update.message.reply_text(
                 f"✅ Бэкап успешно создан и отправлен {success_count} администраторам\n"
                 f"📁 Файл: {backup_filename}\n\n"
                 f"✅ Backup successfully created and sent to {success_count} admins\n"
-                f"📁 File: {backup_filename}"
+                f"📁 File: {backup_filename}\n\n"
+                f"⏱ {report.duration:.2f}s, {report.raw_size} → {report.size} bytes ({report.ratio:.0%}), "
+                f"event loop blocked {report.loop_blocked_ms:.1f}ms"
             )
         else:
             await update.message.reply_text("❌ Ошибка при отправке бэкапа администраторам / Error sending backup to admins")
@@ -539,6 +664,79 @@ async def create_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error creating backup: {e}")
         await update.message.reply_text("❌ Произошла ошибка при создании бэкапа / Error creating backup")
 
+async def metrics_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает метрики процесса бота (задержки обращений к API)"""
+    if update.effective_user.id not in config.telegram.admin_ids:
+        await update.message.reply_text("Эта команда доступна только администраторам. / This command is for admins only.")
+        return
+    await update.message.reply_text(metrics.render() or "Метрик пока нет. / No metrics yet.")
+
+def _broadcast_args(message) -> tuple[str, str]:
+    """Аудитория и текст из /broadcast [all|active] <текст>
+
+    Текст берется из сообщения как есть (context.args теряют переносы строк и
+    повторные пробелы); команда отрезается по entity bot_command.
+    """
+    text = message.text or ""
+    command = next(
+        (e for e in message.entities or () if e.type == MessageEntity.BOT_COMMAND and e.offset == 0), None
+    )
+    rest = (text[command.length:] if command else text.partition(" ")[2]).lstrip()
+    words = rest.split(maxsplit=1)
+    if words and words[0] in AUDIENCES:
+        return words[0], rest[len(words[0]):].lstrip()
+    return "all", rest
+
+async def broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Рассылка всем пользователям: /broadcast [all|active] <текст>"""
+    if update.effective_user.id not in config.telegram.admin_ids:
+        await update.message.reply_text("Эта команда доступна только администраторам. / This command is for admins only.")
+        return
+    audience, text = _broadcast_args(update.message)
+    if not text.strip():
+        await update.message.reply_text("Использование: /broadcast [all|active] <текст> / Usage: /broadcast [all|active] <text>")
+        return
+    try:
+        state = await broadcaster.start(context.bot, text, audience, admin_chat_id=update.effective_chat.id)
+    except RuntimeError:
+        await update.message.reply_text(
+            "⏳ Уже идет другая рассылка, см. /broadcast_status / Another broadcast is in progress"
+        )
+        return
+    logger.info(f"Broadcast {state.id} to {audience} started by admin {update.effective_user.id}")
+
+async def broadcast_status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Прогресс последней рассылки"""
+    if update.effective_user.id not in config.telegram.admin_ids:
+        await update.message.reply_text("Эта команда доступна только администраторам. / This command is for admins only.")
+        return
+    state = await broadcaster.load()
+    await update.message.reply_text(state.render() if state else "Рассылок еще не было. / No broadcasts yet.")
+
+async def broadcast_cancel_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отменить текущую рассылку"""
+    if update.effective_user.id not in config.telegram.admin_ids:
+        await update.message.reply_text("Эта команда доступна только администраторам. / This command is for admins only.")
+        return
+    state = await broadcaster.cancel()
+    await update.message.reply_text(state.render() if state else "Нет активной рассылки. / No broadcast in progress.")
+
+async def revoke_sessions_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отозвать все сессии пользователя в расширении: /revoke_sessions <user_id>"""
+    if update.effective_user.id not in config.telegram.admin_ids:
+        await update.message.reply_text("Эта команда доступна только администраторам. / This command is for admins only.")
+        return
+    try:
+        user_id = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("Использование: /revoke_sessions <user_id> / Usage: /revoke_sessions <user_id>")
+        return
+    await revoke_api_sessions(user_id)
+    await update.message.reply_text(
+        f"✅ Сессии пользователя {user_id} отозваны / Sessions of user {user_id} revoked"
+    )
+    logger.info(f"Admin {update.effective_user.id} revoked API sessions of user {user_id}")
+
 async def send_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отправляет последний бэкап админу по запросу"""
     user_id = update.effective_user.id
@@ -559,19 +757,22 @@ async def send_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        # Отправляем файл запросившему админу
-        with open(latest_backup, 'rb') as backup_file:
-            backup_filename = os.path.basename(latest_backup)
-            await context.bot.send_document(
-                chat_id=user_id,
-                document=backup_file,
-                caption=f"📦 Последний бэкап базы данных\n"
-                        f"📅 Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                        f"📁 Файл: {backup_filename}\n\n"
-                        f"📦 Latest database backup\n"
-                        f"📅 Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                        f"📁 File: {backup_filename}"
-            )
+        # Отправляем файл запросившему админу; уже загруженный в Telegram файл не загружаем повторно
+        backup_filename = os.path.basename(latest_backup)
+        caption = (
+            f"📦 Последний бэкап базы данных\n"
+            f"📅 Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"📁 Файл: {backup_filename}\n\n"
+            f"📦 Latest database backup\n"
+            f"📅 Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"📁 File: {backup_filename}"
+        )
+        file_id = (backup_manager.read_manifest(latest_backup) or {}).get("telegram_file_id")
+        if file_id:
+            await context.bot.send_document(chat_id=user_id, document=file_id, caption=caption)
+        else:
+            with open(latest_backup, 'rb') as backup_file:
+                await context.bot.send_document(chat_id=user_id, document=backup_file, caption=caption)
 
         logger.info(f"Latest backup sent to admin {user_id}")
         await update.message.reply_text(
@@ -588,35 +789,34 @@ async def send_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def scheduled_backup(context: ContextTypes.DEFAULT_TYPE):
     """Автоматическое создание бэкапа раз в сутки"""
     try:
-        # Создаем бэкап (без времени в имени для ежедневных бэкапов)
-        success, backup_path = backup_manager.create_backup(include_time=False)
+        # Создаем бэкап (без времени в имени для ежедневных бэкапов);
+        # между полными снимками отправляются только измененные страницы
+        success, backup_path = await backup_manager.create_backup_async(include_time=False, incremental=True)
 
         if not success:
             logger.error("Failed to create automatic backup")
             return
 
         # Отправляем файл всем админам
-        success_count = 0
-        for admin_id in config.telegram.admin_ids:
-            try:
-                with open(backup_path, 'rb') as backup_file:
-                    backup_filename = os.path.basename(backup_path)
-                    await context.bot.send_document(
-                        chat_id=admin_id,
-                        document=backup_file,
-                        caption=f"📦 Автоматический бэкап базы данных\n"
-                                f"📅 Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                                f"📁 Файл: {backup_filename}\n\n"
-                                f"📦 Automatic database backup\n"
-                                f"📅 Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                                f"📁 File: {backup_filename}"
-                    )
-                success_count += 1
-                logger.info(f"Automatic backup sent to admin {admin_id}")
-            except Exception as e:
-                logger.error(f"Failed to send automatic backup to admin {admin_id}: {e}")
+        backup_filename = os.path.basename(backup_path)
+        delivery = await distribute_backup(
+            context.bot,
+            backup_path,
+            caption=f"📦 Автоматический бэкап базы данных\n"
+                    f"📅 Дата: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    f"📁 Файл: {backup_filename}\n\n"
+                    f"📦 Automatic database backup\n"
+                    f"📅 Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    f"📁 File: {backup_filename}\n"
+                    f"🔒 SHA256: {backup_manager.last_report.sha256}"
+                    + (f"\n🧩 Base: {backup_manager.last_report.base}" if backup_manager.last_report.base else ""),
+        )
+
+        logger.info(f"Automatic backup completed. Sent to {delivery.sent} admins")
 
-        logger.info(f"Automatic backup completed. Sent to {success_count} admins")
+        # Сегменты WAL старше самого старого бэкапа для восстановления больше не нужны
+        if config.wal_archive.enabled:
+            await asyncio.to_thread(wal_archiver.prune)
 
     except Exception as e:
         logger.error(f"Error creating automatic backup: {e}")
@@ -734,9 +934,10 @@ def setup_handlers(app: Application):
     app.add_handler(CommandHandler("delete_subscription", delete_subscription_cmd))
     app.add_handler(CommandHandler("list_subscriptions", get_subscription_lists_cmd))
     app.add_handler(CommandHandler("active_subscriptions", active_subscriptions_cmd))
+    app.add_handler(CallbackQueryHandler(active_subscriptions_callback, pattern="^active_subs_"))
+    app.add_handler(CommandHandler("metrics", metrics_cmd))
     app.add_handler(CommandHandler("my_subscription", my_subscription_cmd))
     app.add_handler(CommandHandler("subscriptions", subscriptions))
-    from telegram.ext import CallbackQueryHandler
     app.add_handler(CallbackQueryHandler(subscriptions_callback, pattern="^subscribe_"))
     app.add_handler(PreCheckoutQueryHandler(pre_checkout_query))
     app.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, successful_payment))
@@ -748,4 +949,8 @@ def setup_handlers(app: Application):
     app.add_handler(CommandHandler("backup", create_backup))
     app.add_handler(CommandHandler("send_backup", send_backup))
     app.add_handler(CommandHandler("scheduled_backup", scheduled_backup))
+    app.add_handler(CommandHandler("broadcast", broadcast_cmd))
+    app.add_handler(CommandHandler("broadcast_status", broadcast_status_cmd))
+    app.add_handler(CommandHandler("broadcast_cancel", broadcast_cancel_cmd))
+    app.add_handler(CommandHandler("revoke_sessions", revoke_sessions_cmd))
     logger.info("Handlers set up for bot")
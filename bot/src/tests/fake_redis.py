@@ -0,0 +1,168 @@
+"""
+Redis в памяти для тестов, которым не нужны Lua-скрипты
+
+Скрипты из src.utils.subscription проверяются на настоящем сервере
+(src.tests.redis_server). Значения хранятся строками, как при
+decode_responses=True.
+"""
+
+import fnmatch
+import time
+
+
+class FakePipeline:
+    """Команды копятся и выполняются по execute(); выполненные пачки пишутся в redis.pipelines"""
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._redis, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((name, method, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        self._redis.pipelines.append([name for name, *_ in self._commands])
+        results = [await method(*args, **kwargs) for _, method, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.strings = {}
+        self.expires = {}
+        self.hashes = {}
+        self.zsets = {}
+        self.pipelines = []
+        self.published = []
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.time():
+            self.strings.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.strings
+
+    async def get(self, key):
+        return self.strings[key] if self._alive(key) else None
+
+    async def set(self, key, value, ex=None):
+        self.strings[key] = str(value)
+        self.expires.pop(key, None)
+        if ex is not None:
+            self.expires[key] = time.time() + int(ex)
+        return True
+
+    async def incr(self, key):
+        value = int(await self.get(key) or 0) + 1
+        self.strings[key] = str(value)
+        return value
+
+    async def ttl(self, key):
+        if not self._alive(key):
+            return -2
+        if key not in self.expires:
+            return -1
+        return int(self.expires[key] - time.time())
+
+    async def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            for store in (self.strings, self.hashes, self.zsets):
+                if store.pop(key, None) is not None:
+                    deleted += 1
+            self.expires.pop(key, None)
+        return deleted
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(str(field))
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        values = self.hashes.setdefault(key, {})
+        for name, item in items.items():
+            values[str(name)] = str(item)
+        return len(items)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def hincrby(self, key, field, amount=1):
+        values = self.hashes.setdefault(key, {})
+        values[str(field)] = str(int(values.get(str(field), 0)) + int(amount))
+        return int(values[str(field)])
+
+    async def hdel(self, key, *fields):
+        values = self.hashes.get(key, {})
+        return sum(values.pop(str(field), None) is not None for field in fields)
+
+    async def zadd(self, key, mapping):
+        members = self.zsets.setdefault(key, {})
+        added = sum(str(member) not in members for member in mapping)
+        members.update({str(member): float(score) for member, score in mapping.items()})
+        return added
+
+    async def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(str(member))
+
+    async def zrem(self, key, *members):
+        values = self.zsets.get(key, {})
+        return sum(values.pop(str(member), None) is not None for member in members)
+
+    def _range(self, key, min, max):
+        def bound(value, low):
+            if value in ("-inf", "+inf"):
+                return float(value), False
+            value = str(value)
+            if value.startswith("("):
+                return float(value[1:]), True
+            return float(value), False
+
+        (low, low_open), (high, high_open) = bound(min, True), bound(max, False)
+        items = sorted(self.zsets.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+        return [
+            (member, score) for member, score in items
+            if (score > low if low_open else score >= low) and (score < high if high_open else score <= high)
+        ]
+
+    async def zrangebyscore(self, key, min, max, start=None, num=None, withscores=False):
+        items = self._range(key, min, max)
+        if start is not None:
+            items = items[start:start + num]
+        return items if withscores else [member for member, _ in items]
+
+    async def zcount(self, key, min, max):
+        return len(self._range(key, min, max))
+
+    async def scan(self, cursor=0, match=None, count=None):
+        """Курсор — смещение в отсортированном списке ключей; страница по count ключей"""
+        keys = [key for key in self.strings if self._alive(key)] + list(self.hashes) + list(self.zsets)
+        keys = sorted(key for key in keys if fnmatch.fnmatchcase(key, match or "*"))
+        count = count or 10
+        page = keys[cursor:cursor + count]
+        next_cursor = cursor + count if cursor + count < len(keys) else 0
+        return next_cursor, page
+
+    async def scan_iter(self, match=None, count=None):
+        cursor = 0
+        while True:
+            cursor, keys = await self.scan(cursor, match=match, count=count)
+            for key in keys:
+                yield key
+            if cursor == 0:
+                break
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
@@ -0,0 +1,51 @@
+"""
+Настоящий Redis/KeyDB для тестов Lua-скриптов из src.utils.subscription
+
+Адрес берется из TEST_REDIS_URL (по умолчанию база 15 локального сервера).
+Если сервер недоступен, тест пропускается. База очищается перед каждым
+тестом, поэтому рабочую базу в TEST_REDIS_URL указывать нельзя.
+"""
+
+import os
+import unittest
+from contextlib import ExitStack, asynccontextmanager
+from unittest.mock import patch
+
+import redis
+import redis.asyncio
+
+from src.utils import subscription
+
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL", "redis://localhost:6379/15")
+
+SCRIPTS = ("_register_active_script", "_expire_registry_script", "_activate_script")
+
+
+def connect_test_redis() -> redis.Redis:
+    """Синхронный клиент к очищенной тестовой базе; без сервера — SkipTest"""
+    client = redis.Redis.from_url(TEST_REDIS_URL, decode_responses=True, socket_connect_timeout=1)
+    try:
+        client.flushdb()
+    except redis.ConnectionError:
+        client.close()
+        raise unittest.SkipTest(f"Redis is not available at {TEST_REDIS_URL}")
+    return client
+
+
+@asynccontextmanager
+async def subscription_redis(*modules):
+    """
+    Подменить r в src.utils.subscription (и в modules) асинхронным клиентом
+    тестовой базы и зарегистрировать на нем те же Lua-скрипты
+    """
+    client = redis.asyncio.Redis.from_url(TEST_REDIS_URL, decode_responses=True)
+    try:
+        with ExitStack() as stack:
+            for module in (subscription, *modules):
+                stack.enter_context(patch.object(module, "r", client))
+            for name in SCRIPTS:
+                script = client.register_script(getattr(subscription, name).script)
+                stack.enter_context(patch.object(subscription, name, script))
+            yield client
+    finally:
+        await client.aclose()
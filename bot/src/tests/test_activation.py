@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Тесты для атомарной активации триала и подписки
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.tests.redis_server import connect_test_redis, subscription_redis
+from src.utils import subscription
+from src.utils.db import SQLitePool
+from src.utils.metrics import metrics
+from src.utils.user_cache import SubscriptionStateCache
+
+
+class RecordingScript:
+    """
+    Настоящий скрипт активации, запоминающий вызовы; может имитировать сбой Redis
+
+    Перед вызовом выдерживается разная пауза: если бы скрипт выполнялся вне
+    транзакции SQLite, параллельные активации легли бы в Redis в другом порядке.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.calls = []
+        self.fail = False
+
+    async def __call__(self, keys, args):
+        if self.fail:
+            raise ConnectionError("redis is down")
+        self.calls.append((keys, args))
+        await asyncio.sleep(0.001 * (len(self.calls) % 3))
+        return await self.script(keys=keys, args=args)
+
+
+class TestActivation(unittest.TestCase):
+    """Тесты для activate_trial и activate_subscription"""
+
+    def setUp(self):
+        self.redis = connect_test_redis()
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "test.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        self.redis.close()
+
+    def run_with_db(self, scenario):
+        """scenario(script) выполняется с настоящим скриптом активации; возвращает строки subscriptions"""
+        async def run():
+            pool = SQLitePool(self.db_path)
+            try:
+                async with pool.write() as db:
+                    await db.execute(
+                        "CREATE TABLE subscriptions (user_id INTEGER PRIMARY KEY, end_date TEXT, active INTEGER, "
+                        "trial_used INTEGER DEFAULT 0, auto_renewal INTEGER, lang TEXT, subtype TEXT)"
+                    )
+                async with subscription_redis() as client:
+                    script = RecordingScript(subscription._activate_script)
+                    with patch.object(subscription.config.subscription, "trial_days", 7), \
+                            patch.object(subscription, "db_pool", pool), \
+                            patch.object(subscription, "_activate_script", script), \
+                            patch.object(subscription, "subscription_cache", SubscriptionStateCache(client)):
+                        await scenario(script)
+                async with pool.read() as db:
+                    async with db.execute(
+                        "SELECT user_id, active, trial_used, subtype FROM subscriptions ORDER BY user_id"
+                    ) as cursor:
+                        return await cursor.fetchall()
+            finally:
+                await pool.close()
+
+        return asyncio.run(run())
+
+    def assert_keys_consistent(self, user_id, plan):
+        """Токен, обратный ключ, info, индекс истечения и реестр указывают на одну активацию"""
+        token = self.redis.get(f"user:{user_id}:token")
+        self.assertIsNotNone(token)
+        self.assertEqual(self.redis.get(f"token:{token}"), str(user_id))
+        self.assertEqual(self.redis.hget(f"user:{user_id}:info", "subscription_type"), plan)
+        self.assertEqual(self.redis.hget(subscription.ACTIVE_PLAN_KEY, str(user_id)), plan)
+        self.assertIsNotNone(self.redis.zscore(subscription.EXPIRY_INDEX_KEY, str(user_id)))
+        ttl = self.redis.ttl(f"user:{user_id}:token")
+        self.assertGreater(ttl, 0)
+        self.assertAlmostEqual(self.redis.ttl(f"token:{token}"), ttl, delta=1)
+        return token
+
+    def test_concurrent_trial_is_granted_once(self):
+        """Параллельные запросы триала одного пользователя выдают его один раз"""
+        results = []
+
+        async def scenario(script):
+            results.extend(await asyncio.gather(*(subscription.activate_trial(1, 1) for _ in range(20))))
+            self.assertEqual(len(script.calls), 1)
+
+        rows = self.run_with_db(scenario)
+        granted = [r for r in results if r]
+        self.assertEqual(len(granted), 1)
+        self.assertRegex(granted[0], r"^trial-[0-9a-f-]{36}$")
+        self.assertEqual(rows, [(1, 1, 1, "trial")])
+        self.assertEqual(self.assert_keys_consistent(1, "trial"), granted[0])
+        self.assertEqual(self.redis.hgetall(subscription.PLAN_COUNTS_KEY), {"trial": "1"})
+
+    def test_concurrent_activations_leave_consistent_keys(self):
+        """После параллельных активаций разных тарифов ключи каждого пользователя согласованы с SQLite"""
+        plans = {"month": {"duration_days": 30}, "year": {"duration_days": 365}}
+
+        async def scenario(script):
+            with patch.object(subscription.plan_catalog, "get", AsyncMock(side_effect=plans.get)):
+                await asyncio.gather(*(
+                    subscription.activate_subscription(user_id, 100 + user_id, plan)
+                    for _ in range(4) for user_id in range(1, 6) for plan in plans
+                ))
+
+        rows = self.run_with_db(scenario)
+
+        self.assertEqual([row[0] for row in rows], [1, 2, 3, 4, 5])
+        for user_id, _, _, plan in rows:
+            self.assert_keys_consistent(user_id, plan)
+            self.assertEqual(self.redis.hget(f"user:{user_id}:info", "chat_id"), str(100 + user_id))
+        # Счетчики тарифов совпадают с последним тарифом каждого пользователя
+        expected = {plan: str(sum(row[3] == plan for row in rows)) for plan in plans}
+        self.assertEqual(self.redis.hgetall(subscription.PLAN_COUNTS_KEY), expected)
+
+    def test_redis_failure_rolls_back_trial_claim(self):
+        """Если Redis недоступен, триал не считается использованным"""
+        async def scenario(script):
+            script.fail = True
+            with self.assertRaises(ConnectionError):
+                await subscription.activate_trial(1, 1)
+            script.fail = False
+            self.assertTrue((await subscription.activate_trial(1, 1)).startswith("trial-"))
+
+        self.assertEqual(self.run_with_db(scenario), [(1, 1, 1, "trial")])
+        self.assert_keys_consistent(1, "trial")
+
+    def test_subscription_activation_is_one_script_call(self):
+        """Подписка: один upsert с типом тарифа и один вызов скрипта, задержка попадает в метрики"""
+        before = metrics.latency("activation").count
+
+        async def scenario(script):
+            with patch.object(subscription.plan_catalog, "get", AsyncMock(return_value={"duration_days": 30})):
+                await subscription.activate_trial(1, 1)
+                token = await subscription.activate_subscription(1, 1, "month")
+            self.assertEqual(len(script.calls), 2)
+            keys, args = script.calls[-1]
+            self.assertEqual(keys[:3], ["user:1:token", f"token:{token}", "user:1:info"])
+            self.assertEqual(args[4], "month")
+            self.assertGreater(args[2], 29 * 86400)
+
+        rows = self.run_with_db(scenario)
+        self.assertEqual(rows, [(1, 1, 1, "month")])
+        self.assertEqual(metrics.latency("activation").count - before, 2)
+        self.assert_keys_consistent(1, "month")
+        self.assertEqual(self.redis.hgetall(subscription.PLAN_COUNTS_KEY), {"trial": "0", "month": "1"})
+
+    def test_renewal_replaces_guessable_trial_token(self):
+        """Продление после триала со старым токеном trial-{user_id} выдает случайный токен"""
+        self.redis.set("user:1:token", "trial-1")
+        self.redis.set("token:trial-1", "1")
+        tokens = []
+
+        async def scenario(script):
+            with patch.object(subscription.plan_catalog, "get", AsyncMock(return_value={"duration_days": 30})):
+                tokens.append(await subscription.renew_subscription(1, 1, "month"))
+
+        self.assertEqual(self.run_with_db(scenario), [(1, 1, 1, "month")])
+        self.assertNotEqual(tokens[0], "trial-1")
+        self.assertEqual(self.assert_keys_consistent(1, "month"), tokens[0])
+        self.assertIsNone(self.redis.get("token:trial-1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
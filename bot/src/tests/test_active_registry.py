@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Тесты реестра активных подписок: счетчики по типам, очистка истекших, постраничный вывод
+"""
+
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.handlers import handlers
+from src.tests.redis_server import connect_test_redis, subscription_redis
+from src.utils import subscription
+
+DAY = 86400
+
+
+class TestActiveRegistry(unittest.TestCase):
+    """Тесты для скриптов реестра, get_active_subscriptions и active_subscriptions_callback"""
+
+    def setUp(self):
+        self.redis = connect_test_redis()
+
+    def tearDown(self):
+        self.redis.close()
+
+    def run_with_redis(self, scenario):
+        async def run():
+            async with subscription_redis():
+                return await scenario()
+
+        return asyncio.run(run())
+
+    def register(self, subs):
+        """subs: (user_id, тип, секунд до окончания); токены user:{id}:token"""
+        async def scenario():
+            now = time.time()
+            for user_id, plan, left in subs:
+                self.redis.set(f"user:{user_id}:token", f"token-{user_id}")
+                await subscription.register_active_subscription(user_id, plan, now + left)
+
+        self.run_with_redis(scenario)
+
+    def test_changed_plan_moves_counter(self):
+        """Повторная регистрация с другим типом переносит пользователя между счетчиками"""
+        self.register([(1, "trial", DAY), (2, "trial", DAY), (1, "monthly", 30 * DAY), (2, "monthly", 30 * DAY)])
+
+        self.assertEqual(self.redis.hgetall(subscription.ACTIVE_PLAN_KEY), {"1": "monthly", "2": "monthly"})
+        self.assertEqual(self.redis.hgetall(subscription.PLAN_COUNTS_KEY), {"trial": "0", "monthly": "2"})
+        # Обнулившиеся типы в сводку не попадают
+        self.assertEqual(self.run_with_redis(subscription.get_active_plan_counts), {"monthly": 2})
+
+    def test_expire_registry_prunes_lapsed_entries(self):
+        """Истекшие подписки уходят из индекса и реестра, счетчики уменьшаются"""
+        self.register([(1, "trial", -60), (2, "monthly", DAY), (3, "monthly", -60)])
+        # Запись индекса без типа (например, после ручной правки) тоже удаляется
+        self.redis.zadd(subscription.EXPIRY_INDEX_KEY, {"4": time.time() - 60})
+
+        expired = self.run_with_redis(subscription.expire_subscriptions_registry)
+
+        self.assertEqual(expired, 3)
+        self.assertEqual(self.redis.zrange(subscription.EXPIRY_INDEX_KEY, 0, -1), ["2"])
+        self.assertEqual(self.redis.hgetall(subscription.ACTIVE_PLAN_KEY), {"2": "monthly"})
+        self.assertEqual(self.run_with_redis(subscription.get_active_plan_counts), {"monthly": 1})
+        self.assertEqual(self.run_with_redis(subscription.expire_subscriptions_registry), 0)
+
+    def test_pagination_boundaries_and_total(self):
+        """Страницы идут по возрастанию времени окончания; total не зависит от страницы"""
+        self.register([(user_id, "monthly", user_id * DAY + 60) for user_id in range(1, 6)] + [(9, "trial", -60)])
+
+        def page(offset):
+            return self.run_with_redis(lambda: subscription.get_active_subscriptions(offset=offset, limit=2))
+
+        pages = [page(offset) for offset in (0, 2, 4, 6)]
+
+        self.assertEqual([total for _, total in pages], [5, 5, 5, 5])
+        self.assertEqual([[sub["user_id"] for sub in subs] for subs, _ in pages], [["1", "2"], ["3", "4"], ["5"], []])
+        first = pages[0][0][0]
+        self.assertEqual(first, {"user_id": "1", "token": "token-1", "subscription_type": "monthly", "days_left": 1})
+
+    def render_callback(self, data, user_id=7):
+        query = MagicMock()
+        query.data = data
+        query.from_user.id = user_id
+        query.answer = AsyncMock()
+        query.edit_message_text = AsyncMock()
+        update = MagicMock()
+        update.callback_query = query
+        update.effective_user.language_code = "en"
+
+        async def scenario():
+            with patch.object(handlers.config.telegram, "admin_ids", [7]), \
+                    patch.object(handlers, "ACTIVE_SUBSCRIPTIONS_PAGE_SIZE", 2):
+                await handlers.active_subscriptions_callback(update, MagicMock())
+
+        self.run_with_redis(scenario)
+        return query
+
+    def test_callback_navigation(self):
+        """Средняя страница — кнопки в обе стороны, последняя — только назад; чужим отказ"""
+        self.register([(user_id, "monthly", user_id * DAY + 60) for user_id in range(1, 6)])
+
+        def buttons(query):
+            markup = query.edit_message_text.await_args.kwargs["reply_markup"]
+            return [button.callback_data for button in markup.inline_keyboard[0]]
+
+        middle = self.render_callback("active_subs_1")
+        text = middle.edit_message_text.await_args.args[0]
+        self.assertIn("token-3", text)
+        self.assertIn("token-4", text)
+        self.assertNotIn("token-5", text)
+        self.assertEqual(buttons(middle), ["active_subs_0", "active_subs_2"])
+        self.assertEqual(buttons(self.render_callback("active_subs_2")), ["active_subs_1"])
+
+        stranger = self.render_callback("active_subs_0", user_id=8)
+        stranger.answer.assert_awaited_once()
+        stranger.edit_message_text.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
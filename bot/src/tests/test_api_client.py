@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Тесты для общего HTTP-клиента API
+"""
+
+import asyncio
+import unittest
+
+from aiohttp import web
+
+from src.utils.api_client import ApiClient, ApiError
+from src.utils.metrics import metrics
+
+
+class TestApiClient(unittest.TestCase):
+    """Тесты для ApiClient на локальном aiohttp-сервере"""
+
+    def run_with_server(self, handler, scenario):
+        async def run():
+            app = web.Application()
+            app.router.add_route("*", "/{tail:.*}", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            client = ApiClient(f"http://127.0.0.1:{port}")
+            try:
+                return await scenario(client)
+            finally:
+                await client.close()
+                await runner.cleanup()
+
+        return asyncio.run(run())
+
+    def flaky_handler(self, failures):
+        calls = {"count": 0}
+
+        async def handler(request):
+            calls["count"] += 1
+            if calls["count"] <= failures:
+                return web.Response(status=503, text="unavailable")
+            return web.json_response({"ok": True})
+
+        return handler, calls
+
+    def test_idempotent_request_is_retried(self):
+        """GET повторяется при 503 и в итоге возвращает JSON"""
+        handler, calls = self.flaky_handler(failures=2)
+        result = self.run_with_server(handler, lambda client: client.get("/status", max_retries=3))
+        self.assertEqual(result, {"ok": True})
+        self.assertEqual(calls["count"], 3)
+
+    def test_post_is_not_retried_without_idempotency_key(self):
+        """POST без Idempotency-Key не повторяется"""
+        handler, calls = self.flaky_handler(failures=1)
+
+        async def scenario(client):
+            with self.assertRaises(ApiError) as ctx:
+                await client.post("/activate", json={})
+            return ctx.exception.status
+
+        self.assertEqual(self.run_with_server(handler, scenario), 503)
+        self.assertEqual(calls["count"], 1)
+
+    def test_post_with_idempotency_key_is_retried(self):
+        """POST с Idempotency-Key повторяется"""
+        handler, calls = self.flaky_handler(failures=1)
+        result = self.run_with_server(
+            handler,
+            lambda client: client.post("/activate", json={}, headers={"Idempotency-Key": "k"}, max_retries=2),
+        )
+        self.assertEqual(result, {"ok": True})
+        self.assertEqual(calls["count"], 2)
+
+    def test_timeout_budget(self):
+        """Медленный ответ прерывается по бюджету времени и учитывается в метриках"""
+        async def handler(request):
+            await asyncio.sleep(1)
+            return web.json_response({})
+
+        async def scenario(client):
+            with self.assertRaises(ApiError):
+                await client.get("/slow", timeout=0.2, max_retries=5)
+
+        self.run_with_server(handler, scenario)
+        self.assertGreaterEqual(metrics.latency("api GET /slow").errors, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
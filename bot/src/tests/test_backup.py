@@ -3,19 +3,33 @@
 Тесты для модуля работы с бэкапами базы данных
 """
 
+import hashlib
 import os
 import shutil
+import sqlite3
 import tempfile
 import unittest
 import asyncio
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest.mock import AsyncMock, MagicMock, patch
+from telegram.error import Conflict, TelegramError
 
 # Добавляем путь к src
 import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.utils.backup import BackupManager
+from src.utils.backup import (
+    BackupManager, CatalogEntry, backup_date_from_name, open_backup_for_read, select_retained,
+)
+
+
+def write_file(content):
+    """Замена File.download_to_drive: записывает content в custom_path"""
+    async def download_to_drive(custom_path):
+        with open(custom_path, "wb") as f:
+            f.write(content)
+    return download_to_drive
+
 
 class TestBackupManager(unittest.TestCase):
     """Тесты для класса BackupManager"""
@@ -28,8 +42,16 @@ class TestBackupManager(unittest.TestCase):
         self.database_path = os.path.join(self.temp_dir, "test.db")
         
         # Создаем тестовую базу данных
-        with open(self.database_path, 'w') as f:
-            f.write("test database content")
+        conn = sqlite3.connect(self.database_path)
+        conn.execute("CREATE TABLE subscriptions (user_id INTEGER PRIMARY KEY, subtype TEXT)")
+        conn.executemany(
+            "INSERT INTO subscriptions (user_id, subtype) VALUES (?, ?)",
+            [(i, "month") for i in range(1000)]
+        )
+        conn.commit()
+        conn.close()
+        with open(self.database_path, 'rb') as f:
+            self.database_content = f.read()
         
         # Инициализируем менеджер бэкапов
         self.backup_manager = BackupManager(
@@ -65,10 +87,30 @@ class TestBackupManager(unittest.TestCase):
         self.assertIsNotNone(backup_path)
         self.assertTrue(os.path.exists(backup_path))
         
-        # Проверяем содержимое
-        with open(backup_path, 'r') as f:
-            content = f.read()
-        self.assertEqual(content, "test database content")
+        # Проверяем содержимое: сжатый согласованный снимок базы
+        with open_backup_for_read(backup_path) as f:
+            snapshot = os.path.join(self.temp_dir, "snapshot.db")
+            with open(snapshot, 'wb') as out:
+                out.write(f.read())
+        conn = sqlite3.connect(snapshot)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0], 1000)
+        self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+        conn.close()
+
+        # Манифест с контрольными суммами и степенью сжатия
+        manifest = self.backup_manager.read_manifest(backup_path)
+        self.assertEqual(manifest["file"], os.path.basename(backup_path))
+        self.assertEqual(len(manifest["sha256"]), 64)
+        self.assertLess(manifest["size"], manifest["raw_size"])
+
+    def test_create_backup_async_reports_loop_lag(self):
+        """Асинхронный бэкап выполняется в потоке и сообщает блокировку event loop"""
+        success, backup_path = asyncio.run(self.backup_manager.create_backup_async())
+
+        self.assertTrue(success)
+        report = self.backup_manager.last_report
+        self.assertIsNotNone(report.loop_blocked_ms)
+        self.assertEqual(self.backup_manager.read_manifest(backup_path)["loop_blocked_ms"], report.loop_blocked_ms)
     
     def test_create_backup_without_time(self):
         """Тест создания бэкапа без времени в имени"""
@@ -80,10 +122,11 @@ class TestBackupManager(unittest.TestCase):
         # Проверяем формат имени файла (только дата, без времени)
         filename = os.path.basename(backup_path)
         self.assertTrue(filename.startswith("subscriptions_backup_"))
-        self.assertTrue(filename.endswith(".db"))
+        self.assertTrue(filename.endswith((".db.gz", ".db.zst")))
         # Должно быть 8 цифр даты (YYYYMMDD)
-        date_part = filename.replace("subscriptions_backup_", "").replace(".db", "")
+        date_part = filename.replace("subscriptions_backup_", "").split(".")[0]
         self.assertEqual(len(date_part), 8)
+        self.assertIsNotNone(backup_date_from_name(filename))
     
     def test_create_backup_database_not_exists(self):
         """Тест создания бэкапа когда база данных не существует"""
@@ -156,10 +199,63 @@ class TestBackupManager(unittest.TestCase):
         self.assertTrue(os.path.exists(self.database_path))
         
         # Проверяем содержимое
-        with open(self.database_path, 'r') as f:
+        with open(self.database_path, 'rb') as f:
             content = f.read()
-        self.assertEqual(content, "test database content")
-    
+        self.assertEqual(content, self.database_content)
+
+    def test_restore_from_compressed_backup(self):
+        """Тест восстановления из сжатого бэкапа с проверкой контрольной суммы"""
+        success, backup_path = self.backup_manager.create_backup()
+        self.assertTrue(success)
+        os.remove(self.database_path)
+
+        self.assertTrue(self.backup_manager.restore_from_backup(backup_path))
+        conn = sqlite3.connect(self.database_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0], 1000)
+        conn.close()
+
+    def test_restore_rejects_corrupted_backup(self):
+        """Бэкап с неверной контрольной суммой не восстанавливается"""
+        success, backup_path = self.backup_manager.create_backup()
+        with open(backup_path, 'ab') as f:
+            f.write(b"garbage")
+
+        self.assertFalse(self.backup_manager.restore_from_backup(backup_path))
+        with open(self.database_path, 'rb') as f:
+            self.assertEqual(f.read(), self.database_content)
+
+    def test_incremental_backup_chain(self):
+        """Инкремент хранит только измененные страницы и восстанавливается поверх полного снимка"""
+        success, full_path = self.backup_manager.create_backup(incremental=True)
+        self.assertTrue(success)
+        self.assertEqual(self.backup_manager.last_report.type, "full")
+
+        conn = sqlite3.connect(self.database_path)
+        conn.execute("UPDATE subscriptions SET subtype = 'year' WHERE user_id < 10")
+        conn.commit()
+        conn.close()
+
+        success, delta_path = self.backup_manager.create_backup(incremental=True)
+        self.assertTrue(success)
+        report = self.backup_manager.last_report
+        self.assertEqual(report.type, "delta")
+        self.assertEqual(report.base, os.path.basename(full_path))
+        self.assertLess(report.changed_pages, report.pages)
+
+        os.remove(self.database_path)
+        self.assertTrue(self.backup_manager.restore_from_backup(delta_path))
+        with open(self.database_path, 'rb') as f:
+            restored_content = f.read()
+        conn = sqlite3.connect(self.database_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM subscriptions WHERE subtype = 'year'").fetchone()[0], 10)
+        conn.close()
+
+        # Без полного снимка цепочка не собирается, и база не подменяется
+        os.remove(full_path)
+        self.assertFalse(self.backup_manager.restore_from_backup(delta_path))
+        with open(self.database_path, 'rb') as f:
+            self.assertEqual(f.read(), restored_content)
+
     def test_restore_from_latest_backup(self):
         """Тест восстановления из последнего бэкапа"""
         # Создаем несколько бэкапов
@@ -220,7 +316,9 @@ class TestBackupManager(unittest.TestCase):
     def test_get_latest_backup_from_admins(self, mock_config):
         """Тест получения последнего бэкапа из чатов с админами"""
         mock_config.telegram.admin_ids = [12345, 67890]
+        mock_config.webhook.enabled = False
         mock_bot = MagicMock()
+        mock_bot.get_chat = AsyncMock(return_value=MagicMock(pinned_message=None))
         self.backup_manager.set_bot(mock_bot)
         
         # Создаем мок обновления с документом
@@ -236,7 +334,7 @@ class TestBackupManager(unittest.TestCase):
         
         # Мокаем get_file и download_to_drive
         mock_file_info = MagicMock()
-        mock_file_info.download_to_drive = AsyncMock()
+        mock_file_info.download_to_drive = AsyncMock(side_effect=write_file(b"backup-content"))
         mock_bot.get_file = AsyncMock(return_value=mock_file_info)
         
         # Создаем директорию для бэкапов
@@ -250,10 +348,89 @@ class TestBackupManager(unittest.TestCase):
         self.assertTrue(result.endswith("subscriptions_backup_20231201_120000.db"))
         
         # Проверяем что методы были вызваны
-        self.assertEqual(mock_bot.get_updates.call_count, 2)  # Для каждого админа
+        self.assertEqual(mock_bot.get_updates.call_count, 1)  # Один раз для всех админов
         mock_bot.get_file.assert_called_once_with("test_file_id")
-        mock_file_info.download_to_drive.assert_called_once()
+        mock_file_info.download_to_drive.assert_called_once_with(custom_path=result + ".part")
+
+    @patch('src.utils.backup.config')
+    def test_get_latest_backup_from_admins_downloads_only_verified_winner(self, mock_config):
+        """Скачивается только самый свежий бэкап; при неверной контрольной сумме — следующий"""
+        mock_config.telegram.admin_ids = [12345, 67890]
+        mock_config.webhook.enabled = False
+        content = b"backup-content"
+        good_sha = hashlib.sha256(content).hexdigest()
+
+        def backup_message(admin_id, name, sha256):
+            update = MagicMock()
+            update.message.chat.id = admin_id
+            update.message.document.file_name = name
+            update.message.document.file_id = name
+            update.message.document.file_size = len(content)
+            update.message.caption = f"📁 File: {name}\n🔒 SHA256: {sha256}"
+            return update
+
+        updates = [
+            backup_message(12345, "subscriptions_backup_20231201.db.gz", good_sha),
+            backup_message(67890, "subscriptions_backup_20231203.db.gz", "0" * 64),
+            backup_message(67890, "subscriptions_backup_20231202.db.gz", good_sha),
+            backup_message(67890, "subscriptions_backup_20231204.db.delta.gz", good_sha),
+            backup_message(11111, "subscriptions_backup_20231205.db.gz", good_sha),
+        ]
+
+        async def get_file(file_id):
+            file_info = MagicMock()
+            file_info.download_to_drive = AsyncMock(side_effect=write_file(content))
+            return file_info
+
+        mock_bot = MagicMock()
+        mock_bot.get_chat = AsyncMock(return_value=MagicMock(pinned_message=None))
+        mock_bot.get_updates = AsyncMock(return_value=updates)
+        mock_bot.get_file = AsyncMock(side_effect=get_file)
+        self.backup_manager.set_bot(mock_bot)
+
+        result = asyncio.run(self.backup_manager.get_latest_backup_from_admins())
+
+        self.assertTrue(result.endswith("subscriptions_backup_20231202.db.gz"))
+        self.assertEqual(
+            [call.args[0] for call in mock_bot.get_file.call_args_list],
+            ["subscriptions_backup_20231203.db.gz", "subscriptions_backup_20231202.db.gz"],
+        )
+        self.assertEqual(os.listdir(self.backup_dir), ["subscriptions_backup_20231202.db.gz"])
     
+    @patch('src.utils.backup.config')
+    def test_get_latest_backup_from_admins_with_webhook(self, mock_config):
+        """При вебхуке бэкап берется из закрепленных сообщений, get_updates не вызывается"""
+        mock_config.telegram.admin_ids = [12345, 67890]
+        mock_config.webhook.enabled = True
+        content = b"backup-content"
+        name = "subscriptions_backup_20231202.db.gz"
+
+        pinned = MagicMock()
+        pinned.chat.id = 67890
+        pinned.document.file_name = name
+        pinned.document.file_id = "pinned-file-id"
+        pinned.document.file_size = len(content)
+        pinned.caption = f"📁 File: {name}\n🔒 SHA256: {hashlib.sha256(content).hexdigest()}"
+
+        async def get_chat(chat_id):
+            if chat_id == 12345:
+                raise TelegramError("chat not found")
+            return MagicMock(pinned_message=pinned)
+
+        file_info = MagicMock()
+        file_info.download_to_drive = AsyncMock(side_effect=write_file(content))
+        mock_bot = MagicMock()
+        mock_bot.get_chat = AsyncMock(side_effect=get_chat)
+        mock_bot.get_updates = AsyncMock(side_effect=Conflict("terminated by setWebhook"))
+        mock_bot.get_file = AsyncMock(return_value=file_info)
+        self.backup_manager.set_bot(mock_bot)
+
+        result = asyncio.run(self.backup_manager.get_latest_backup_from_admins())
+
+        self.assertTrue(result.endswith(name))
+        mock_bot.get_updates.assert_not_called()
+        mock_bot.get_file.assert_called_once_with("pinned-file-id")
+
     def test_cleanup_old_backups(self):
         """Тест очистки старых бэкапов"""
         # Создаем несколько бэкапов
@@ -277,5 +454,81 @@ class TestBackupManager(unittest.TestCase):
         self.assertFalse(os.path.exists(backup1))  # Старый файл удален
         self.assertTrue(os.path.exists(backup2))   # Новый файл остался
 
+    def test_catalog_tracks_directory_changes(self):
+        """Каталог замечает бэкапы, добавленные и удаленные в обход менеджера"""
+        self.backup_manager.ensure_backup_dir()
+        backup1 = os.path.join(self.backup_dir, "subscriptions_backup_20231201.db")
+        shutil.copy2(self.database_path, backup1)
+        self.assertEqual(self.backup_manager.get_backup_files(), [backup1])
+
+        backup2 = os.path.join(self.backup_dir, "subscriptions_backup_20231202.db")
+        shutil.copy2(self.database_path, backup2)
+        os.remove(backup1)
+        self.assertEqual(self.backup_manager.get_backup_files(), [backup2])
+
+    def test_apply_retention_reports_reclaimed_space(self):
+        """Ротация удаляет лишние ежедневные бэкапы вместе с манифестами и считает освобожденное место"""
+        self.backup_manager.ensure_backup_dir()
+        today = datetime.now()
+        paths = []
+        for days_ago in range(10):
+            name = f"subscriptions_backup_{(today - timedelta(days=days_ago)).strftime('%Y%m%d')}.db"
+            path = os.path.join(self.backup_dir, name)
+            shutil.copy2(self.database_path, path)
+            with open(path + ".json", "w") as f:
+                f.write("{}")
+            paths.append(path)
+
+        with patch('src.utils.backup.config') as mock_config:
+            mock_config.backup.keep_daily = 3
+            mock_config.backup.keep_weekly = 1
+            mock_config.backup.keep_monthly = 1
+            mock_config.backup.max_total_mb = None
+            report = self.backup_manager.apply_retention()
+
+        self.assertEqual(report.kept, 3)
+        self.assertEqual(len(report.deleted), 7)
+        self.assertEqual(report.reclaimed, 7 * (len(self.database_content) + 2))
+        self.assertEqual(self.backup_manager.get_backup_files(), paths[:3])
+        self.assertFalse(os.path.exists(paths[5] + ".json"))
+
+
+class TestRetentionPolicy(unittest.TestCase):
+    """Тесты выбора бэкапов ротацией дед-отец-сын"""
+
+    def entries(self, days, size=100):
+        start = datetime(2024, 12, 31)
+        return [
+            CatalogEntry(f"/b/subscriptions_backup_{(start - timedelta(days=d)).strftime('%Y%m%d')}.db.gz",
+                         start - timedelta(days=d), size, 0.0, None, "full", None)
+            for d in range(days)
+        ]
+
+    def test_daily_weekly_monthly_tiers(self):
+        """Остаются последние дни, по одному бэкапу на неделю и на месяц"""
+        entries = self.entries(400)
+        retained = select_retained(entries, daily=7, weekly=4, monthly=12)
+        dates = sorted((e.created_at for e in entries if e.name in retained), reverse=True)
+
+        self.assertEqual(dates[:7], [datetime(2024, 12, 31) - timedelta(days=d) for d in range(7)])
+        # 7 дней + еще 2 недели до 4 недель + месяцы до ноября 2024 включительно: всего 12 месяцев
+        self.assertIn(datetime(2024, 1, 31), dates)
+        self.assertNotIn(datetime(2023, 12, 31), dates)
+        self.assertEqual(len(retained), 7 + 2 + 11)
+
+    def test_budget_drops_oldest_points_but_keeps_delta_base(self):
+        """Бюджет отбрасывает старые точки; база оставленного инкремента не удаляется"""
+        entries = self.entries(10)
+        base = entries[5]
+        for entry in entries[:5]:
+            entry.type, entry.base, entry.size = "delta", base.name, 10
+        retained = select_retained(entries, daily=10, weekly=0, monthly=0, max_total_size=160)
+
+        self.assertIn(entries[0].name, retained)
+        self.assertIn(base.name, retained)
+        self.assertNotIn(entries[9].name, retained)
+        self.assertLessEqual(sum(e.size for e in entries if e.name in retained), 160)
+
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
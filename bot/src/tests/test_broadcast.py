@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Тесты для массовой рассылки с сохранением прогресса
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from telegram import MessageEntity
+
+from src.handlers import handlers
+from src.tests.fake_redis import FakeRedis
+from src.utils.broadcast import BroadcastState, Broadcaster
+from src.utils.db import SQLitePool
+from src.utils.sender import SendReport
+
+
+class FakeSender:
+    """Записывает получателей; на пачке crash_on имитирует остановку процесса"""
+
+    def __init__(self, crash_on=None, blocked=()):
+        self.delivered = []
+        self.batches = 0
+        self.crash_on = crash_on
+        self.blocked = set(blocked)
+
+    async def send_many(self, messages):
+        self.batches += 1
+        if self.batches == self.crash_on:
+            raise asyncio.CancelledError()
+        report = SendReport()
+        for chat_id, _ in messages:
+            if chat_id in self.blocked:
+                report.failed += 1
+            else:
+                self.delivered.append(chat_id)
+                report.sent += 1
+        return report
+
+
+async def no_progress(state):
+    pass
+
+
+class TestBroadcaster(unittest.TestCase):
+    """Тесты для Broadcaster"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "test.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_with_broadcaster(self, scenario, users=25):
+        async def run():
+            pool = SQLitePool(self.db_path)
+            try:
+                async with pool.write() as db:
+                    await db.execute("CREATE TABLE subscriptions (user_id INTEGER PRIMARY KEY, active INTEGER)")
+                    await db.executemany(
+                        "INSERT INTO subscriptions VALUES (?, ?)",
+                        [(user_id, user_id % 2) for user_id in range(1, users + 1)],
+                    )
+                return await scenario(Broadcaster(FakeRedis(), pool, batch_size=10), pool)
+            finally:
+                await pool.close()
+
+        return asyncio.run(run())
+
+    def test_resume_after_restart(self):
+        """После остановки рассылка продолжается с последней сохраненной пачки"""
+        async def scenario(broadcaster, pool):
+            state = BroadcastState(id="b1", text="hello", audience="all")
+            first = FakeSender(crash_on=2)
+            with self.assertRaises(asyncio.CancelledError):
+                await broadcaster.run(None, state, first, no_progress)
+
+            # Новый процесс: тот же Redis, новый экземпляр рассылки
+            restarted = Broadcaster(broadcaster.client, pool, batch_size=10)
+            saved = await restarted.load()
+            self.assertEqual((saved.status, saved.last_user_id, saved.sent), ("running", 10, 10))
+            second = FakeSender()
+            final = await restarted.run(None, saved, second, no_progress)
+            return first.delivered, second.delivered, final, await restarted.load()
+
+        first, second, final, saved = self.run_with_broadcaster(scenario)
+        self.assertEqual(first + second, list(range(1, 26)))
+        self.assertEqual((final.status, final.sent), ("done", 25))
+        self.assertEqual(saved.status, "done")
+
+    def test_active_audience_and_failures(self):
+        """Аудитория active выбирает только активные подписки, недоставленные считаются"""
+        async def scenario(broadcaster, pool):
+            sender = FakeSender(blocked={3})
+            state = BroadcastState(id="b2", text="hello", audience="active")
+            return sender, await broadcaster.run(None, state, sender, no_progress)
+
+        sender, state = self.run_with_broadcaster(scenario)
+        self.assertEqual(sender.delivered, [1, 5, 7, 9, 11, 13, 15, 17, 19, 21, 23, 25])
+        self.assertEqual((state.sent, state.failed), (12, 1))
+        self.assertEqual(sender.batches, 2)
+
+    def test_only_one_broadcast_at_a_time(self):
+        async def scenario(broadcaster, pool):
+            await broadcaster.client.hset("broadcast:current", mapping=BroadcastState("b3", "x", "all").to_mapping())
+            with self.assertRaises(RuntimeError):
+                await broadcaster.start(None, "hello")
+
+        self.run_with_broadcaster(scenario)
+
+
+class TestBroadcastCommand(unittest.TestCase):
+    """Разбор текста /broadcast"""
+
+    def run_command(self, text):
+        command = text.split(maxsplit=1)[0]
+        update = MagicMock()
+        update.effective_user.id = 7
+        update.message.text = text
+        update.message.entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(command))]
+        update.message.reply_text = AsyncMock()
+        start = AsyncMock(return_value=BroadcastState("b4", "x", "all"))
+        with patch.object(handlers.config.telegram, "admin_ids", [7]), \
+                patch.object(handlers.broadcaster, "start", start):
+            asyncio.run(handlers.broadcast_cmd(update, MagicMock(args=text.split()[1:])))
+        return start, update.message.reply_text
+
+    def test_text_keeps_newlines_and_spaces(self):
+        """Переносы строк и повторные пробелы доходят до рассылки без изменений"""
+        start, _ = self.run_command("/broadcast@findmylink_bot active\nНовости:\n\n  • пункт   один")
+        self.assertEqual(start.await_args.args[1:3], ("Новости:\n\n  • пункт   один", "active"))
+
+        start, _ = self.run_command("/broadcast Всем  привет\nвторая строка")
+        self.assertEqual(start.await_args.args[1:3], ("Всем  привет\nвторая строка", "all"))
+
+    def test_empty_text_shows_usage(self):
+        start, reply = self.run_command("/broadcast active \n ")
+        start.assert_not_called()
+        self.assertIn("/broadcast [all|active]", reply.await_args.args[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Тесты для пула соединений SQLite
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+import aiosqlite
+
+from src.utils.db import SQLitePool
+
+
+class TestSQLitePool(unittest.TestCase):
+    """Тесты для SQLitePool"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "test.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_with_pool(self, scenario, readers=2):
+        async def run():
+            pool = SQLitePool(self.db_path, readers=readers)
+            try:
+                async with pool.write() as db:
+                    await db.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT)")
+                return await scenario(pool)
+            finally:
+                await pool.close()
+
+        return asyncio.run(run())
+
+    def test_pragmas(self):
+        """Писатель переводит базу в WAL, читатели открыты только для чтения"""
+        async def scenario(pool):
+            async with pool.write() as db:
+                async with db.execute("PRAGMA journal_mode") as cursor:
+                    mode = (await cursor.fetchone())[0]
+            async with pool.read() as db:
+                with self.assertRaises(aiosqlite.OperationalError):
+                    await db.execute("INSERT INTO items (value) VALUES ('x')")
+            return mode
+
+        self.assertEqual(self.run_with_pool(scenario), "wal")
+
+    def test_rollback_on_error(self):
+        """Ошибка внутри write() откатывает транзакцию"""
+        async def scenario(pool):
+            with self.assertRaises(RuntimeError):
+                async with pool.write() as db:
+                    await db.execute("INSERT INTO items (value) VALUES ('lost')")
+                    raise RuntimeError("boom")
+            async with pool.read() as db:
+                async with db.execute("SELECT COUNT(*) FROM items") as cursor:
+                    return (await cursor.fetchone())[0]
+
+        self.assertEqual(self.run_with_pool(scenario), 0)
+
+    def test_concurrent_access_reuses_connections(self):
+        """Параллельные чтения и записи идут через ограниченное число соединений"""
+        async def scenario(pool):
+            async def write(i):
+                async with pool.write() as db:
+                    await db.execute("INSERT INTO items (value) VALUES (?)", (str(i),))
+
+            async def read():
+                async with pool.read() as db:
+                    async with db.execute("SELECT COUNT(*) FROM items") as cursor:
+                        return (await cursor.fetchone())[0]
+
+            await asyncio.gather(*(write(i) for i in range(50)), *(read() for _ in range(50)))
+            return await read(), len(pool._opened)
+
+        count, opened = self.run_with_pool(scenario, readers=3)
+        self.assertEqual(count, 50)
+        self.assertLessEqual(opened, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Тесты напоминаний об окончании подписки и индекса subscriptions:expiry
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from contextlib import ExitStack, asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from telegram.error import BadRequest, Forbidden
+
+from src.handlers import handlers
+from src.tests.redis_server import connect_test_redis, subscription_redis
+from src.tools import backfill_expiry_index
+from src.utils import subscription
+from src.utils.db import SQLitePool
+from src.utils.user_cache import SubscriptionStateCache
+
+DAY = 86400
+
+
+def fake_db_pool(rows):
+    """db_pool.read(), отдающий rows на любой SELECT"""
+    cursor = MagicMock()
+    cursor.fetchall = AsyncMock(return_value=rows)
+
+    @asynccontextmanager
+    async def execute(*args):
+        yield cursor
+
+    @asynccontextmanager
+    async def read():
+        db = MagicMock()
+        db.execute = execute
+        yield db
+
+    pool = MagicMock()
+    pool.read = read
+    return pool
+
+
+def record_pipelines(client, executed):
+    """Подменить client.pipeline: при execute() имена команд пачки дописываются в executed"""
+    make_pipeline = client.pipeline
+
+    def pipeline(*args, **kwargs):
+        pipe = make_pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def recorded_execute(*execute_args, **execute_kwargs):
+            executed.append([command_args[0].lower() for command_args, _ in pipe.command_stack])
+            return await execute(*execute_args, **execute_kwargs)
+
+        pipe.execute = recorded_execute
+        return pipe
+
+    return patch.object(client, "pipeline", pipeline)
+
+
+class TestExpiryReminders(unittest.TestCase):
+    """Тесты для check_subscriptions"""
+
+    def test_mark_is_kept_for_permanent_failures(self):
+        """Отметка снимается только после временной ошибки; Forbidden и BadRequest не повторяются"""
+        rows = [(1, "2030-01-01 00:00:00"), (2, "2030-01-01 00:00:00"),
+                (3, "2030-01-01 00:00:00"), (4, "2030-01-01 00:00:00")]
+
+        async def send_message(chat_id, text):
+            if chat_id == 1:
+                raise Forbidden("bot was blocked by the user")
+            if chat_id == 2:
+                raise BadRequest("Chat not found")
+            if chat_id == 3:
+                raise RuntimeError("connection reset")
+
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(return_value=[True] * len(rows))
+        redis_client = MagicMock()
+        redis_client.pipeline.return_value = pipe
+        redis_client.delete = AsyncMock()
+        context = MagicMock()
+        context.bot.send_message = AsyncMock(side_effect=send_message)
+
+        with patch.object(handlers, "db_pool", fake_db_pool(rows)), \
+                patch.object(handlers, "redis_client", redis_client), \
+                patch.object(handlers, "expire_subscriptions_registry", AsyncMock(return_value=0)):
+            asyncio.run(handlers.check_subscriptions(context))
+
+        self.assertEqual(context.bot.send_message.await_count, 4)
+        redis_client.delete.assert_awaited_once_with("expiry_notice:3:2030-01-01 00:00:00")
+
+
+class TestExpiryIndex(unittest.TestCase):
+    """Индекс subscriptions:expiry: запись при активации и продлении, выборка истекающих, backfill"""
+
+    def setUp(self):
+        self.redis = connect_test_redis()
+        self.pipelines = []
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        self.redis.close()
+
+    def run_with_redis(self, scenario):
+        async def run():
+            pool = SQLitePool(os.path.join(self.temp_dir, "test.db"))
+            try:
+                async with pool.write() as db:
+                    await db.execute(
+                        "CREATE TABLE subscriptions (user_id INTEGER PRIMARY KEY, end_date TEXT, active INTEGER, "
+                        "trial_used INTEGER DEFAULT 0, auto_renewal INTEGER, lang TEXT, subtype TEXT)"
+                    )
+                plans = MagicMock()
+                plans.get = AsyncMock(return_value={"duration_days": 30, "price": 100})
+                async with subscription_redis(backfill_expiry_index) as client:
+                    with ExitStack() as stack:
+                        stack.enter_context(record_pipelines(client, self.pipelines))
+                        stack.enter_context(patch.object(subscription, "db_pool", pool))
+                        stack.enter_context(patch.object(subscription, "plan_catalog", plans))
+                        stack.enter_context(patch.object(
+                            subscription, "subscription_cache", SubscriptionStateCache(MagicMock(publish=AsyncMock()))
+                        ))
+                        return await scenario()
+            finally:
+                await pool.close()
+
+        return asyncio.run(run())
+
+    def test_activation_and_renewal_update_index(self):
+        """Активация добавляет пользователя в индекс с временем окончания, продление сдвигает его"""
+        async def scenario():
+            await subscription.activate_subscription(1, 101, "monthly")
+            activated = self.redis.zscore(subscription.EXPIRY_INDEX_KEY, 1)
+            await subscription.renew_subscription(1, 101, "monthly")
+            renewed = self.redis.zscore(subscription.EXPIRY_INDEX_KEY, 1)
+            return activated, renewed
+
+        started = time.time()
+        activated, renewed = self.run_with_redis(scenario)
+
+        self.assertAlmostEqual(activated, started + 30 * DAY, delta=60)
+        # Продление считается от даты окончания (без времени), а не от сегодня
+        self.assertGreater(renewed, started + 59 * DAY)
+        self.assertEqual(self.redis.hgetall(subscription.ACTIVE_PLAN_KEY), {"1": "monthly"})
+        self.assertEqual(self.redis.hgetall(subscription.PLAN_COUNTS_KEY), {"monthly": "1"})
+
+    def test_expiring_users_range_and_chat_ids(self):
+        """Берется только диапазон [now, now + hours]; chat_id читаются одним pipeline"""
+        now = time.time()
+        self.redis.zadd(subscription.EXPIRY_INDEX_KEY, {
+            "1": now + 3600, "2": now + 30 * 3600, "3": now - 3600, "4": now + 2 * 3600, "5": now + 5 * 3600,
+        })
+        for user_id in (1, 2, 3, 5):
+            self.redis.hset(f"user:{user_id}:info", "chat_id", 100 + user_id)
+
+        users = self.run_with_redis(lambda: subscription.get_users_with_expiring_tokens(24))
+
+        # У пользователя 4 нет chat_id — его пропускаем
+        self.assertEqual(users, [{"user_id": "1", "chat_id": 101}, {"user_id": "5", "chat_id": 105}])
+        self.assertEqual(self.pipelines, [["hget", "hget", "hget"]])
+
+    def test_no_expiring_users_skips_pipeline(self):
+        """Пустой диапазон не выполняет pipeline"""
+        self.assertEqual(self.run_with_redis(lambda: subscription.get_users_with_expiring_tokens(24)), [])
+        self.assertEqual(self.pipelines, [])
+
+    def test_backfill_indexes_tokens_with_ttl(self):
+        """Backfill индексирует токены с TTL по всем страницам SCAN; dry-run ничего не пишет"""
+        async def scenario():
+            self.redis.set("user:1:token", "t1", ex=2 * DAY)
+            self.redis.set("user:2:token", "t2", ex=10 * DAY)
+            self.redis.set("user:3:token", "t3")  # без TTL — не индексируется
+            self.redis.hset("user:2:info", "subscription_type", "monthly")
+            dry = await backfill_expiry_index.backfill_expiry_index(batch_size=1, dry_run=True)
+            dry_index = dict(self.redis.zrange(subscription.EXPIRY_INDEX_KEY, 0, -1, withscores=True))
+            indexed = await backfill_expiry_index.backfill_expiry_index(batch_size=1)
+            return dry, dry_index, indexed
+
+        started = time.time()
+        dry, dry_index, indexed = self.run_with_redis(scenario)
+
+        self.assertEqual((dry, dry_index, indexed), (2, {}, 2))
+        index = dict(self.redis.zrange(subscription.EXPIRY_INDEX_KEY, 0, -1, withscores=True))
+        self.assertEqual(sorted(index), ["1", "2"])
+        self.assertAlmostEqual(index["2"], started + 10 * DAY, delta=60)
+        self.assertEqual(self.redis.hgetall(subscription.ACTIVE_PLAN_KEY), {"1": "trial", "2": "monthly"})
+        self.assertEqual(self.redis.hgetall(subscription.PLAN_COUNTS_KEY), {"trial": "1", "monthly": "1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Тесты для каталога переводов
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from src.utils.i18n import LOCALES_DIR, Template, TranslationCatalog
+
+
+class TestTemplate(unittest.TestCase):
+    """Тесты для предразобранных шаблонов"""
+
+    def test_matches_str_format(self):
+        """Рендер совпадает с str.format, включая спецификаторы и экранирование"""
+        for source, kwargs in (
+            ("plain {{text}}", {}),
+            ("👤 {user_id}: {type}, {days:>3}", {"user_id": 1, "type": "month", "days": 5}),
+            ("{value!r} / {price:.2f}", {"value": "x", "price": 1.5}),
+        ):
+            self.assertEqual(Template(source).render(**kwargs), source.format(**kwargs))
+
+
+class TestTranslationCatalog(unittest.TestCase):
+    """Тесты для TranslationCatalog"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.write("en", {"greeting": "Hello, {name}!", "nested": {"only_en": "English only"}})
+        self.write("ru", {"greeting": "Привет, {name}!"})
+        self.catalog = TranslationCatalog(self.temp_dir)
+        self.catalog.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, lang, data):
+        with open(os.path.join(self.temp_dir, f"{lang}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def test_translate_and_fallback(self):
+        """Вложенные ключи разрешены, отсутствующие берутся из английского"""
+        self.assertEqual(self.catalog.translate("ru", "greeting", name="Иван"), "Привет, Иван!")
+        self.assertEqual(self.catalog.translate("ru", "nested.only_en"), "English only")
+        self.assertEqual(self.catalog.translate("de", "greeting", name="Hans"), "Hello, Hans!")
+        self.assertEqual(self.catalog.translate("ru", "missing.key"), "missing.key")
+
+    def test_resolve_lang(self):
+        """Код языка Telegram сводится к языку каталога"""
+        self.assertEqual(self.catalog.resolve_lang("ru-RU"), "ru")
+        self.assertEqual(self.catalog.resolve_lang("uk"), "en")
+        self.assertEqual(self.catalog.resolve_lang(None), "en")
+
+    def test_reload_on_change(self):
+        """Изменение файла обнаруживается и подхватывается перезагрузкой"""
+        self.assertFalse(self.catalog.changed())
+        self.write("ru", {"greeting": "Здравствуйте, {name}!"})
+        path = os.path.join(self.temp_dir, "ru.json")
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        self.assertTrue(self.catalog.changed())
+        self.catalog.load()
+        self.assertEqual(self.catalog.translate("ru", "greeting", name="Иван"), "Здравствуйте, Иван!")
+
+    def test_shipped_locales(self):
+        """Файлы локалей из репозитория загружаются в каталог"""
+        catalog = TranslationCatalog(LOCALES_DIR)
+        catalog.load()
+        with open(os.path.join(LOCALES_DIR, "ru.json"), encoding="utf-8") as f:
+            ru = json.load(f)
+        self.assertEqual(catalog.translate("ru", "subscription_expiring"), ru["subscription_expiring"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Тесты для очереди платежей (payment outbox)
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from telegram.error import BadRequest, Forbidden
+
+from src.handlers import handlers
+from src.utils.api_client import ApiError
+from src.utils.db import SQLitePool
+from src.utils.outbox import DrainReport, OutboxEntry, PaymentOutbox
+
+
+class FakeApi:
+    """Заглушка API: первые failures вызовов завершаются ошибкой status"""
+
+    def __init__(self, failures=0, status=503):
+        self.failures = failures
+        self.status = status
+        self.keys = []
+
+    async def post(self, path, json=None, headers=None):
+        self.keys.append(headers["Idempotency-Key"])
+        if len(self.keys) <= self.failures:
+            raise ApiError("unavailable", self.status)
+        return {"message": "ok"}
+
+
+class TestPaymentOutbox(unittest.TestCase):
+    """Тесты для PaymentOutbox"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "test.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_with_outbox(self, api, scenario):
+        async def run():
+            pool = SQLitePool(self.db_path)
+            outbox = PaymentOutbox(pool, api)
+            try:
+                await outbox.ensure_schema()
+                return await scenario(outbox, pool)
+            finally:
+                await pool.close()
+
+        return asyncio.run(run())
+
+    async def record(self, outbox, key, user_id=1):
+        return await outbox.record(key, user_id, user_id, "month", 100, False, "ru")
+
+    def test_record_is_idempotent(self):
+        """Повторная запись того же платежа не создает дубликат"""
+        async def scenario(outbox, pool):
+            first = await self.record(outbox, "charge-1")
+            second = await self.record(outbox, "charge-1")
+            return first.id == second.id, await outbox.backlog()
+
+        same, backlog = self.run_with_outbox(FakeApi(), scenario)
+        self.assertTrue(same)
+        self.assertEqual(backlog, 1)
+
+    def test_failed_delivery_is_drained_later(self):
+        """Недоставленный платеж остается в очереди и доставляется дренажем с тем же ключом"""
+        api = FakeApi(failures=1)
+
+        async def scenario(outbox, pool):
+            entry = await self.record(outbox, "charge-2")
+            self.assertFalse(await outbox.deliver(entry))
+            # Делаем запись готовой к повтору, не дожидаясь задержки
+            async with pool.write() as db:
+                await db.execute("UPDATE payment_outbox SET next_attempt_at = 0")
+            report = await outbox.drain()
+            return report
+
+        report = self.run_with_outbox(api, scenario)
+        self.assertEqual([entry.idempotency_key for entry in report.delivered], ["charge-2"])
+        self.assertEqual(report.backlog, 0)
+        self.assertEqual(api.keys, ["charge-2", "charge-2"])
+
+    def test_permanent_error_leaves_backlog(self):
+        """Ошибки 400 и отказ в авторизации (401/403) не повторяются"""
+        async def scenario(outbox, pool):
+            entry = await self.record(outbox, "charge-3")
+            await outbox.deliver(entry)
+            return await outbox.backlog()
+
+        for status in (400, 401, 403):
+            with self.subTest(status=status):
+                self.assertEqual(self.run_with_outbox(FakeApi(failures=1, status=status), scenario), 0)
+                os.remove(self.db_path)
+
+    def test_drain_delivers_backlog_in_batches(self):
+        """Накопившиеся платежи доставляются за один проход несколькими пачками"""
+        api = FakeApi()
+
+        async def scenario(outbox, pool):
+            for i in range(250):
+                await self.record(outbox, f"charge-{i}", user_id=i)
+            async with pool.write() as db:
+                await db.execute("UPDATE payment_outbox SET next_attempt_at = 0")
+            return await outbox.drain()
+
+        report = self.run_with_outbox(api, scenario)
+        self.assertEqual(len(report.delivered), 250)
+        self.assertEqual(report.backlog, 0)
+        self.assertEqual(len(set(api.keys)), 250)
+
+    def test_unnotified_delivery_is_picked_up(self):
+        """Доставленный платеж без уведомления (падение до отправки) возвращается дренажем"""
+        async def scenario(outbox, pool):
+            entry = await self.record(outbox, "charge-4")
+            self.assertTrue(await outbox.deliver(entry))
+            # Свежую доставку уведомляет обработчик платежа
+            self.assertEqual((await outbox.drain()).unnotified, [])
+            async with pool.write() as db:
+                await db.execute("UPDATE payment_outbox SET delivered_at = delivered_at - 60")
+            first = await outbox.drain()
+            await outbox.mark_notified([entry.id for entry in first.unnotified])
+            return first, await outbox.drain()
+
+        first, second = self.run_with_outbox(FakeApi(), scenario)
+        self.assertEqual([entry.idempotency_key for entry in first.unnotified], ["charge-4"])
+        self.assertEqual(second.unnotified, [])
+
+    def test_permanent_failure_is_reported_once(self):
+        """Окончательный отказ попадает в отчет дренажа с причиной, пока о нем не сообщили"""
+        async def scenario(outbox, pool):
+            entry = await self.record(outbox, "charge-5")
+            self.assertFalse(await outbox.deliver(entry))
+            first = await outbox.drain()
+            await outbox.mark_notified([entry.id for entry in first.failed])
+            return first, await outbox.drain()
+
+        first, second = self.run_with_outbox(FakeApi(failures=1, status=404), scenario)
+        self.assertEqual([entry.idempotency_key for entry in first.failed], ["charge-5"])
+        self.assertIn("unavailable", first.failed[0].last_error)
+        self.assertEqual(first.unnotified, [])
+        self.assertEqual(second.failed, [])
+
+
+
+class TestDrainPaymentOutbox(unittest.TestCase):
+    """Уведомления об активации из drain_payment_outbox"""
+
+    def test_blocked_users_are_not_retried(self):
+        """Неотправленные из-за временной ошибки ждут следующего прохода, Forbidden и BadRequest — нет"""
+        entries = [OutboxEntry(i, f"charge-{i}", i, i, "month", 100, False, "ru", 1) for i in (1, 2, 3, 4)]
+
+        async def send_message(chat_id, text, **kwargs):
+            if chat_id == 1:
+                raise Forbidden("bot was blocked by the user")
+            if chat_id == 2:
+                raise BadRequest("Chat not found")
+            if chat_id == 3:
+                raise RuntimeError("connection reset")
+
+        outbox = MagicMock()
+        outbox.drain = AsyncMock(return_value=DrainReport(delivered=entries[:2], unnotified=entries[2:]))
+        outbox.mark_notified = AsyncMock()
+        context = MagicMock()
+        context.bot.send_message = AsyncMock(side_effect=send_message)
+        with patch.object(handlers, "payment_outbox", outbox), \
+                patch.object(handlers, "_payment_success_text", AsyncMock(return_value="ok")):
+            asyncio.run(handlers.drain_payment_outbox(context))
+
+        outbox.mark_notified.assert_awaited_once_with([1, 2, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
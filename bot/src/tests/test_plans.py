@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Тесты для кэша каталога тарифов
+"""
+
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from src.tests.fake_redis import FakeRedis
+from src.utils.plans import CATALOG_CHANNEL, CATALOG_KEY, CATALOG_VERSION_KEY, PlanCatalog
+
+
+class TestPlanCatalog(unittest.TestCase):
+    """Тесты для PlanCatalog"""
+
+    def test_reads_are_served_from_memory(self):
+        """После загрузки чтения не обращаются к Redis"""
+        async def run():
+            client = FakeRedis()
+            catalog = PlanCatalog(client)
+            await catalog.upsert("month", 30, 100)
+            await catalog.get_all()
+            pipelines = len(client.pipelines)
+            with patch.object(client, "get", wraps=client.get) as get:
+                for _ in range(100):
+                    self.assertEqual((await catalog.get("month"))["price"], 100)
+            return get.await_count, len(client.pipelines) - pipelines
+
+        self.assertEqual(asyncio.run(run()), (0, 0))
+
+    def test_write_invalidates_and_publishes(self):
+        """create/delete публикуют событие и сбрасывают кэш"""
+        async def run():
+            client = FakeRedis()
+            catalog = PlanCatalog(client)
+            await catalog.upsert("month", 30, 100)
+            self.assertEqual(len(await catalog.get_all()), 1)
+            self.assertTrue(await catalog.delete("month"))
+            self.assertEqual(await catalog.get_all(), [])
+            self.assertFalse(await catalog.delete("month"))
+            return client.published
+
+        published = asyncio.run(run())
+        self.assertEqual(published[:2], [(CATALOG_CHANNEL, "month"), (CATALOG_CHANNEL, "month")])
+
+    def test_stale_version_is_reloaded(self):
+        """Изменение из другого процесса подхватывается по версии после max_age"""
+        async def run():
+            client = FakeRedis()
+            writer = PlanCatalog(client)
+            reader = PlanCatalog(client, max_age=0)
+            await writer.upsert("month", 30, 100)
+            self.assertEqual((await reader.get("month"))["price"], 100)
+            await writer.upsert("month", 30, 150)
+            return (await reader.get("month"))["price"]
+
+        self.assertEqual(asyncio.run(run()), 150)
+
+    def test_legacy_keys_are_migrated(self):
+        """Тарифы в старом формате subscription:{type} переносятся в каталог"""
+        async def run():
+            client = FakeRedis()
+            await client.hset("subscription:year", mapping={"duration_days": 365, "price": 900})
+            catalog = PlanCatalog(client)
+            plan = await catalog.get("year")
+            return plan, await client.get(CATALOG_VERSION_KEY), await client.hgetall(CATALOG_KEY)
+
+        plan, version, raw = asyncio.run(run())
+        self.assertEqual(plan, {"type": "year", "duration_days": 365, "price": 900})
+        self.assertEqual(version, "1")
+        self.assertIn("year", raw)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Тесты для конкурентной отправки сообщений с учетом лимитов Telegram
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from telegram.error import Forbidden, RetryAfter
+
+from src.utils.sender import RateLimitedSender, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Тесты для TokenBucket"""
+
+    def test_rate_is_respected(self):
+        """Сверх начального запаса токены выдаются с заданной частотой"""
+        async def run():
+            bucket = TokenBucket(rate=50, capacity=5)
+            started = time.monotonic()
+            for _ in range(15):
+                await bucket.acquire()
+            return time.monotonic() - started
+
+        elapsed = asyncio.run(run())
+        # 5 токенов из запаса, еще 10 — со скоростью 50/с
+        self.assertGreaterEqual(elapsed, 0.18)
+
+    def test_pause(self):
+        """После pause() токены не выдаются до окончания паузы"""
+        async def run():
+            bucket = TokenBucket(rate=1000)
+            bucket.pause(0.1)
+            started = time.monotonic()
+            await bucket.acquire()
+            return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.09)
+
+
+class TestRateLimitedSender(unittest.TestCase):
+    """Тесты для RateLimitedSender"""
+
+    def test_send_many_with_retry_after_and_forbidden(self):
+        """RetryAfter повторяется, Forbidden — нет"""
+        bot = MagicMock()
+        calls = {"retry": 0}
+
+        async def send_message(chat_id, text):
+            if chat_id == 2 and calls["retry"] == 0:
+                calls["retry"] += 1
+                raise RetryAfter(0)
+            if chat_id == 3:
+                raise Forbidden("bot was blocked by the user")
+
+        bot.send_message = AsyncMock(side_effect=send_message)
+
+        async def run():
+            sender = RateLimitedSender(bot, limiter=TokenBucket(rate=1000))
+            return await sender.send_many([(1, "a"), (2, "b"), (3, "c")])
+
+        report = asyncio.run(run())
+
+        self.assertEqual(report.sent, 2)
+        self.assertEqual(report.failed, 1)
+        self.assertEqual(report.retries, 1)
+        self.assertEqual(report.failed_chat_ids, [3])
+        self.assertEqual(report.undeliverable_chat_ids, [3])
+        self.assertEqual(bot.send_message.await_count, 4)
+        self.assertGreater(report.throughput, 0)
+
+    def test_send_file_uploads_once(self):
+        """Файл загружается один раз, остальным чатам уходит file_id; сбой загрузки переходит к следующему чату"""
+        bot = MagicMock()
+        uploads = []
+
+        async def send_document(chat_id, document, **kwargs):
+            if isinstance(document, str):
+                return MagicMock()
+            uploads.append(chat_id)
+            if chat_id == 1:
+                raise Forbidden("bot was blocked by the user")
+            message = MagicMock()
+            message.document.file_id = "uploaded-file-id"
+            return message
+
+        bot.send_document = AsyncMock(side_effect=send_document)
+
+        with tempfile.NamedTemporaryFile(suffix=".db.gz", delete=False) as f:
+            f.write(b"backup")
+        try:
+            async def run():
+                sender = RateLimitedSender(bot, limiter=TokenBucket(rate=1000))
+                return await sender.send_file_to_many([1, 2, 3, 4], f.name, caption="backup")
+
+            report = asyncio.run(run())
+        finally:
+            os.remove(f.name)
+
+        self.assertEqual(uploads, [1, 2])
+        # Неудачная загрузка в чат 1 тоже считается попыткой
+        self.assertEqual(report.uploads, 2)
+        self.assertEqual(report.file_id, "uploaded-file-id")
+        self.assertEqual(report.sent, 3)
+        self.assertEqual(report.failed_chat_ids, [1])
+        self.assertEqual(report.deliveries[2], "uploaded")
+        self.assertEqual(report.deliveries[3], "file_id")
+        self.assertTrue(report.deliveries[1].startswith("failed"))
+        forwarded = [c.kwargs["document"] for c in bot.send_document.call_args_list if c.kwargs["chat_id"] in (3, 4)]
+        self.assertEqual(forwarded, ["uploaded-file-id", "uploaded-file-id"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Тесты для параллельной обработки обновлений с порядком по пользователю
+"""
+
+import asyncio
+import unittest
+
+from telegram import Update
+
+from src.utils.metrics import metrics
+from src.utils.update_processor import OrderedUpdateProcessor, update_label
+
+
+def make_update(update_id, user_id, text):
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }, None)
+
+
+class TestOrderedUpdateProcessor(unittest.TestCase):
+    """Тесты для OrderedUpdateProcessor"""
+
+    def run_updates(self, processor, updates, delays):
+        """Обрабатывает обновления как Application (задача на каждое), возвращает порядок завершения"""
+        finished = []
+        state = {"running": 0, "peak": 0}
+
+        async def handle(update):
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            await asyncio.sleep(delays.get(update.update_id, 0.01))
+            state["running"] -= 1
+            finished.append(update.update_id)
+
+        async def run():
+            await asyncio.gather(*(
+                asyncio.create_task(processor.process_update(update, handle(update)))
+                for update in updates
+            ))
+
+        asyncio.run(run())
+        return finished, state["peak"]
+
+    def test_same_user_is_ordered_and_others_run_in_parallel(self):
+        """Медленный платеж пользователя не задерживает других и не переставляется с его /status"""
+        updates = [
+            make_update(1, 100, "/subscribe"),
+            make_update(2, 100, "/status"),
+            make_update(3, 200, "/status"),
+            make_update(4, 300, "/help"),
+        ]
+        finished, _ = self.run_updates(OrderedUpdateProcessor(4), updates, {1: 0.2})
+
+        self.assertLess(finished.index(3), finished.index(1))
+        self.assertLess(finished.index(4), finished.index(1))
+        self.assertLess(finished.index(1), finished.index(2))
+
+    def test_concurrency_limit(self):
+        """Одновременно обрабатывается не больше concurrency обновлений"""
+        updates = [make_update(i, 1000 + i, "/status") for i in range(20)]
+        finished, peak = self.run_updates(OrderedUpdateProcessor(3), updates, {})
+
+        self.assertEqual(len(finished), 20)
+        self.assertEqual(peak, 3)
+
+    def test_burst_from_one_user_does_not_block_others(self):
+        """Пачка обновлений одного пользователя не занимает все слоты"""
+        updates = [make_update(i, 100, "/status") for i in range(10)] + [make_update(99, 200, "/help")]
+        finished, _ = self.run_updates(OrderedUpdateProcessor(2), updates, {})
+
+        self.assertEqual([i for i in finished if i != 99], list(range(10)))
+        self.assertLess(finished.index(99), 3)
+        self.assertGreaterEqual(metrics.latency("update /help").count, 1)
+
+    def test_update_label(self):
+        self.assertEqual(update_label(make_update(1, 1, "/status@FindMyLinkBot extra")), "/status")
+        self.assertEqual(update_label(make_update(1, 1, "hello")), "message")
+
+
+if __name__ == "__main__":
+    unittest.main()
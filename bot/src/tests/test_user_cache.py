@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Тесты для кэша состояния подписки пользователя
+"""
+
+import asyncio
+import json
+import time
+import unittest
+
+from src.tests.fake_redis import FakeRedis
+from src.utils.user_cache import SUBSCRIPTION_INVALIDATION_CHANNEL, SubscriptionStateCache
+
+
+class TestSubscriptionStateCache(unittest.TestCase):
+    """Тесты для SubscriptionStateCache"""
+
+    def setUp(self):
+        self.cache = SubscriptionStateCache(FakeRedis(), ttl=30, max_size=2)
+
+    def test_hit_returns_copy(self):
+        """Повторный запрос обслуживается из кэша, изменение копии не портит запись"""
+        self.assertEqual(self.cache.get(1), (False, None))
+        self.cache.set(1, {"active": True}, self.cache.epoch)
+
+        found, state = self.cache.get(1)
+        self.assertTrue(found)
+        state["active"] = False
+        self.assertEqual(self.cache.get(1), (True, {"active": True}))
+        self.assertAlmostEqual(self.cache.hit_ratio, 2 / 3)
+
+    def test_missing_subscription_is_cached(self):
+        """Отсутствие подписки тоже кэшируется"""
+        self.cache.set(1, None, self.cache.epoch)
+        self.assertEqual(self.cache.get(1), (True, None))
+
+    def test_ttl_expiry(self):
+        self.cache.ttl = 0.01
+        self.cache.set(1, {"active": True}, self.cache.epoch)
+        time.sleep(0.02)
+        self.assertEqual(self.cache.get(1), (False, None))
+
+    def test_stale_read_is_not_cached(self):
+        """Состояние, прочитанное до сброса, в кэш не попадает"""
+        epoch = self.cache.epoch
+        self.cache.invalidate(1)
+        self.cache.set(1, {"active": False}, epoch)
+        self.assertEqual(self.cache.get(1), (False, None))
+
+    def test_lru_eviction(self):
+        for user_id in (1, 2):
+            self.cache.set(user_id, {"user_id": user_id}, self.cache.epoch)
+        self.cache.get(1)
+        self.cache.set(3, {"user_id": 3}, self.cache.epoch)
+        self.assertTrue(self.cache.get(1)[0])
+        self.assertFalse(self.cache.get(2)[0])
+
+    def test_publish_and_message(self):
+        """publish сбрасывает запись локально и рассылает user_id другим процессам"""
+        self.cache.set(1, {"active": True}, self.cache.epoch)
+        self.cache.set(2, {"active": True}, self.cache.epoch)
+        asyncio.run(self.cache.publish(1))
+        self.assertFalse(self.cache.get(1)[0])
+        self.assertEqual(self.cache.client.published, [(SUBSCRIPTION_INVALIDATION_CHANNEL, json.dumps([1]))])
+
+        self.cache._handle_message(json.dumps([2]))
+        self.assertFalse(self.cache.get(2)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
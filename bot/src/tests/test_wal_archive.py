@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Тесты для архивации WAL и восстановления на момент времени
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from src.utils.backup import BackupManager
+from src.utils.db import SQLitePool
+from src.utils.wal_archive import WalArchiver, list_segments, read_segment_header, restore_to_time
+
+
+class _OnlyBackup:
+    """Менеджер бэкапов, в каталоге которого виден только один бэкап"""
+
+    def __init__(self, manager, path):
+        self.manager = manager
+        self.path = path
+
+    def get_backup_files(self):
+        return [self.path]
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+
+class TestWalArchive(unittest.TestCase):
+    """Тесты для WalArchiver и restore_to_time"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.database_path = os.path.join(self.temp_dir, "test.db")
+        self.backup_dir = os.path.join(self.temp_dir, "backups")
+        self.archive_dir = os.path.join(self.backup_dir, "wal")
+        self.restored_path = os.path.join(self.temp_dir, "restored.db")
+        self.manager = BackupManager(database_path=self.database_path, backup_dir=self.backup_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def count_rows(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM purchases").fetchone()[0]
+        finally:
+            conn.close()
+
+    def run_workload(self, checkpoint_pages):
+        """База с архиватором: бэкап, затем три порции покупок; возвращает моменты сегментов"""
+        async def run():
+            pool = SQLitePool(self.database_path)
+            archiver = WalArchiver(pool, self.archive_dir, checkpoint_pages=checkpoint_pages)
+
+            async def buy(start):
+                for i in range(start, start + 100):
+                    async with pool.write() as db:
+                        await db.execute("INSERT INTO purchases (id, amount) VALUES (?, ?)", (i, i * 10))
+
+            try:
+                async with pool.write() as db:
+                    await db.execute("CREATE TABLE purchases (id INTEGER PRIMARY KEY, amount INTEGER)")
+                await archiver.archive()
+                self.assertTrue(self.manager.create_backup()[0])
+
+                moments = []
+                for batch in range(3):
+                    await buy(batch * 100)
+                    segment = await archiver.archive()
+                    moments.append(datetime.fromtimestamp(segment.archived_at))
+                    await asyncio.sleep(0.01)
+                return moments
+            finally:
+                await archiver.stop()
+                await pool.close()
+
+        return asyncio.run(run())
+
+    def test_restore_to_point_in_time(self):
+        """База восстанавливается на момент между сегментами, после бэкапа"""
+        moments = self.run_workload(checkpoint_pages=100000)
+
+        restore_to_time(moments[1], self.restored_path, self.archive_dir, self.manager)
+        self.assertEqual(self.count_rows(self.restored_path), 200)
+
+        restore_to_time(None, self.restored_path, self.archive_dir, self.manager)
+        self.assertEqual(self.count_rows(self.restored_path), 300)
+
+    def test_archive_survives_checkpoints(self):
+        """Кадры не теряются, когда архиватор переносит WAL в базу после каждого прохода"""
+        moments = self.run_workload(checkpoint_pages=1)
+        self.assertGreaterEqual(len(list_segments(self.archive_dir)), 3)
+
+        restore_to_time(moments[0], self.restored_path, self.archive_dir, self.manager)
+        self.assertEqual(self.count_rows(self.restored_path), 100)
+        restore_to_time(moments[2], self.restored_path, self.archive_dir, self.manager)
+        self.assertEqual(self.count_rows(self.restored_path), 300)
+
+    def run_with_external_writer(self, external):
+        """Бэкап, покупки бота и записи "API" из отдельного соединения; external(api, archiver, pool)"""
+        async def run():
+            pool = SQLitePool(self.database_path)
+            archiver = WalArchiver(pool, self.archive_dir, checkpoint_pages=1, manager=self.manager)
+            api = sqlite3.connect(self.database_path, isolation_level=None)
+            try:
+                async with pool.write() as db:
+                    await db.execute("CREATE TABLE purchases (id INTEGER PRIMARY KEY, amount INTEGER)")
+                    await db.execute("INSERT INTO purchases (id, amount) VALUES (1, 10)")
+                await archiver.archive()
+                self.assertTrue(self.manager.create_backup()[0])
+                await asyncio.sleep(0.01)
+                await external(api, archiver, pool)
+                async with pool.write() as db:
+                    await db.execute("INSERT INTO purchases (id, amount) VALUES (3, 30)")
+                await archiver.archive()
+            finally:
+                api.close()
+                await archiver.stop()
+                await pool.close()
+
+        asyncio.run(run())
+
+    def test_commit_between_copy_and_checkpoint_is_shipped(self):
+        """Коммит другого процесса между копированием и checkpoint досылается в архив"""
+        async def external(api, archiver, pool):
+            async with pool.write() as db:
+                await asyncio.to_thread(archiver._ship)
+                api.execute("INSERT INTO purchases (id, amount) VALUES (2, 20)")
+                await archiver._checkpoint(db)
+            self.assertTrue(archiver._sealed)
+
+        self.run_with_external_writer(external)
+        self.assertFalse(any(read_segment_header(p).get("gap") for p in list_segments(self.archive_dir)))
+        self.assertEqual(len(self.manager.get_backup_files()), 1)
+        restore_to_time(None, self.restored_path, self.archive_dir, self.manager)
+        self.assertEqual(self.count_rows(self.restored_path), 3)
+
+    def test_foreign_checkpoint_forces_new_base(self):
+        """WAL, перезапущенный чужим checkpoint, — разрыв архива и новый базовый бэкап"""
+        async def external(api, archiver, pool):
+            # Как автоматический checkpoint API: неотправленный коммит уходит в базу мимо архива
+            api.execute("INSERT INTO purchases (id, amount) VALUES (2, 20)")
+            api.execute("PRAGMA wal_checkpoint(RESTART)")
+            # Имя бэкапа — с точностью до секунды
+            await asyncio.sleep(1)
+
+        # Старый бэкап нужен для проверки разрыва
+        with patch.object(self.manager, "apply_retention"):
+            self.run_with_external_writer(external)
+        gaps = [p for p in list_segments(self.archive_dir) if read_segment_header(p).get("gap")]
+        self.assertEqual(len(gaps), 1)
+        self.assertEqual(len(self.manager.get_backup_files()), 2)
+
+        restore_to_time(None, self.restored_path, self.archive_dir, self.manager)
+        self.assertEqual(self.count_rows(self.restored_path), 3)
+        # Старый бэкап с сегментами через разрыв дал бы базу без покупки 2
+        gap_at = datetime.fromtimestamp(read_segment_header(gaps[0])["archived_at"])
+        old_base = self.manager.get_backup_files()[-1]
+        self.assertLess(datetime.fromisoformat(self.manager.read_manifest(old_base)["created_at"]), gap_at)
+        with self.assertRaises(ValueError):
+            restore_to_time(gap_at, self.restored_path, self.archive_dir, _OnlyBackup(self.manager, old_base))
+
+    def test_segment_archived_during_snapshot_is_not_applied_over_it(self):
+        """Момент между окончанием снимка и следующим сегментом — только снимок, без отката страниц"""
+        async def run():
+            pool = SQLitePool(self.database_path)
+            archiver = WalArchiver(pool, self.archive_dir, checkpoint_pages=100000, manager=self.manager)
+            api = sqlite3.connect(self.database_path, isolation_level=None)
+            online_backup = self.manager._online_backup
+
+            def snapshot_with_commit(target_path):
+                # Сегмент снят во время снимка (страница с 20), затем страница меняется еще раз
+                archiver._ship()
+                api.execute("UPDATE purchases SET amount = 30 WHERE id = 1")
+                return online_backup(target_path)
+
+            try:
+                async with pool.write() as db:
+                    await db.execute("CREATE TABLE purchases (id INTEGER PRIMARY KEY, amount INTEGER)")
+                    await db.execute("INSERT INTO purchases (id, amount) VALUES (1, 10)")
+                await archiver.archive()
+                api.execute("UPDATE purchases SET amount = 20 WHERE id = 1")
+                with patch.object(self.manager, "_online_backup", snapshot_with_commit):
+                    self.assertTrue(self.manager.create_backup()[0])
+                return datetime.now()
+            finally:
+                api.close()
+                await archiver.stop()
+                await pool.close()
+
+        target = asyncio.run(run())
+        manifest = self.manager.read_manifest(self.manager.get_backup_files()[0])
+        during = [
+            read_segment_header(p)["archived_at"] for p in list_segments(self.archive_dir)
+            if manifest["started_at"] <= read_segment_header(p)["archived_at"] <= manifest["finished_at"]
+        ]
+        self.assertEqual(len(during), 1)
+
+        for moment in (target, None):
+            restore_to_time(moment, self.restored_path, self.archive_dir, self.manager)
+            conn = sqlite3.connect(self.restored_path)
+            try:
+                self.assertEqual(conn.execute("SELECT amount FROM purchases WHERE id = 1").fetchone()[0], 30)
+            finally:
+                conn.close()
+
+    def test_restore_before_first_backup_fails(self):
+        """Без бэкапа до нужного момента восстановление невозможно"""
+        self.run_workload(checkpoint_pages=100000)
+        with self.assertRaises(FileNotFoundError):
+            restore_to_time(datetime(2000, 1, 1), self.restored_path, self.archive_dir, self.manager)
+
+
+if __name__ == "__main__":
+    unittest.main()
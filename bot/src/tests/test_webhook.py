@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Тесты для ASGI-эндпоинта вебхука Telegram
+"""
+
+import asyncio
+import json
+import unittest
+
+from telegram import Update
+from telegram.ext import Application
+
+from src.webhook import create_webhook_app
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 10,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "/status",
+    },
+}
+
+
+class TestWebhookApp(unittest.TestCase):
+    """Тесты для create_webhook_app"""
+
+    def setUp(self):
+        self.application = Application.builder().token("123456:TEST").updater(None).build()
+        self.app = create_webhook_app(self.application, "secret")
+
+    def post(self, body, secret=b"secret", path="/telegram/webhook", method="POST"):
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "headers": [(b"x-telegram-bot-api-secret-token", secret)],
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.app(scope, receive, send))
+        return sent[0]["status"]
+
+    def test_valid_update_is_queued(self):
+        """Обновление с верным секретом попадает в очередь Application"""
+        self.assertEqual(self.post(json.dumps(UPDATE).encode()), 200)
+        update = self.application.update_queue.get_nowait()
+        self.assertIsInstance(update, Update)
+        self.assertEqual(update.message.text, "/status")
+
+    def test_wrong_secret_is_rejected(self):
+        """Запрос без верного секрета отклоняется и не попадает в очередь"""
+        self.assertEqual(self.post(json.dumps(UPDATE).encode(), secret=b"wrong"), 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    def test_bad_requests(self):
+        """Чужой путь, другой метод и битый JSON"""
+        self.assertEqual(self.post(b"{}", path="/other"), 404)
+        self.assertEqual(self.post(b"", method="GET"), 405)
+        self.assertEqual(self.post(b"not json"), 400)
+        self.assertTrue(self.application.update_queue.empty())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Заполнение индекса subscriptions:expiry и реестра активных подписок
+по существующим ключам user:*:token
+
+Разовая миграция для данных, созданных до появления индекса: один проход SCAN,
+TTL и типы подписок запрашиваются пачками через pipeline. Повторный запуск безопасен.
+
+Запуск:
+    uv run -m src.tools.backfill_expiry_index [--batch 500] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from src.utils.subscription import r, register_active_subscription
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill_expiry_index(batch_size: int = 500, dry_run: bool = False) -> int:
+    """Проиндексировать все токены с TTL; возвращает количество записей"""
+    indexed = 0
+    cursor = 0
+    while True:
+        cursor, keys = await r.scan(cursor=cursor, match="user:*:token", count=batch_size)
+        if keys:
+            pipe = r.pipeline(transaction=False)
+            for key in keys:
+                pipe.ttl(key)
+                pipe.hget(f"user:{key.split(':')[1]}:info", "subscription_type")
+            values = await pipe.execute()
+
+            now = time.time()
+            pipe = r.pipeline(transaction=False)
+            batch = 0
+            for i, key in enumerate(keys):
+                ttl, plan = values[2 * i], values[2 * i + 1] or "trial"
+                if ttl > 0:
+                    await register_active_subscription(key.split(":")[1], plan, now + ttl, client=pipe)
+                    batch += 1
+            if batch and not dry_run:
+                await pipe.execute()
+            indexed += batch
+        if cursor == 0:
+            break
+    return indexed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Backfill subscriptions:expiry index and active registry")
+    parser.add_argument("--batch", type=int, default=500, help="SCAN COUNT / pipeline size")
+    parser.add_argument("--dry-run", action="store_true", help="Only count keys")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    indexed = await backfill_expiry_index(args.batch, args.dry_run)
+    logger.info(
+        f"{'Would index' if args.dry_run else 'Indexed'} {indexed} subscriptions "
+        f"in {time.monotonic() - started:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Optional
+import aiohttp
+from src.configs.config import config
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_CONNECT_TIMEOUT = 3.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_POOL_SIZE = 20
+# Базовая и максимальная задержка между повторами (full jitter)
+BACKOFF_BASE = 0.2
+BACKOFF_CAP = 2.0
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class ApiError(Exception):
+    """Ответ API с ошибкой или исчерпанный бюджет времени/повторов"""
+
+    def __init__(self, message: str, status: Optional[int] = None, body: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+class ApiClient:
+    """Общий HTTP-клиент бота для обращений к API
+
+    Одна ClientSession с пулом keep-alive соединений на все время работы
+    Application. У каждого вызова общий бюджет времени на все попытки;
+    повторы с jitter выполняются только для идемпотентных запросов
+    (метод из IDEMPOTENT_METHODS или заголовок Idempotency-Key).
+    """
+
+    def __init__(self, base_url: Optional[str] = None):
+        self._base_url = base_url
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def base_url(self) -> str:
+        return (self._base_url or config.api.url or "").rstrip("/")
+
+    async def start(self) -> None:
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=config.api.pool_size or DEFAULT_POOL_SIZE,
+            ttl_dns_cache=300,
+            keepalive_timeout=30,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=config.api.timeout or DEFAULT_TIMEOUT,
+                connect=config.api.connect_timeout or DEFAULT_CONNECT_TIMEOUT,
+            ),
+        )
+        logger.info(f"API client started for {self.base_url}")
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            logger.info("API client closed")
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        json: Any = None,
+        headers: Optional[dict] = None,
+        timeout: Optional[float] = None,
+        idempotent: Optional[bool] = None,
+        max_retries: Optional[int] = None,
+    ) -> Any:
+        """Выполнить запрос и вернуть JSON ответа; при ошибке — ApiError"""
+        if self._session is None:
+            await self.start()
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS or "Idempotency-Key" in (headers or {})
+        retries = (max_retries if max_retries is not None else config.api.max_retries or DEFAULT_MAX_RETRIES) if idempotent else 0
+        budget = timeout or config.api.timeout or DEFAULT_TIMEOUT
+        deadline = time.monotonic() + budget
+        metric = f"api {method} {path}"
+
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ApiError(f"{method} {path}: timeout budget {budget}s exhausted")
+            started = time.perf_counter()
+            try:
+                async with self._session.request(
+                    method,
+                    f"{self.base_url}{path}",
+                    json=json,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=remaining),
+                ) as response:
+                    body = await response.text()
+                    metrics.latency(metric).observe(time.perf_counter() - started, error=not response.ok)
+                    if response.ok:
+                        return await response.json(content_type=None) if body else None
+                    if response.status not in RETRY_STATUSES or attempt >= retries:
+                        raise ApiError(f"{method} {path}: HTTP {response.status}", response.status, body)
+                    logger.warning(f"{method} {path}: HTTP {response.status}, retrying")
+            except ApiError:
+                raise
+            except aiohttp.ClientConnectorError as e:
+                # Соединение не установлено — запрос не ушел, повтор безопасен и для POST
+                metrics.latency(metric).observe(time.perf_counter() - started, error=True)
+                if attempt >= max(retries, 1):
+                    raise ApiError(f"{method} {path}: {e}") from e
+                logger.warning(f"{method} {path}: connection failed ({e}), retrying")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.latency(metric).observe(time.perf_counter() - started, error=True)
+                if attempt >= retries:
+                    raise ApiError(f"{method} {path}: {e!r}") from e
+                logger.warning(f"{method} {path}: {e!r}, retrying")
+
+            attempt += 1
+            metrics.incr("api retries")
+            await asyncio.sleep(min(self.backoff(attempt), max(0.0, deadline - time.monotonic())))
+
+    async def get(self, path: str, **kwargs) -> Any:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> Any:
+        return await self.request("POST", path, **kwargs)
+
+
+# Создаем глобальный HTTP-клиент API
+api_client = ApiClient()
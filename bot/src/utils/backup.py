@@ -1,21 +1,433 @@
+import io
 import os
+import re
+import gzip
+import json
+import struct
+import time
+import asyncio
+import hashlib
 import shutil
+import sqlite3
 import logging
+from dataclasses import dataclass, asdict, field
 from datetime import datetime
 from glob import glob
 from typing import Optional, List, Tuple
+from telegram.error import TelegramError
 from src.configs.config import config
 
+try:
+    import zstandard
+except ImportError:  # zstd не обязателен, без него бэкапы сжимаются gzip
+    zstandard = None
+
 logger = logging.getLogger(__name__)
 
+BACKUP_PREFIX = "subscriptions_backup_"
+# Расширения файлов бэкапа: инкрементальные, полные сжатые и старые несжатые копии
+DELTA_EXTENSIONS = (".db.delta.zst", ".db.delta.gz")
+BACKUP_EXTENSIONS = DELTA_EXTENSIONS + (".db.zst", ".db.gz", ".db")
+MANIFEST_EXTENSION = ".json"
+# Индекс хэшей страниц полного снимка (только локально, для построения инкрементов)
+PAGE_INDEX_EXTENSION = ".idx"
+PAGE_HASH_SIZE = 16
+DELTA_MAGIC = b"FMLDELTA1\n"
+# Полный снимок делается не реже раза в N дней или если инкремент больше доли базы
+DEFAULT_FULL_INTERVAL_DAYS = 7
+MAX_DELTA_RATIO = 0.5
+# Страниц SQLite за один шаг онлайн-бэкапа и пауза между шагами, чтобы не задерживать писателей
+BACKUP_STEP_PAGES = 256
+BACKUP_STEP_SLEEP = 0.005
+CHUNK_SIZE = 1024 * 1024
+# Каталог бэкапов (SQLite в каталоге бэкапов) вместо обхода директории при каждом запросе
+CATALOG_NAME = "catalog.sqlite"
+# Изменения директории в пределах этого окна могли не изменить ее mtime — пересканируем
+CATALOG_RACY_WINDOW_NS = 2_000_000_000
+# Ротация "дед-отец-сын" по умолчанию: последние дни, недели и месяцы
+DEFAULT_KEEP_DAILY = 7
+DEFAULT_KEEP_WEEKLY = 4
+DEFAULT_KEEP_MONTHLY = 12
+# Контрольная сумма в подписи к бэкапу, отправленному админам
+CAPTION_SHA256_RE = re.compile(r"SHA256: ([0-9a-f]{64})")
+# Период опроса event loop при замере его блокировки
+LOOP_LAG_INTERVAL = 0.01
+
+
+def backup_date_from_name(filename: str) -> Optional[datetime]:
+    """Дата из имени subscriptions_backup_YYYYMMDD[_HHMMSS].db[.delta][.gz|.zst]"""
+    name = os.path.basename(filename)
+    for ext in BACKUP_EXTENSIONS:
+        if name.startswith(BACKUP_PREFIX) and name.endswith(ext):
+            date_str = name[len(BACKUP_PREFIX):-len(ext)]
+            for fmt in ("%Y%m%d_%H%M%S", "%Y%m%d"):
+                try:
+                    return datetime.strptime(date_str, fmt)
+                except ValueError:
+                    continue
+            return None
+    return None
+
+
+def manifest_path_for(backup_path: str) -> str:
+    return backup_path + MANIFEST_EXTENSION
+
+
+def is_delta_backup(path: str) -> bool:
+    return path.endswith(DELTA_EXTENSIONS)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def page_size_of(path: str) -> int:
+    """Размер страницы SQLite из заголовка файла базы"""
+    with open(path, "rb") as f:
+        header = f.read(100)
+    if len(header) < 100 or not header.startswith(b"SQLite format 3\x00"):
+        raise ValueError(f"{path} is not an SQLite database")
+    size = struct.unpack(">H", header[16:18])[0]
+    return 65536 if size == 1 else size
+
+
+def page_hashes(path: str, page_size: int) -> Tuple[List[bytes], str, int]:
+    """Хэши всех страниц базы, sha256 и размер файла за один проход"""
+    hashes = []
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for page in iter(lambda: f.read(page_size), b""):
+            hashes.append(hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest())
+            digest.update(page)
+            size += len(page)
+    return hashes, digest.hexdigest(), size
+
+
+def preferred_compression() -> Tuple[str, str]:
+    """Алгоритм сжатия и расширение файла: zstd, если установлен, иначе gzip"""
+    if zstandard is not None:
+        return "zstd", ".zst"
+    return "gzip", ".gz"
+
+
+def open_compressed(path: str, algorithm: str):
+    if algorithm == "zstd":
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, "wb"), closefd=True)
+    return gzip.open(path, "wb", compresslevel=6)
+
+
+def open_backup_for_read(path: str):
+    """Открыть бэкап любого формата как поток несжатых байт"""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to restore .zst backups")
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        )
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+@dataclass
+class BackupReport:
+    """Итоги создания бэкапа (сохраняется в манифест рядом с файлом)"""
+
+    file: str
+    algorithm: str
+    type: str
+    sha256: str
+    raw_sha256: str
+    raw_size: int
+    size: int
+    pages: int
+    created_at: str
+    duration: float
+    page_size: Optional[int] = None
+    # Unix-время начала и окончания снимка (для сопоставления с архивом WAL)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Для инкремента: полный снимок, от которого он построен, и число измененных страниц
+    base: Optional[str] = None
+    base_raw_sha256: Optional[str] = None
+    changed_pages: Optional[int] = None
+    # Максимальная задержка event loop во время бэкапа, мс (только для create_backup_async)
+    loop_blocked_ms: Optional[float] = None
+
+    @property
+    def ratio(self) -> float:
+        """Доля размера сжатого файла от исходного"""
+        return self.size / self.raw_size if self.raw_size else 0.0
+
+    def summary(self) -> str:
+        blocked = f", loop blocked {self.loop_blocked_ms:.1f}ms" if self.loop_blocked_ms is not None else ""
+        delta = f", {self.changed_pages}/{self.pages} pages changed since {self.base}" if self.base else ""
+        return (
+            f"{self.file}: {self.raw_size} -> {self.size} bytes ({self.ratio:.0%}, {self.algorithm}{delta}) "
+            f"in {self.duration:.2f}s{blocked}"
+        )
+
+
+@dataclass
+class BackupCandidate:
+    """Бэкап в чате с админом, найденный только по метаданным сообщения"""
+
+    admin_id: int
+    file_id: str
+    file_name: str
+    created_at: datetime
+    size: int
+    sha256: Optional[str]
+
+    @property
+    def rank(self) -> Tuple[datetime, int]:
+        return self.created_at, self.size
+
+
+def backup_candidates(messages, admin_ids) -> List[BackupCandidate]:
+    """Полные бэкапы из сообщений админов, от самого свежего и крупного"""
+    candidates = {}
+    for message in messages:
+        if not message or message.chat.id not in admin_ids or not message.document:
+            continue
+        document = message.document
+        name = document.file_name
+        # Инкремент без своего полного снимка восстановить нельзя
+        if not name or is_delta_backup(name):
+            continue
+        created_at = backup_date_from_name(name)
+        if created_at is None:
+            continue
+        match = CAPTION_SHA256_RE.search(message.caption) if isinstance(message.caption, str) else None
+        candidate = BackupCandidate(
+            admin_id=message.chat.id,
+            file_id=document.file_id,
+            file_name=name,
+            created_at=created_at,
+            size=document.file_size or 0,
+            sha256=match.group(1) if match else None,
+        )
+        # Один и тот же бэкап разослан нескольким админам — достаточно одной копии
+        if name not in candidates or (candidate.sha256 and not candidates[name].sha256):
+            candidates[name] = candidate
+    return sorted(candidates.values(), key=lambda c: c.rank, reverse=True)
+
+
+@dataclass
+class CatalogEntry:
+    """Бэкап в каталоге"""
+
+    path: str
+    created_at: datetime
+    size: int
+    mtime: float
+    sha256: Optional[str]
+    type: str
+    base: Optional[str]
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+
+class BackupCatalog:
+    """Индекс бэкапов в SQLite: дата, размер, контрольная сумма, тип и база инкремента
+
+    Директория сканируется, только если изменилось ее mtime (или изменение
+    было недавно и могло в него не попасть); бэкапы, созданные самим
+    менеджером, добавляются в каталог сразу.
+    """
+
+    def __init__(self, backup_dir: str):
+        self.backup_dir = backup_dir
+        self._scanned: Optional[Tuple[int, int]] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(os.path.join(self.backup_dir, CATALOG_NAME))
+        # Журнал в памяти: файл -journal не меняет mtime директории; каталог всегда можно пересобрать
+        conn.execute("PRAGMA journal_mode=MEMORY")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS backups (name TEXT PRIMARY KEY, created_at TEXT NOT NULL, "
+            "size INTEGER NOT NULL, mtime REAL NOT NULL, sha256 TEXT, type TEXT NOT NULL, base TEXT)"
+        )
+        return conn
+
+    def _entry_for(self, path: str, stat: os.stat_result) -> tuple:
+        name = os.path.basename(path)
+        manifest = None
+        try:
+            with open(manifest_path_for(path), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            pass
+        return (
+            name,
+            backup_date_from_name(name).isoformat(),
+            stat.st_size,
+            stat.st_mtime,
+            manifest.get("sha256") if manifest else None,
+            "delta" if is_delta_backup(name) else "full",
+            manifest.get("base") if manifest else None,
+        )
+
+    def _reconcile(self, conn: sqlite3.Connection) -> None:
+        """Сверить каталог с директорией, если она могла измениться"""
+        dir_mtime = os.stat(self.backup_dir).st_mtime_ns
+        if self._scanned and self._scanned[0] == dir_mtime and dir_mtime < self._scanned[1] - CATALOG_RACY_WINDOW_NS:
+            return
+        scanned_at = time.time_ns()
+        known = {row[0]: row[1:] for row in conn.execute("SELECT name, size, mtime FROM backups")}
+        present = set()
+        with os.scandir(self.backup_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not backup_date_from_name(entry.name):
+                    continue
+                present.add(entry.name)
+                stat = entry.stat()
+                if known.get(entry.name) != (stat.st_size, stat.st_mtime):
+                    conn.execute(
+                        "INSERT OR REPLACE INTO backups VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        self._entry_for(entry.path, stat),
+                    )
+        conn.executemany("DELETE FROM backups WHERE name = ?", ((name,) for name in set(known) - present))
+        conn.commit()
+        self._scanned = (dir_mtime, scanned_at)
+
+    def entries(self) -> List[CatalogEntry]:
+        """Все бэкапы, новые первыми"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        conn = self._connect()
+        try:
+            self._reconcile(conn)
+            rows = conn.execute(
+                "SELECT name, created_at, size, mtime, sha256, type, base FROM backups "
+                "ORDER BY created_at DESC, name DESC"
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            CatalogEntry(os.path.join(self.backup_dir, name), datetime.fromisoformat(created_at), *rest)
+            for name, created_at, *rest in rows
+        ]
+
+    def add(self, path: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO backups VALUES (?, ?, ?, ?, ?, ?, ?)", self._entry_for(path, os.stat(path)))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def remove(self, path: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM backups WHERE name = ?", (os.path.basename(path),))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@dataclass
+class RetentionReport:
+    """Итоги ротации бэкапов"""
+
+    kept: int = 0
+    deleted: List[str] = field(default_factory=list)
+    reclaimed: int = 0
+    total_size: int = 0
+
+
+def select_retained(
+    entries: List[CatalogEntry],
+    daily: int,
+    weekly: int,
+    monthly: int,
+    max_total_size: Optional[int] = None,
+) -> set:
+    """Имена бэкапов, которые оставляет ротация "дед-отец-сын" с бюджетом на диск
+
+    В каждом уровне остается самый свежий бэкап за день, неделю и месяц;
+    вместе с инкрементом остается его полный снимок. Если оставленное не
+    помещается в бюджет, отбрасываются самые старые точки восстановления,
+    но никогда — последняя.
+    """
+    by_name = {entry.name: entry for entry in entries}
+    points = []
+    for count, bucket in (
+        (daily, lambda d: d.date()),
+        (weekly, lambda d: d.isocalendar()[:2]),
+        (monthly, lambda d: (d.year, d.month)),
+    ):
+        seen = set()
+        for entry in entries:
+            key = bucket(entry.created_at)
+            if key in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(key)
+            points.append(entry.name)
+    if entries:
+        points.append(entries[0].name)
+    points = sorted(set(points), key=lambda name: by_name[name].created_at, reverse=True)
+
+    def with_bases(names):
+        retained = set(names)
+        for name in names:
+            base = by_name[name].base
+            if base in by_name:
+                retained.add(base)
+        return retained
+
+    retained = with_bases(points)
+    if max_total_size is not None:
+        while len(points) > 1 and sum(by_name[name].size for name in retained) > max_total_size:
+            points.pop()
+            retained = with_bases(points)
+    return retained
+
+
+class LoopLagMonitor:
+    """Замер максимальной задержки event loop (насколько его блокировали)"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, loop.time() - started - self.interval)
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
 class BackupManager:
     """Менеджер для работы с бэкапами базы данных"""
 
     def __init__(self, database_path: str = None, backup_dir: str = None):
         self.database_path = database_path or config.database.path
-        # Используем config.backup.dir, если он есть
-        self.backup_dir = backup_dir or getattr(config, 'backup', {}).get('dir', 'backups')
+        self.backup_dir = backup_dir or config.backup.dir or 'backups'
         self.bot = None  # Будет установлен позже
+        self.last_report: Optional[BackupReport] = None
+        self.catalog = BackupCatalog(self.backup_dir)
 
     def set_bot(self, bot):
         """Устанавливает экземпляр бота для работы с Telegram"""
@@ -34,9 +446,7 @@ class BackupManager:
     def get_backup_files(self) -> List[str]:
         """Возвращает список всех файлов бэкапов, отсортированных по дате (новые первыми)"""
         try:
-            pattern = os.path.join(self.backup_dir, "subscriptions_backup_*.db")
-            backup_files = sorted(glob(pattern), reverse=True)
-            return backup_files
+            return [entry.path for entry in self.catalog.entries()]
         except Exception as e:
             logger.error(f"Failed to get backup files: {e}")
             return []
@@ -46,10 +456,48 @@ class BackupManager:
         backup_files = self.get_backup_files()
         return backup_files[0] if backup_files else None
 
+    async def _download_candidate(self, candidate: BackupCandidate) -> Optional[str]:
+        """Скачать бэкап в файл .part (download_to_drive пишет на диск по частям) и сверить sha256 с подписью"""
+        download_path = os.path.join(self.backup_dir, candidate.file_name)
+        partial_path = download_path + ".part"
+        try:
+            file_info = await self.bot.get_file(candidate.file_id)
+            await file_info.download_to_drive(custom_path=partial_path)
+            # Хэш считается порциями по CHUNK_SIZE в отдельном потоке
+            if candidate.sha256 and await asyncio.to_thread(file_sha256, partial_path) != candidate.sha256:
+                logger.error(f"Checksum mismatch for {candidate.file_name} from admin {candidate.admin_id}")
+                return None
+            os.replace(partial_path, download_path)
+            return download_path
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    async def _pinned_admin_messages(self) -> list:
+        """Закрепленные сообщения в чатах с админами"""
+        messages = []
+        for admin_id in config.telegram.admin_ids:
+            try:
+                chat = await self.bot.get_chat(admin_id)
+            except TelegramError as e:
+                logger.warning(f"Failed to read chat {admin_id} while searching for backups: {e}")
+                continue
+            if chat.pinned_message:
+                messages.append(chat.pinned_message)
+        return messages
+
     async def get_latest_backup_from_admins(self) -> Optional[str]:
         """
         Ищет самый свежий бэкап в чатах с админами и скачивает его
 
+        Основной источник — закрепленные сообщения в чатах с админами
+        (distribute_backup закрепляет каждый разосланный полный бэкап):
+        get_chat работает и при установленном вебхуке. В режиме polling
+        дополнительно просматриваются последние обновления (get_updates при
+        вебхуке отвечает 409 Conflict). Кандидаты ранжируются по дате из имени
+        и размеру без скачивания; скачивается только лучший (при несовпадении
+        контрольной суммы — следующий).
+
         Returns:
             Optional[str]: Путь к скачанному файлу или None
         """
@@ -61,76 +509,126 @@ class BackupManager:
             # Создаем директорию для бэкапов
             self.ensure_backup_dir()
 
-            latest_backup_path = None
-            latest_backup_date = None
-
-            # Проходим по всем админам
-            for admin_id in config.telegram.admin_ids:
+            messages = await self._pinned_admin_messages()
+            if not config.webhook.enabled:
                 try:
-                    # Получаем последние сообщения из чата с админом
-                    # Используем get_updates для получения последних сообщений
                     updates = await self.bot.get_updates(limit=100, timeout=1)
+                    messages.extend(update.message for update in updates)
+                except TelegramError as e:
+                    logger.warning(f"Failed to read updates while searching for backups: {e}")
+            candidates = backup_candidates(messages, set(config.telegram.admin_ids))
+            logger.info(f"Found {len(candidates)} backups in admin chats")
 
-                    for update in updates:
-                        if (update.message and
-                            update.message.chat.id == admin_id and
-                            update.message.document and
-                            update.message.document.file_name and
-                            update.message.document.file_name.startswith("subscriptions_backup_") and
-                            update.message.document.file_name.endswith(".db")):
-
-                            # Извлекаем дату из имени файла
-                            filename = update.message.document.file_name
-                            date_str = filename.replace("subscriptions_backup_", "").replace(".db", "")
-
-                            try:
-                                # Парсим дату
-                                if "_" in date_str:  # Формат с временем YYYYMMDD_HHMMSS
-                                    file_date = datetime.strptime(date_str, "%Y%m%d_%H%M%S")
-                                else:  # Формат только с датой YYYYMMDD
-                                    file_date = datetime.strptime(date_str, "%Y%m%d")
-
-                                # Проверяем, является ли этот бэкап новее
-                                if latest_backup_date is None or file_date > latest_backup_date:
-                                    # Скачиваем файл
-                                    file_info = await self.bot.get_file(update.message.document.file_id)
-                                    download_path = os.path.join(self.backup_dir, filename)
-
-                                    # Скачиваем файл
-                                    await file_info.download_to_drive(download_path)
-
-                                    # Если у нас уже был скачанный файл, удаляем его
-                                    if latest_backup_path and os.path.exists(latest_backup_path):
-                                        os.remove(latest_backup_path)
-
-                                    latest_backup_path = download_path
-                                    latest_backup_date = file_date
-                                    logger.info(f"Downloaded backup from admin {admin_id}: {filename}")
-
-                            except ValueError as e:
-                                logger.warning(f"Invalid date format in filename {filename}: {e}")
-                                continue
-
+            for candidate in candidates:
+                try:
+                    download_path = await self._download_candidate(candidate)
                 except Exception as e:
-                    logger.error(f"Error checking admin {admin_id} for backups: {e}")
+                    logger.error(f"Failed to download {candidate.file_name} from admin {candidate.admin_id}: {e}")
                     continue
+                if download_path:
+                    logger.info(f"Downloaded backup from admin {candidate.admin_id}: {candidate.file_name}")
+                    return download_path
 
-            return latest_backup_path
+            return None
 
         except Exception as e:
             logger.error(f"Error getting latest backup from admins: {e}")
             return None
 
-    def create_backup(self, include_time: bool = True) -> Tuple[bool, Optional[str]]:
+    def _online_backup(self, target_path: str) -> int:
+        """Копия базы через SQLite backup API: согласованный снимок без остановки писателей
+
+        Returns:
+            int: Количество скопированных страниц
+        """
+        pages = 0
+
+        def progress(status, remaining, total):
+            nonlocal pages
+            pages = total
+            # Отдаем блокировку писателям между шагами
+            time.sleep(BACKUP_STEP_SLEEP)
+
+        source = sqlite3.connect(f"file:{self.database_path}?mode=ro", uri=True)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target, pages=BACKUP_STEP_PAGES, progress=progress)
+            # Бэкап — самостоятельный файл без журнала WAL
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+        return pages
+
+    def _latest_full_backup(self) -> Optional[str]:
+        """Последний полный снимок с индексом страниц (база для инкремента)"""
+        for path in self.get_backup_files():
+            if not is_delta_backup(path) and os.path.exists(path + PAGE_INDEX_EXTENSION):
+                return path
+        return None
+
+    def _read_page_index(self, backup_path: str) -> List[bytes]:
+        with open(backup_path + PAGE_INDEX_EXTENSION, "rb") as f:
+            data = f.read()
+        return [data[i:i + PAGE_HASH_SIZE] for i in range(0, len(data), PAGE_HASH_SIZE)]
+
+    def _delta_base(self, page_size: int) -> Optional[Tuple[str, dict, List[bytes]]]:
+        """Полный снимок, пригодный как база для инкремента, или None (нужен полный)"""
+        base_path = self._latest_full_backup()
+        manifest = self.read_manifest(base_path) if base_path else None
+        if not manifest or manifest.get("page_size") != page_size:
+            return None
+        full_interval = config.backup.full_interval_days or DEFAULT_FULL_INTERVAL_DAYS
+        created = datetime.fromisoformat(manifest["created_at"])
+        if (datetime.now() - created).total_seconds() >= full_interval * 86400:
+            return None
+        return base_path, manifest, self._read_page_index(base_path)
+
+    def _write_full(self, snapshot_path: str, backup_path: str, algorithm: str, hashes: List[bytes]):
+        partial_path = backup_path + ".part"
+        with open(snapshot_path, "rb") as src, open_compressed(partial_path, algorithm) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        with open(backup_path + PAGE_INDEX_EXTENSION, "wb") as f:
+            f.write(b"".join(hashes))
+        os.replace(partial_path, backup_path)
+
+    def _write_delta(
+        self, snapshot_path: str, backup_path: str, algorithm: str,
+        page_size: int, changed: List[int], header: dict,
+    ):
+        """Инкремент: заголовок JSON и записи (номер страницы, содержимое) измененных страниц"""
+        partial_path = backup_path + ".part"
+        with open(snapshot_path, "rb") as src, open_compressed(partial_path, algorithm) as dst:
+            dst.write(DELTA_MAGIC)
+            dst.write(json.dumps(header).encode() + b"\n")
+            for page_no in changed:
+                src.seek(page_no * page_size)
+                dst.write(struct.pack(">I", page_no))
+                dst.write(src.read(page_size))
+        os.replace(partial_path, backup_path)
+
+    def create_backup(self, include_time: bool = True, incremental: bool = False) -> Tuple[bool, Optional[str]]:
         """
-        Создает бэкап базы данных
+        Создает сжатый бэкап базы данных с манифестом контрольных сумм
+
+        Снимок берется SQLite backup API порциями по BACKUP_STEP_PAGES страниц,
+        затем потоково сжимается (zstd или gzip). Рядом пишется манифест
+        <файл>.json с sha256 сжатого и исходного файла. Блокирующая операция —
+        из event loop вызывайте create_backup_async.
+
+        При incremental=True сохраняются только страницы, изменившиеся с
+        последнего полного снимка (сравнение по хэшам страниц). Полный снимок
+        делается, если базы нет, она старше backup.full_interval_days или
+        изменилось больше MAX_DELTA_RATIO страниц.
 
         Args:
             include_time: Если True, добавляет время к имени файла
+            incremental: Сохранить инкремент относительно последнего полного снимка
 
         Returns:
             Tuple[bool, Optional[str]]: (успех, путь к файлу бэкапа)
         """
+        snapshot_path = None
         try:
             if not self.ensure_backup_dir():
                 return False, None
@@ -139,35 +637,166 @@ class BackupManager:
                 logger.error(f"Database file not found: {self.database_path}")
                 return False, None
 
+            started = time.monotonic()
+            started_at = time.time()
+
             # Генерируем имя файла
             if include_time:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             else:
                 timestamp = datetime.now().strftime("%Y%m%d")
 
-            backup_filename = f"subscriptions_backup_{timestamp}.db"
-            backup_path = os.path.join(self.backup_dir, backup_filename)
-
-            # Копируем базу данных
-            shutil.copy2(self.database_path, backup_path)
-
-            logger.info(f"Backup created: {backup_path}")
+            algorithm, suffix = preferred_compression()
+            snapshot_path = os.path.join(self.backup_dir, f".{BACKUP_PREFIX}{timestamp}.snapshot")
+            pages = self._online_backup(snapshot_path)
+            finished_at = time.time()
+            page_size = page_size_of(snapshot_path)
+            hashes, raw_sha256, raw_size = page_hashes(snapshot_path, page_size)
+
+            base = self._delta_base(page_size) if incremental else None
+            changed = None
+            if base:
+                base_path, base_manifest, base_hashes = base
+                changed = [
+                    page_no for page_no, page_hash in enumerate(hashes)
+                    if page_no >= len(base_hashes) or base_hashes[page_no] != page_hash
+                ]
+                if len(changed) > len(hashes) * MAX_DELTA_RATIO:
+                    logger.info(f"{len(changed)} of {len(hashes)} pages changed, taking full snapshot")
+                    base = None
+
+            if base:
+                backup_path = os.path.join(self.backup_dir, f"{BACKUP_PREFIX}{timestamp}.db.delta{suffix}")
+                self._write_delta(snapshot_path, backup_path, algorithm, page_size, changed, {
+                    "base": os.path.basename(base_path),
+                    "base_raw_sha256": base_manifest["raw_sha256"],
+                    "page_size": page_size,
+                    "page_count": len(hashes),
+                    "raw_sha256": raw_sha256,
+                })
+            else:
+                backup_path = os.path.join(self.backup_dir, f"{BACKUP_PREFIX}{timestamp}.db{suffix}")
+                self._write_full(snapshot_path, backup_path, algorithm, hashes)
+
+            self.last_report = BackupReport(
+                file=os.path.basename(backup_path),
+                algorithm=algorithm,
+                type="delta" if base else "full",
+                sha256=file_sha256(backup_path),
+                raw_sha256=raw_sha256,
+                raw_size=raw_size,
+                size=os.path.getsize(backup_path),
+                pages=pages or len(hashes),
+                page_size=page_size,
+                started_at=started_at,
+                finished_at=finished_at,
+                created_at=datetime.now().isoformat(timespec="seconds"),
+                duration=time.monotonic() - started,
+                base=os.path.basename(base[0]) if base else None,
+                base_raw_sha256=base[1]["raw_sha256"] if base else None,
+                changed_pages=len(changed) if base else None,
+            )
+            self.write_manifest(backup_path, self.last_report)
+            self.catalog.add(backup_path)
+
+            logger.info(f"Backup created: {self.last_report.summary()}")
             return True, backup_path
 
         except Exception as e:
             logger.error(f"Failed to create backup: {e}")
             return False, None
+        finally:
+            if snapshot_path and os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+    async def create_backup_async(self, include_time: bool = True, incremental: bool = False) -> Tuple[bool, Optional[str]]:
+        """Создает бэкап в отдельном потоке, замеряя блокировку event loop"""
+        async with LoopLagMonitor() as monitor:
+            success, backup_path = await asyncio.to_thread(self.create_backup, include_time, incremental)
+        if success and self.last_report is not None:
+            self.last_report.loop_blocked_ms = monitor.max_lag * 1000
+            self.write_manifest(backup_path, self.last_report)
+            logger.info(f"Backup report: {self.last_report.summary()}")
+            # Ротация после каждого бэкапа
+            await asyncio.to_thread(self.apply_retention)
+        return success, backup_path
+
+    def write_manifest(self, backup_path: str, report: BackupReport):
+        with open(manifest_path_for(backup_path), "w", encoding="utf-8") as f:
+            json.dump({**asdict(report), "ratio": round(report.ratio, 4)}, f, indent=2)
+
+    def record_deliveries(self, backup_path: str, deliveries: dict, file_id: Optional[str] = None) -> None:
+        """Сохранить в манифест результат рассылки бэкапа по админам и file_id в Telegram"""
+        manifest = self.read_manifest(backup_path)
+        if manifest is None:
+            return
+        manifest["deliveries"] = {str(chat_id): status for chat_id, status in deliveries.items()}
+        if file_id:
+            manifest["telegram_file_id"] = file_id
+        with open(manifest_path_for(backup_path), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def read_manifest(self, backup_path: str) -> Optional[dict]:
+        try:
+            with open(manifest_path_for(backup_path), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _verify_file(self, backup_path: str, manifest: Optional[dict]):
+        if manifest and manifest.get("sha256") and file_sha256(backup_path) != manifest["sha256"]:
+            raise ValueError(f"Backup checksum mismatch: {backup_path}")
+
+    def materialize(self, backup_path: str, target_path: str):
+        """Собрать файл базы из бэкапа (полного или цепочки полный + инкремент) с проверкой сумм"""
+        manifest = self.read_manifest(backup_path)
+        self._verify_file(backup_path, manifest)
+
+        if not is_delta_backup(backup_path):
+            with open_backup_for_read(backup_path) as src, open(target_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        else:
+            with open_backup_for_read(backup_path) as src:
+                if src.readline() != DELTA_MAGIC:
+                    raise ValueError(f"Not an incremental backup: {backup_path}")
+                header = json.loads(src.readline())
+                base_path = os.path.join(os.path.dirname(backup_path), header["base"])
+                if not os.path.exists(base_path):
+                    raise FileNotFoundError(f"Base snapshot {header['base']} for {backup_path} not found")
+                self.materialize(base_path, target_path)
+                if file_sha256(target_path) != header["base_raw_sha256"]:
+                    raise ValueError(f"Base snapshot {header['base']} does not match {backup_path}")
+
+                page_size = header["page_size"]
+                with open(target_path, "r+b") as dst:
+                    while record := src.read(4):
+                        page_no = struct.unpack(">I", record)[0]
+                        page = src.read(page_size)
+                        if len(page) != page_size:
+                            raise ValueError(f"Truncated incremental backup: {backup_path}")
+                        dst.seek(page_no * page_size)
+                        dst.write(page)
+                    dst.truncate(header["page_count"] * page_size)
+
+        expected = manifest.get("raw_sha256") if manifest else None
+        if expected and file_sha256(target_path) != expected:
+            raise ValueError(f"Restored database checksum mismatch for {backup_path}")
 
     def restore_from_backup(self, backup_path: str = None) -> bool:
         """
         Восстанавливает базу данных из бэкапа
 
+        Бэкап (или цепочка полный снимок + инкремент) собирается во временный
+        файл, проверяются контрольные суммы и PRAGMA integrity_check, и только
+        затем основной файл атомарно подменяется.
+
         Args:
             backup_path: Путь к файлу бэкапа. Если None, используется последний бэкап
 
         Returns:
             bool: Успех операции
         """
+        partial_path = self.database_path + ".restore"
         try:
             if backup_path is None:
                 backup_path = self.get_latest_backup()
@@ -179,8 +808,20 @@ class BackupManager:
             # Создаем директорию для базы данных если её нет
             os.makedirs(os.path.dirname(self.database_path), exist_ok=True)
 
-            # Копируем бэкап в место основной базы
-            shutil.copy2(backup_path, self.database_path)
+            self.materialize(backup_path, partial_path)
+            conn = sqlite3.connect(partial_path)
+            try:
+                result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                conn.close()
+            if result != "ok":
+                raise ValueError(f"Integrity check failed: {result}")
+
+            os.replace(partial_path, self.database_path)
+            # Журнал WAL от прежней базы не должен примениться к восстановленной
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(self.database_path + suffix):
+                    os.remove(self.database_path + suffix)
 
             logger.info(f"Database restored from backup: {backup_path}")
             return True
@@ -188,6 +829,9 @@ class BackupManager:
         except Exception as e:
             logger.error(f"Failed to restore from backup: {e}")
             return False
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
 
     async def auto_restore_if_needed(self) -> bool:
         """
@@ -215,16 +859,74 @@ class BackupManager:
         # Если локальных бэкапов нет, ищем в чатах с админами
         logger.info("No local backups found, searching in admin chats...")
         if self.bot:
+            started = time.monotonic()
             latest_backup_path = await self.get_latest_backup_from_admins()
+            fetched = time.monotonic()
             if latest_backup_path:
-                success = self.restore_from_backup(latest_backup_path)
+                success = await asyncio.to_thread(self.restore_from_backup, latest_backup_path)
                 if success:
-                    logger.info(f"Database restored from admin chat backup: {latest_backup_path}")
+                    logger.info(
+                        f"Database restored from admin chat backup: {latest_backup_path} "
+                        f"(cold start {time.monotonic() - started:.2f}s: discovery and download "
+                        f"{fetched - started:.2f}s, restore {time.monotonic() - fetched:.2f}s)"
+                    )
                     return True
 
         logger.error("No backup files found for restoration")
         return False
 
+    def _delete_backup(self, backup_path: str) -> int:
+        """Удалить бэкап вместе с манифестом и индексом страниц; возвращает освобожденные байты"""
+        freed = 0
+        for path in (backup_path, manifest_path_for(backup_path), backup_path + PAGE_INDEX_EXTENSION):
+            if os.path.exists(path):
+                freed += os.path.getsize(path)
+                os.remove(path)
+        self.catalog.remove(backup_path)
+        return freed
+
+    def apply_retention(self) -> RetentionReport:
+        """
+        Ротация бэкапов "дед-отец-сын" с ограничением общего размера
+
+        Оставляет самый свежий бэкап за каждый из последних backup.keep_daily
+        дней, backup.keep_weekly недель и backup.keep_monthly месяцев (и полные
+        снимки для оставленных инкрементов), затем укладывается в
+        backup.max_total_mb, отбрасывая самые старые точки восстановления.
+
+        Returns:
+            RetentionReport: Оставлено, удалено и освобождено байт
+        """
+        report = RetentionReport()
+        try:
+            entries = self.catalog.entries()
+            max_total_mb = config.backup.max_total_mb
+            retained = select_retained(
+                entries,
+                daily=config.backup.keep_daily or DEFAULT_KEEP_DAILY,
+                weekly=config.backup.keep_weekly or DEFAULT_KEEP_WEEKLY,
+                monthly=config.backup.keep_monthly or DEFAULT_KEEP_MONTHLY,
+                max_total_size=max_total_mb * 1024 * 1024 if max_total_mb else None,
+            )
+            for entry in entries:
+                if entry.name in retained:
+                    report.kept += 1
+                    report.total_size += entry.size
+                    continue
+                try:
+                    report.reclaimed += self._delete_backup(entry.path)
+                    report.deleted.append(entry.name)
+                except OSError as e:
+                    logger.error(f"Failed to delete backup {entry.path}: {e}")
+
+            logger.info(
+                f"Backup retention: kept {report.kept} ({report.total_size} bytes), "
+                f"deleted {len(report.deleted)}, reclaimed {report.reclaimed} bytes"
+            )
+        except Exception as e:
+            logger.error(f"Failed to apply backup retention: {e}")
+        return report
+
     def cleanup_old_backups(self, keep_days: int = 30) -> int:
         """
         Удаляет старые бэкапы, оставляя только за последние N дней
@@ -243,11 +945,19 @@ class BackupManager:
             cutoff_date = datetime.now().timestamp() - (keep_days * 24 * 3600)
             deleted_count = 0
 
+            # Полные снимки, на которые ссылаются оставляемые инкременты, удалять нельзя
+            referenced = set()
+            for backup_file in backup_files:
+                if is_delta_backup(backup_file) and os.path.getmtime(backup_file) >= cutoff_date:
+                    manifest = self.read_manifest(backup_file)
+                    if manifest and manifest.get("base"):
+                        referenced.add(manifest["base"])
+
             for backup_file in backup_files:
                 file_time = os.path.getmtime(backup_file)
-                if file_time < cutoff_date:
+                if file_time < cutoff_date and os.path.basename(backup_file) not in referenced:
                     try:
-                        os.remove(backup_file)
+                        self._delete_backup(backup_file)
                         deleted_count += 1
                         logger.info(f"Deleted old backup: {backup_file}")
                     except Exception as e:
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+from src.utils.db import SQLitePool, db_pool
+from src.utils.metrics import metrics
+from src.utils.sender import RateLimitedSender
+from src.utils.subscription import r
+
+logger = logging.getLogger(__name__)
+
+# Hash с состоянием текущей рассылки; переживает перезапуск бота
+BROADCAST_KEY = "broadcast:current"
+DEFAULT_BATCH_SIZE = 500
+# Как часто обновлять сообщение с прогрессом у администратора
+PROGRESS_INTERVAL = 30.0
+
+# Получатели выбираются по первичному ключу (keyset), без OFFSET и без загрузки всех user_id
+AUDIENCES = {
+    "all": "SELECT user_id FROM subscriptions WHERE user_id > ? ORDER BY user_id LIMIT ?",
+    "active": "SELECT user_id FROM subscriptions WHERE active = 1 AND user_id > ? ORDER BY user_id LIMIT ?",
+}
+
+
+@dataclass
+class BroadcastState:
+    """Состояние рассылки, сохраняемое в Redis после каждой пачки"""
+
+    id: str
+    text: str
+    audience: str
+    status: str = "running"
+    last_user_id: int = 0
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    started_at: float = 0.0
+    elapsed: float = 0.0
+    admin_chat_id: int = 0
+    # Сообщение администратору, которое редактируется по мере рассылки
+    progress_message_id: int = 0
+
+    @property
+    def rate(self) -> float:
+        """Доставлено сообщений в секунду"""
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_mapping(self) -> dict:
+        return {name: str(value) for name, value in self.__dict__.items()}
+
+    @classmethod
+    def from_mapping(cls, data: dict) -> "BroadcastState":
+        return cls(
+            id=data["id"],
+            text=data["text"],
+            audience=data["audience"],
+            status=data["status"],
+            last_user_id=int(data["last_user_id"]),
+            sent=int(data["sent"]),
+            failed=int(data["failed"]),
+            retries=int(data["retries"]),
+            started_at=float(data["started_at"]),
+            elapsed=float(data["elapsed"]),
+            admin_chat_id=int(data["admin_chat_id"]),
+            progress_message_id=int(data.get("progress_message_id") or 0),
+        )
+
+    def render(self) -> str:
+        return (
+            f"📣 Рассылка {self.id} ({self.audience}): {self.status}\n"
+            f"✅ {self.sent} / ❌ {self.failed}, повторов {self.retries}\n"
+            f"⏱ {self.elapsed:.0f}s, {self.rate:.1f} msg/s"
+        )
+
+
+class Broadcaster:
+    """Массовая рассылка сообщений пользователям бота
+
+    Получатели читаются из SQLite пачками по batch_size по возрастанию
+    user_id, каждая пачка отправляется через RateLimitedSender (общий token
+    bucket бота, пауза при RetryAfter). После пачки в Redis сохраняется
+    последний обработанный user_id и счетчики, поэтому после перезапуска
+    рассылка продолжается с места остановки; повторно может быть отправлена
+    только пачка, прерванная посередине.
+    """
+
+    def __init__(self, client, pool: SQLitePool = None, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.client = client
+        self.pool = pool or db_pool
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def recipients(self, audience: str, after: int) -> AsyncIterator[List[int]]:
+        """Пачки user_id аудитории, начиная после user_id after"""
+        query = AUDIENCES[audience]
+        while True:
+            async with self.pool.read() as db:
+                async with db.execute(query, (after, self.batch_size)) as cursor:
+                    batch = [row[0] for row in await cursor.fetchall()]
+            if not batch:
+                return
+            yield batch
+            after = batch[-1]
+
+    async def load(self) -> Optional[BroadcastState]:
+        data = await self.client.hgetall(BROADCAST_KEY)
+        return BroadcastState.from_mapping(data) if data else None
+
+    async def _save(self, state: BroadcastState) -> None:
+        await self.client.hset(BROADCAST_KEY, mapping=state.to_mapping())
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot, text: str, audience: str = "all", admin_chat_id: int = 0) -> BroadcastState:
+        """Начать новую рассылку в фоне"""
+        if audience not in AUDIENCES:
+            raise ValueError(f"Unknown audience {audience}")
+        current = await self.load()
+        if self.running or (current and current.status == "running"):
+            raise RuntimeError("Another broadcast is in progress")
+        state = BroadcastState(
+            id=uuid.uuid4().hex[:8], text=text, audience=audience,
+            started_at=time.time(), admin_chat_id=admin_chat_id,
+        )
+        await self._save(state)
+        self._spawn(bot, state)
+        return state
+
+    async def resume(self, bot) -> Optional[BroadcastState]:
+        """Продолжить рассылку, прерванную остановкой бота"""
+        state = await self.load()
+        if state is None or state.status != "running" or self.running:
+            return None
+        logger.info(f"Resuming broadcast {state.id} after user_id {state.last_user_id} ({state.sent} sent)")
+        self._spawn(bot, state)
+        return state
+
+    async def cancel(self) -> Optional[BroadcastState]:
+        """Остановить рассылку без возможности продолжения"""
+        # Сначала останавливаем задачу, чтобы она не перезаписала статус своим сохранением
+        await self.stop()
+        state = await self.load()
+        if state is None or state.status != "running":
+            return None
+        state.status = "cancelled"
+        await self._save(state)
+        return state
+
+    def _spawn(self, bot, state: BroadcastState) -> None:
+        self._task = asyncio.create_task(self.run(bot, state), name=f"broadcast_{state.id}")
+
+    async def stop(self) -> None:
+        """Остановить фоновую рассылку; состояние остается в Redis для resume"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run(
+        self,
+        bot,
+        state: BroadcastState,
+        sender: RateLimitedSender = None,
+        on_progress: Callable[[BroadcastState], Awaitable[None]] = None,
+    ) -> BroadcastState:
+        """Разослать state.text аудитории, начиная после state.last_user_id"""
+        sender = sender or RateLimitedSender(bot)
+        on_progress = on_progress or (lambda s: self._notify_admin(bot, s))
+        resumed_at = time.monotonic()
+        elapsed_before = state.elapsed
+        last_progress = resumed_at
+        await on_progress(state)
+        try:
+            async for batch in self.recipients(state.audience, state.last_user_id):
+                report = await sender.send_many((user_id, state.text) for user_id in batch)
+                state.last_user_id = batch[-1]
+                state.sent += report.sent
+                state.failed += report.failed
+                state.retries += report.retries
+                state.elapsed = elapsed_before + time.monotonic() - resumed_at
+                await self._save(state)
+                metrics.incr("broadcast sent", report.sent)
+                metrics.incr("broadcast failed", report.failed)
+                metrics.gauge("broadcast rate", round(state.rate, 1))
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = time.monotonic()
+                    await on_progress(state)
+            state.status = "done"
+            await self._save(state)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {state.id} stopped after user_id {state.last_user_id}: {e}")
+            state.status = "failed"
+            await self._save(state)
+        logger.info(
+            f"Broadcast {state.id} {state.status}: {state.sent} sent, {state.failed} failed "
+            f"in {state.elapsed:.1f}s ({state.rate:.1f} msg/s)"
+        )
+        await on_progress(state)
+        return state
+
+    async def _notify_admin(self, bot, state: BroadcastState) -> None:
+        if not state.admin_chat_id:
+            return
+        try:
+            if state.progress_message_id:
+                await bot.edit_message_text(
+                    chat_id=state.admin_chat_id, message_id=state.progress_message_id, text=state.render()
+                )
+            else:
+                message = await bot.send_message(chat_id=state.admin_chat_id, text=state.render())
+                state.progress_message_id = message.message_id
+                await self._save(state)
+        except Exception as e:
+            logger.warning(f"Failed to report broadcast progress to {state.admin_chat_id}: {e}")
+
+
+# Создаем глобальный экземпляр рассылки
+broadcaster = Broadcaster(r)
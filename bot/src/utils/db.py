@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+import aiosqlite
+from src.configs.config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_READERS = 4
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+# Размер кэша подготовленных выражений sqlite3 на соединение
+CACHED_STATEMENTS = 256
+
+# PRAGMA, выставляемые на каждое соединение при открытии
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+
+class SQLitePool:
+    """Пул долгоживущих соединений SQLite для бота
+
+    Чтения идут через несколько соединений только для чтения (WAL позволяет
+    читать параллельно с записью), все записи — через одно соединение под
+    блокировкой, так что писатели бота не конкурируют за lock файла между собой.
+    Соединения открываются лениво и живут до close().
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        readers: Optional[int] = None,
+        busy_timeout: Optional[int] = None,
+    ):
+        self._path = path
+        self.readers = readers or config.database.pool_size or DEFAULT_READERS
+        self.busy_timeout = busy_timeout or config.database.busy_timeout or DEFAULT_BUSY_TIMEOUT_MS
+        self._idle: Optional[asyncio.Queue] = None
+        self._opened: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._open_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def path(self) -> str:
+        return self._path or config.database.path
+
+    async def _connect(self, readonly: bool) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.path, cached_statements=CACHED_STATEMENTS)
+        await db.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        if not readonly:
+            await db.execute("PRAGMA journal_mode=WAL")
+        for pragma in CONNECTION_PRAGMAS:
+            await db.execute(pragma)
+        if readonly:
+            await db.execute("PRAGMA query_only=ON")
+        return db
+
+    def _ensure_state(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            self._write_lock = asyncio.Lock()
+            self._open_lock = asyncio.Lock()
+
+    async def _get_writer(self) -> aiosqlite.Connection:
+        if self._writer is None:
+            async with self._open_lock:
+                if self._writer is None:
+                    self._writer = await self._connect(readonly=False)
+        return self._writer
+
+    async def _acquire_reader(self) -> aiosqlite.Connection:
+        # Писатель открывается первым: он переводит базу в WAL
+        await self._get_writer()
+        if self._idle.empty():
+            async with self._open_lock:
+                if len(self._opened) < self.readers:
+                    db = await self._connect(readonly=True)
+                    self._opened.append(db)
+                    return db
+        return await self._idle.get()
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение для чтения из пула"""
+        self._ensure_state()
+        db = await self._acquire_reader()
+        try:
+            yield db
+        finally:
+            if db in self._opened:
+                self._idle.put_nowait(db)
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Единственное соединение для записи; commit при выходе, rollback при ошибке"""
+        self._ensure_state()
+        async with self._write_lock:
+            db = await self._get_writer()
+            try:
+                yield db
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+
+    async def checkpoint(self) -> None:
+        """Перенести WAL в основной файл базы"""
+        self._ensure_state()
+        async with self._write_lock:
+            db = await self._get_writer()
+            await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    async def close(self) -> None:
+        """Закрыть все соединения (перед восстановлением базы и при остановке бота)"""
+        if self._idle is None:
+            return
+        async with self._write_lock:
+            for db in self._opened:
+                await db.close()
+            if self._writer is not None:
+                await self._writer.close()
+            self._opened = []
+            self._writer = None
+            self._idle = None
+        logger.info("SQLite pool closed")
+
+
+# Создаем глобальный пул соединений бота
+db_pool = SQLitePool()
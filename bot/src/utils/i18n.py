@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import os
+from string import Formatter
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "locales")
+DEFAULT_LANG = "en"
+
+
+class Template:
+    """Строка перевода, разобранная на литералы и поля один раз при загрузке"""
+
+    __slots__ = ("source", "_parts", "_static")
+
+    def __init__(self, source: str):
+        self.source = source
+        # (литерал, имя поля, формат, конверсия) — как в str.format, но без повторного разбора
+        self._parts = tuple(Formatter().parse(source))
+        self._static = all(field is None for _, field, _, _ in self._parts)
+        if self._static:
+            # "{{" / "}}" в строке без полей раскрываем сразу
+            self.source = "".join(literal for literal, _, _, _ in self._parts)
+
+    def render(self, **kwargs) -> str:
+        if self._static:
+            return self.source
+        chunks = []
+        for literal, field, spec, conversion in self._parts:
+            chunks.append(literal)
+            if field is None:
+                continue
+            value = kwargs[field] if field in kwargs else self._lookup(field, kwargs)
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "a":
+                value = ascii(value)
+            elif conversion == "s":
+                value = str(value)
+            chunks.append(format(value, spec) if spec else str(value))
+        return "".join(chunks)
+
+    @staticmethod
+    def _lookup(field: str, kwargs: dict):
+        # Поля вида {user.name} / {items[0]} — редкий случай, отдаем стандартному форматтеру
+        value, _ = Formatter().get_field(field, (), kwargs)
+        return value
+
+
+def _flatten(tree: dict, prefix: str = "") -> dict:
+    """{"a": {"b": "x"}} -> {"a.b": "x"}"""
+    flat = {}
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, str):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+class TranslationCatalog:
+    """Неизменяемые таблицы переводов: плоский ключ -> Template для каждого языка
+
+    Файлы читаются один раз; ключи, которых нет в языке, заранее заполняются
+    переводом из DEFAULT_LANG. Перезагрузка подменяет таблицы целиком.
+    """
+
+    def __init__(self, locales_dir: str = LOCALES_DIR, default_lang: str = DEFAULT_LANG):
+        self.locales_dir = locales_dir
+        self.default_lang = default_lang
+        self._catalogs: Mapping[str, Mapping[str, Template]] = MappingProxyType({})
+        self._mtimes: dict[str, float] = {}
+        self._missing: set[str] = set()
+        self._watcher: Optional[asyncio.Task] = None
+
+    def _locale_files(self) -> dict[str, str]:
+        return {
+            name[:-5]: os.path.join(self.locales_dir, name)
+            for name in os.listdir(self.locales_dir)
+            if name.endswith(".json")
+        }
+
+    def load(self) -> None:
+        """Прочитать и скомпилировать все файлы локалей"""
+        raw = {}
+        mtimes = {}
+        for lang, path in self._locale_files().items():
+            try:
+                mtimes[path] = os.path.getmtime(path)
+                with open(path, "r", encoding="utf-8") as f:
+                    raw[lang] = _flatten(json.load(f))
+            except Exception as e:
+                logger.warning(f"Failed to load translations for {lang}: {e}")
+
+        fallback = raw.get(self.default_lang, {})
+        catalogs = {}
+        for lang, strings in raw.items():
+            merged = {**fallback, **strings}
+            catalogs[lang] = MappingProxyType({key: Template(value) for key, value in merged.items()})
+
+        self._catalogs = MappingProxyType(catalogs)
+        self._mtimes = mtimes
+        self._missing = set()
+        logger.info(f"Loaded translations: {', '.join(f'{lang} ({len(c)})' for lang, c in catalogs.items())}")
+
+    def resolve_lang(self, language_code: Optional[str]) -> str:
+        """Код языка Telegram -> язык каталога ("ru-RU" -> "ru", неизвестный -> DEFAULT_LANG)"""
+        if language_code:
+            lang = language_code[:2].lower()
+            if lang in self._catalogs:
+                return lang
+        return self.default_lang
+
+    def translate(self, lang: str, key: str, **kwargs) -> str:
+        if not self._catalogs:
+            self.load()
+        catalog = self._catalogs.get(lang) or self._catalogs.get(self.default_lang, {})
+        template = catalog.get(key)
+        if template is None:
+            if key not in self._missing:
+                self._missing.add(key)
+                logger.warning(f"Translation key not found: {key}")
+            return key
+        return template.render(**kwargs)
+
+    def changed(self) -> bool:
+        """Изменились ли файлы локалей с момента загрузки"""
+        try:
+            files = self._locale_files().values()
+            return set(files) != set(self._mtimes) or any(
+                os.path.getmtime(path) != self._mtimes[path] for path in files
+            )
+        except OSError:
+            return False
+
+    async def _watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            if self.changed():
+                logger.info("Locale files changed, reloading translations")
+                self.load()
+
+    def start_watcher(self, interval: float = 1.0) -> None:
+        """Перечитывать переводы при изменении файлов (для разработки)"""
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch(interval), name="translations_watcher")
+
+    async def stop_watcher(self) -> None:
+        if self._watcher is None:
+            return
+        self._watcher.cancel()
+        try:
+            await self._watcher
+        except asyncio.CancelledError:
+            pass
+        self._watcher = None
+
+
+# Создаем глобальный каталог переводов
+translations = TranslationCatalog()
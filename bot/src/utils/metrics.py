@@ -0,0 +1,88 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator
+
+# Сколько последних замеров хранить для перцентилей
+DEFAULT_WINDOW = 1000
+
+
+class LatencyStats:
+    """Задержки одной операции: счетчики за все время и окно последних замеров"""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+        }
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса бота"""
+
+    def __init__(self):
+        self.latencies: Dict[str, LatencyStats] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, float] = {}
+
+    def latency(self, name: str) -> LatencyStats:
+        if name not in self.latencies:
+            self.latencies[name] = LatencyStats()
+        return self.latencies[name]
+
+    def incr(self, name: str, value: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float) -> None:
+        self.gauges[name] = value
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Замерить блок кода; исключение засчитывается как ошибка"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.latency(name).observe(time.perf_counter() - started, error=True)
+            raise
+        self.latency(name).observe(time.perf_counter() - started)
+
+    def render(self) -> str:
+        """Текстовый отчет для команды /metrics"""
+        lines = []
+        for name, stats in sorted(self.latencies.items()):
+            s = stats.summary()
+            lines.append(
+                f"{name}: n={s['count']} err={s['errors']} avg={s['avg_ms']:.1f}ms "
+                f"p50={s['p50_ms']:.1f}ms p95={s['p95_ms']:.1f}ms p99={s['p99_ms']:.1f}ms"
+            )
+        for name, value in sorted({**self.counters, **self.gauges}.items()):
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+
+# Создаем глобальный реестр метрик
+metrics = MetricsRegistry()
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from src.configs.config import config
+from src.utils.api_client import ApiClient, ApiError, api_client
+from src.utils.db import SQLitePool, db_pool
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ACTIVATE_PATH = "/api/v1/subscription/activate"
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 5
+DEFAULT_MAX_ATTEMPTS = 20
+# Ограничение времени одного прохода дренажа, чтобы не накладывались запуски job_queue
+DEFAULT_DRAIN_BUDGET = 20.0
+RETRY_BASE_SECONDS = 5
+# Новая запись сначала доставляется прямо из обработчика платежа; дренаж берет ее позже
+INLINE_GRACE_SECONDS = 30
+RETRY_CAP_SECONDS = 3600
+# Сколько пытаться сообщить пользователю результат после доставки или отказа
+NOTIFY_WINDOW_SECONDS = 7 * 86400
+# Ответы API, при которых повтор не поможет; 401/403 — ошибка токена бота, о ней сразу узнают админы
+PERMANENT_STATUSES = {400, 401, 403, 404, 422}
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS payment_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        user_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        subscription_type TEXT NOT NULL,
+        price INTEGER NOT NULL,
+        is_renewal INTEGER NOT NULL DEFAULT 0,
+        lang TEXT,
+        created_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        delivered_at REAL,
+        failed_at REAL,
+        notified INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_payment_outbox_pending "
+    "ON payment_outbox (next_attempt_at) WHERE delivered_at IS NULL AND failed_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS ix_payment_outbox_unnotified ON payment_outbox (id) WHERE notified = 0",
+)
+
+COLUMNS = (
+    "id, idempotency_key, user_id, chat_id, subscription_type, price, is_renewal, lang, attempts"
+)
+
+
+@dataclass
+class OutboxEntry:
+    id: int
+    idempotency_key: str
+    user_id: int
+    chat_id: int
+    subscription_type: str
+    price: int
+    is_renewal: bool
+    lang: Optional[str]
+    attempts: int
+    last_error: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row) -> "OutboxEntry":
+        return cls(*row[:6], bool(row[6]), *row[7:])
+
+
+@dataclass
+class DrainReport:
+    """Итоги прохода дренажа"""
+
+    delivered: List[OutboxEntry] = field(default_factory=list)
+    # Доставленные раньше, но пользователь о них не узнал (сбой отправки или падение)
+    unnotified: List[OutboxEntry] = field(default_factory=list)
+    # Окончательно отклоненные, о которых еще не сообщили пользователю и админам
+    failed: List[OutboxEntry] = field(default_factory=list)
+    retried: int = 0
+    backlog: int = 0
+    duration: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Доставлено платежей в секунду"""
+        return len(self.delivered) / self.duration if self.duration > 0 else 0.0
+
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_CAP_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+
+class PaymentOutbox:
+    """Надежная очередь активаций оплаченных подписок
+
+    Платеж сначала записывается в SQLite (ключ идемпотентности —
+    telegram_payment_charge_id), затем отправляется в API с заголовком
+    Idempotency-Key. Недоставленные записи дренирует фоновая задача пачками
+    с ограниченным параллелизмом и экспоненциальной задержкой повторов.
+    """
+
+    def __init__(self, pool: SQLitePool = None, client: ApiClient = None):
+        self.pool = pool or db_pool
+        self.client = client or api_client
+
+    async def ensure_schema(self) -> None:
+        async with self.pool.write() as db:
+            for statement in SCHEMA:
+                await db.execute(statement)
+
+    async def record(
+        self,
+        idempotency_key: str,
+        user_id: int,
+        chat_id: int,
+        subscription_type: str,
+        price: int,
+        is_renewal: bool,
+        lang: Optional[str] = None,
+    ) -> OutboxEntry:
+        """Сохранить платеж; повторная запись того же платежа возвращает существующую"""
+        now = time.time()
+        async with self.pool.write() as db:
+            await db.execute(
+                "INSERT INTO payment_outbox (idempotency_key, user_id, chat_id, subscription_type, "
+                "price, is_renewal, lang, created_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(idempotency_key) DO NOTHING",
+                (
+                    idempotency_key, user_id, chat_id, subscription_type, price,
+                    int(is_renewal), lang, now, now + INLINE_GRACE_SECONDS,
+                ),
+            )
+            async with db.execute(
+                f"SELECT {COLUMNS} FROM payment_outbox WHERE idempotency_key = ?", (idempotency_key,)
+            ) as cursor:
+                row = await cursor.fetchone()
+        metrics.incr("payment_outbox recorded")
+        return OutboxEntry.from_row(row)
+
+    async def deliver(self, entry: OutboxEntry, api_token: Optional[str] = None) -> bool:
+        """Отправить одну запись в API; результат фиксируется в таблице"""
+        try:
+            await self.client.post(
+                ACTIVATE_PATH,
+                json={
+                    "subscription_type": entry.subscription_type,
+                    "price": entry.price,
+                    "is_renewal": entry.is_renewal,
+                },
+                headers={
+                    "Authorization": f"Bearer {api_token}",
+                    "Idempotency-Key": entry.idempotency_key,
+                },
+            )
+        except ApiError as e:
+            await self._mark_failed_attempt(entry, e)
+            return False
+
+        async with self.pool.write() as db:
+            await db.execute(
+                "UPDATE payment_outbox SET delivered_at = ?, attempts = attempts + 1, last_error = NULL "
+                "WHERE id = ?",
+                (time.time(), entry.id),
+            )
+        metrics.incr("payment_outbox delivered")
+        return True
+
+    async def _mark_failed_attempt(self, entry: OutboxEntry, error: ApiError) -> None:
+        attempts = entry.attempts + 1
+        max_attempts = config.outbox.max_attempts or DEFAULT_MAX_ATTEMPTS
+        now = time.time()
+        permanent = error.status in PERMANENT_STATUSES or attempts >= max_attempts
+        async with self.pool.write() as db:
+            await db.execute(
+                "UPDATE payment_outbox SET attempts = ?, next_attempt_at = ?, failed_at = ?, last_error = ? "
+                "WHERE id = ?",
+                (attempts, now + retry_delay(attempts), now if permanent else None, str(error)[:500], entry.id),
+            )
+        if permanent:
+            metrics.incr("payment_outbox failed")
+            logger.error(
+                f"Payment {entry.idempotency_key} for user {entry.user_id} failed permanently "
+                f"after {attempts} attempts: {error}"
+            )
+        else:
+            logger.warning(f"Payment {entry.idempotency_key} delivery attempt {attempts} failed: {error}")
+
+    async def mark_notified(self, entry_ids: List[int]) -> None:
+        if not entry_ids:
+            return
+        async with self.pool.write() as db:
+            await db.executemany(
+                "UPDATE payment_outbox SET notified = 1 WHERE id = ?", ((i,) for i in entry_ids)
+            )
+
+    async def unnotified(self, limit: int) -> Tuple[List[OutboxEntry], List[OutboxEntry]]:
+        """Платежи с итогом, о котором пользователь еще не знает: (доставленные, отклоненные)
+
+        Доставленные берутся спустя INLINE_GRACE_SECONDS — о свежих сообщает
+        обработчик платежа — и не дольше NOTIFY_WINDOW_SECONDS.
+        """
+        now = time.time()
+        async with self.pool.read() as db:
+            async with db.execute(
+                f"SELECT {COLUMNS}, last_error, failed_at IS NOT NULL FROM payment_outbox "
+                "WHERE notified = 0 AND (failed_at >= ? OR delivered_at BETWEEN ? AND ?) "
+                "ORDER BY id LIMIT ?",
+                (now - NOTIFY_WINDOW_SECONDS, now - NOTIFY_WINDOW_SECONDS, now - INLINE_GRACE_SECONDS, limit),
+            ) as cursor:
+                rows = await cursor.fetchall()
+        delivered = [OutboxEntry.from_row(row[:-1]) for row in rows if not row[-1]]
+        failed = [OutboxEntry.from_row(row[:-1]) for row in rows if row[-1]]
+        return delivered, failed
+
+    async def due(self, limit: int) -> List[OutboxEntry]:
+        async with self.pool.read() as db:
+            async with db.execute(
+                f"SELECT {COLUMNS} FROM payment_outbox "
+                "WHERE delivered_at IS NULL AND failed_at IS NULL AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (time.time(), limit),
+            ) as cursor:
+                return [OutboxEntry.from_row(row) for row in await cursor.fetchall()]
+
+    async def backlog(self) -> int:
+        """Количество недоставленных платежей"""
+        async with self.pool.read() as db:
+            async with db.execute(
+                "SELECT COUNT(*) FROM payment_outbox WHERE delivered_at IS NULL AND failed_at IS NULL"
+            ) as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def drain(self, api_token: Optional[str] = None, budget: float = DEFAULT_DRAIN_BUDGET) -> DrainReport:
+        """Доставить накопившиеся платежи пачками, пока есть готовые к отправке и не истек бюджет"""
+        batch_size = config.outbox.batch_size or DEFAULT_BATCH_SIZE
+        semaphore = asyncio.Semaphore(config.outbox.concurrency or DEFAULT_CONCURRENCY)
+        report = DrainReport()
+        started = time.monotonic()
+
+        async def deliver(entry: OutboxEntry):
+            async with semaphore:
+                if await self.deliver(entry, api_token):
+                    report.delivered.append(entry)
+                else:
+                    report.retried += 1
+
+        while time.monotonic() - started < budget:
+            batch = await self.due(batch_size)
+            if not batch:
+                break
+            await asyncio.gather(*(deliver(entry) for entry in batch))
+            if len(batch) < batch_size:
+                break
+
+        report.unnotified, report.failed = await self.unnotified(batch_size)
+        report.duration = time.monotonic() - started
+        report.backlog = await self.backlog()
+        metrics.gauge("payment_outbox backlog", report.backlog)
+        metrics.gauge("payment_outbox drain rate/s", round(report.rate, 2))
+        return report
+
+
+# Создаем глобальную очередь платежей
+payment_outbox = PaymentOutbox()
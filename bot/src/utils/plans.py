@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Каталог тарифов: один hash type -> JSON {"duration_days", "price"} и счетчик версий
+CATALOG_KEY = "subscription_catalog"
+CATALOG_VERSION_KEY = "subscription_catalog:version"
+CATALOG_CHANNEL = "subscription_catalog:invalidate"
+# Старый формат: отдельный hash subscription:{type} на каждый тариф
+LEGACY_PLAN_PREFIX = "subscription:"
+# Страховка на случай потерянного pub/sub сообщения: раз в N секунд сверяем версию
+DEFAULT_MAX_AGE = 300
+
+
+class PlanCatalog:
+    """Кэш каталога тарифов в памяти процесса
+
+    Чтения на горячем пути — обращения к словарю. Кэш сбрасывается сообщением
+    в канале CATALOG_CHANNEL (его публикуют create/delete) и, если сообщение
+    потерялось, сверкой версии не чаще раза в max_age секунд.
+    """
+
+    def __init__(self, client, max_age: float = DEFAULT_MAX_AGE):
+        self.client = client
+        self.max_age = max_age
+        self._plans: dict[str, dict] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._listener: Optional[asyncio.Task] = None
+
+    async def _migrate_legacy(self) -> None:
+        """Перенести тарифы из ключей subscription:{type} в единый hash (однократно)"""
+        plans = {}
+        async for key in self.client.scan_iter(match=f"{LEGACY_PLAN_PREFIX}*"):
+            sub_info = await self.client.hgetall(key)
+            if sub_info:
+                plans[key.split(":", 1)[1]] = json.dumps({
+                    "duration_days": int(sub_info["duration_days"]),
+                    "price": int(sub_info["price"]),
+                })
+        pipe = self.client.pipeline(transaction=True)
+        if plans:
+            pipe.hset(CATALOG_KEY, mapping=plans)
+        pipe.incr(CATALOG_VERSION_KEY)
+        await pipe.execute()
+        logger.info(f"Migrated {len(plans)} subscription types to {CATALOG_KEY}")
+
+    async def load(self) -> None:
+        """Загрузить каталог из Redis одним транзакционным снимком"""
+        async with self._lock:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.get(CATALOG_VERSION_KEY)
+            pipe.hgetall(CATALOG_KEY)
+            version, raw = await pipe.execute()
+            if version is None:
+                await self._migrate_legacy()
+                pipe = self.client.pipeline(transaction=True)
+                pipe.get(CATALOG_VERSION_KEY)
+                pipe.hgetall(CATALOG_KEY)
+                version, raw = await pipe.execute()
+
+            self._plans = {
+                sub_type: {"type": sub_type, **json.loads(value)}
+                for sub_type, value in raw.items()
+            }
+            self._version = int(version)
+            self._checked_at = time.monotonic()
+            self._loaded = True
+            logger.debug(f"Loaded {len(self._plans)} subscription types (version {self._version})")
+
+    def invalidate(self) -> None:
+        """Сбросить кэш; следующее чтение перечитает каталог"""
+        self._loaded = False
+
+    async def _ensure_fresh(self) -> None:
+        if not self._loaded:
+            await self.load()
+            return
+        if time.monotonic() - self._checked_at < self.max_age:
+            return
+        version = await self.client.get(CATALOG_VERSION_KEY)
+        if version is None or int(version) != self._version:
+            await self.load()
+        else:
+            self._checked_at = time.monotonic()
+
+    async def get_all(self) -> list[dict]:
+        await self._ensure_fresh()
+        return [dict(plan) for plan in self._plans.values()]
+
+    async def get(self, sub_type: str) -> Optional[dict]:
+        await self._ensure_fresh()
+        plan = self._plans.get(sub_type)
+        return dict(plan) if plan else None
+
+    async def upsert(self, sub_type: str, duration_days: int, price: int) -> None:
+        """Создать или изменить тариф и оповестить все процессы"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(CATALOG_KEY, sub_type, json.dumps({"duration_days": duration_days, "price": price}))
+        pipe.incr(CATALOG_VERSION_KEY)
+        pipe.publish(CATALOG_CHANNEL, sub_type)
+        await pipe.execute()
+        self.invalidate()
+
+    async def delete(self, sub_type: str) -> bool:
+        """Удалить тариф (в т.ч. ключ старого формата) и оповестить все процессы"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hdel(CATALOG_KEY, sub_type)
+        pipe.delete(f"{LEGACY_PLAN_PREFIX}{sub_type}")
+        pipe.incr(CATALOG_VERSION_KEY)
+        pipe.publish(CATALOG_CHANNEL, sub_type)
+        removed, _, _, _ = await pipe.execute()
+        self.invalidate()
+        return removed == 1
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(CATALOG_CHANNEL)
+                    # Пока не были подписаны, сообщения могли потеряться
+                    self.invalidate()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            logger.debug(f"Subscription catalog invalidated: {message['data']}")
+                            self.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Subscription catalog listener failed: {e}, reconnecting")
+                self.invalidate()
+                await asyncio.sleep(5)
+
+    def start_listener(self) -> None:
+        """Запустить фоновую подписку на канал инвалидации"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen(), name="plan_catalog_listener")
+
+    async def stop_listener(self) -> None:
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+        self._listener = None
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from telegram.error import Forbidden, BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Глобальный лимит Telegram Bot API на отправку сообщений (~30 сообщений в секунду)
+TELEGRAM_GLOBAL_RATE = 30
+DEFAULT_CONCURRENCY = 10
+DEFAULT_MAX_RETRIES = 3
+
+
+class TokenBucket:
+    """Token bucket для ограничения частоты запросов к Telegram"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Приостановить выдачу токенов (ответ RetryAfter от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        """Дождаться и забрать один токен"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Общий на процесс лимитер: все рассылки делят один глобальный лимит бота
+telegram_rate_limiter = TokenBucket(TELEGRAM_GLOBAL_RATE)
+
+
+@dataclass
+class SendReport:
+    """Итоги рассылки"""
+
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    duration: float = 0.0
+    failed_chat_ids: List[int] = field(default_factory=list)
+    # Подмножество failed_chat_ids с Forbidden/BadRequest: повтор в этот чат бесполезен
+    undeliverable_chat_ids: List[int] = field(default_factory=list)
+    # Для рассылки файлов: попытки загрузки файла (и неудачные тоже) и результат по каждому чату
+    uploads: int = 0
+    file_id: Optional[str] = None
+    deliveries: Dict[int, str] = field(default_factory=dict)
+    # message_id доставленного файла по каждому чату (для закрепления)
+    message_ids: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        """Доставлено сообщений в секунду"""
+        return self.sent / self.duration if self.duration > 0 else 0.0
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Время ожидания из RetryAfter (int или timedelta в зависимости от версии PTB)"""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class RateLimitedSender:
+    """Конкурентная отправка сообщений с учетом лимитов Telegram
+
+    Параллелизм ограничен семафором, частота — общим token bucket.
+    При RetryAfter весь bucket ставится на паузу, сообщение повторяется.
+    """
+
+    def __init__(
+        self,
+        bot,
+        limiter: TokenBucket = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        self.bot = bot
+        self.limiter = limiter or telegram_rate_limiter
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _call(self, method, report: SendReport, *args, **kwargs):
+        """Вызвать метод бота с ожиданием токена и повторами"""
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                return await method(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = retry_after_seconds(e)
+                self.limiter.pause(wait)
+                logger.warning(f"Telegram flood control, pausing sends for {wait}s")
+            except (Forbidden, BadRequest):
+                # Пользователь заблокировал бота или чат не существует — повтор бессмысленен
+                raise
+            except TelegramError as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Telegram error {e}, retrying")
+                await asyncio.sleep(min(2**attempt, 10))
+            report.retries += 1
+
+    async def send_message(
+        self, chat_id: int, text: str, report: SendReport = None, **kwargs
+    ) -> bool:
+        """Отправить одно сообщение; возвращает успех доставки"""
+        report = report if report is not None else SendReport()
+        async with self._semaphore:
+            try:
+                await self._call(
+                    self.bot.send_message, report, chat_id=chat_id, text=text, **kwargs
+                )
+                report.sent += 1
+                return True
+            except Exception as e:
+                report.failed += 1
+                report.failed_chat_ids.append(chat_id)
+                if isinstance(e, (Forbidden, BadRequest)):
+                    report.undeliverable_chat_ids.append(chat_id)
+                logger.error(f"Failed to send message to {chat_id}: {e}")
+                return False
+
+    async def send_many(
+        self, messages: Iterable[Tuple[int, str]], **kwargs
+    ) -> SendReport:
+        """Отправить пачку сообщений (chat_id, text) конкурентно"""
+        report = SendReport()
+        started = time.monotonic()
+        await asyncio.gather(
+            *(
+                self.send_message(chat_id, text, report, **kwargs)
+                for chat_id, text in messages
+            )
+        )
+        report.duration = time.monotonic() - started
+        return report
+
+    async def send_document(
+        self, chat_id: int, document, report: SendReport = None, **kwargs
+    ) -> bool:
+        """Отправить документ по file_id (без повторной загрузки файла)"""
+        report = report if report is not None else SendReport()
+        async with self._semaphore:
+            try:
+                message = await self._call(
+                    self.bot.send_document, report, chat_id=chat_id, document=document, **kwargs
+                )
+                report.sent += 1
+                report.deliveries[chat_id] = "file_id"
+                report.message_ids[chat_id] = message.message_id
+                return True
+            except Exception as e:
+                report.failed += 1
+                report.failed_chat_ids.append(chat_id)
+                if isinstance(e, (Forbidden, BadRequest)):
+                    report.undeliverable_chat_ids.append(chat_id)
+                report.deliveries[chat_id] = f"failed: {e}"
+                logger.error(f"Failed to send document to {chat_id}: {e}")
+                return False
+
+    async def send_file_to_many(
+        self, chat_ids: Iterable[int], path: str, **kwargs
+    ) -> SendReport:
+        """Разослать файл: загрузить один раз, остальным чатам отправить полученный file_id
+
+        Загрузка идет в чаты по очереди, пока один из них не примет файл;
+        затем file_id рассылается конкурентно в пределах лимитов.
+        """
+        report = SendReport()
+        started = time.monotonic()
+        pending = list(chat_ids)
+
+        async def upload(chat_id):
+            # Считается каждая передача файла, включая повторы и отказы чата
+            report.uploads += 1
+            with open(path, "rb") as f:
+                return await self.bot.send_document(
+                    chat_id=chat_id, document=f, filename=os.path.basename(path), **kwargs
+                )
+
+        while pending and report.file_id is None:
+            chat_id = pending.pop(0)
+            async with self._semaphore:
+                try:
+                    message = await self._call(upload, report, chat_id)
+                    report.file_id = message.document.file_id
+                    report.sent += 1
+                    report.deliveries[chat_id] = "uploaded"
+                    report.message_ids[chat_id] = message.message_id
+                except Exception as e:
+                    report.failed += 1
+                    report.failed_chat_ids.append(chat_id)
+                    report.deliveries[chat_id] = f"failed: {e}"
+                    logger.error(f"Failed to upload {path} to {chat_id}: {e}")
+
+        if report.file_id is not None:
+            await asyncio.gather(
+                *(self.send_document(chat_id, report.file_id, report, **kwargs) for chat_id in pending)
+            )
+        report.duration = time.monotonic() - started
+        return report
@@ -1,9 +1,16 @@
+import json
+import re
+import time
 import uuid
 from datetime import timedelta, datetime
 import redis.asyncio as redis
 import logging
 import aiosqlite
 from src.configs.config import config
+from src.utils.plans import PlanCatalog
+from src.utils.user_cache import SubscriptionStateCache, DEFAULT_TTL
+from src.utils.db import db_pool
+from src.utils.metrics import metrics
 import sqlite3
 
 # Настройка логирования
@@ -15,49 +22,160 @@ r = redis.Redis(
         decode_responses=config.redis.decode_responses
     )
 
+# Каталог тарифов в памяти процесса, сбрасывается через pub/sub
+plan_catalog = PlanCatalog(r)
+# Состояние подписки пользователя (SQLite + Redis) в памяти процесса, сбрасывается при изменениях
+subscription_cache = SubscriptionStateCache(r, ttl=config.subscription.cache_ttl or DEFAULT_TTL)
+
+# Sorted set user_id -> unix-время окончания подписки (индекс для поиска истекающих)
+EXPIRY_INDEX_KEY = "subscriptions:expiry"
+# Реестр активных подписок: user_id -> тип подписки и счетчики по типам
+ACTIVE_PLAN_KEY = "subscriptions:plan"
+PLAN_COUNTS_KEY = "subscriptions:plan_counts"
+# Отзыв сессий расширения в API (см. api/src/utils/revocation.py)
+API_REVOKED_USERS_KEY = "auth:revoked_users"
+API_REVOCATION_CHANNEL = "auth:revoked"
+# Триальные токены старого формата (trial-{user_id}), выданные до перехода на случайные
+LEGACY_TRIAL_TOKEN = re.compile(r"trial-\d+")
+
+# Атомарная регистрация подписки в реестре с пересчетом счетчиков по типам
+_register_active_script = r.register_script("""
+local old = redis.call('HGET', KEYS[2], ARGV[1])
+if old then redis.call('HINCRBY', KEYS[3], old, -1) end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('HINCRBY', KEYS[3], ARGV[2], 1)
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+return 1
+""")
+
+# Атомарное удаление истекших подписок из реестра; возвращает их количество
+_expire_registry_script = r.register_script("""
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+for _, user_id in ipairs(expired) do
+    local plan = redis.call('HGET', KEYS[2], user_id)
+    if plan then
+        redis.call('HINCRBY', KEYS[3], plan, -1)
+        redis.call('HDEL', KEYS[2], user_id)
+    end
+end
+if #expired > 0 then redis.call('ZREM', KEYS[1], unpack(expired)) end
+return #expired
+""")
+
+# Активация одним вызовом: токен пользователя, обратный ключ токена, info и реестр
+# активных подписок (как в _register_active_script) меняются атомарно
+_activate_script = r.register_script("""
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[3])
+redis.call('HSET', KEYS[3], 'chat_id', ARGV[4], 'subscription_type', ARGV[5])
+local old = redis.call('HGET', KEYS[5], ARGV[1])
+if old then redis.call('HINCRBY', KEYS[6], old, -1) end
+redis.call('HSET', KEYS[5], ARGV[1], ARGV[5])
+redis.call('HINCRBY', KEYS[6], ARGV[5], 1)
+redis.call('ZADD', KEYS[4], ARGV[6], ARGV[1])
+return 1
+""")
+
+# Запись подписки; trial_used не сбрасывается, если уже был выставлен
+UPSERT_SUBSCRIPTION_SQL = """
+    INSERT INTO subscriptions (user_id, end_date, active, trial_used, auto_renewal, lang, subtype)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        end_date=excluded.end_date,
+        active=excluded.active,
+        trial_used=subscriptions.trial_used OR excluded.trial_used,
+        auto_renewal=excluded.auto_renewal,
+        lang=excluded.lang,
+        subtype=excluded.subtype
+"""
+# То же, но строка меняется только если триал еще не использован: rowcount 0 — отказ
+CLAIM_TRIAL_SQL = UPSERT_SUBSCRIPTION_SQL + "    WHERE subscriptions.trial_used = 0\n"
+
+
+async def register_active_subscription(user_id: int, plan: str, expires_at: float, client=None):
+    """Добавить/обновить подписку в реестре активных подписок и индексе истечения
+
+    client позволяет выполнить регистрацию внутри pipeline.
+    """
+    return await _register_active_script(
+        keys=[EXPIRY_INDEX_KEY, ACTIVE_PLAN_KEY, PLAN_COUNTS_KEY],
+        args=[str(user_id), plan, expires_at],
+        client=client,
+    )
+
+async def expire_subscriptions_registry() -> int:
+    """Убрать из реестра подписки, срок которых истек"""
+    expired = await _expire_registry_script(
+        keys=[EXPIRY_INDEX_KEY, ACTIVE_PLAN_KEY, PLAN_COUNTS_KEY],
+        args=[time.time()],
+    )
+    if expired:
+        logger.info(f"Removed {expired} expired subscriptions from registry")
+    return expired
+
 
 async def user_has_used_trial(user_id: int) -> bool:
     """Проверяет в SQLite, использовал ли пользователь триал."""
-    async with aiosqlite.connect(config.database.path) as db:
+    async with db_pool.read() as db:
         async with db.execute("SELECT trial_used FROM subscriptions WHERE user_id = ?", (user_id,)) as cursor:
             result = await cursor.fetchone()
             return result[0] == 1 if result else False
 
+async def _activate(
+    user_id: int, chat_id: int, plan: str, token: str, end_date: datetime,
+    trial_used: bool = False, auto_renewal: bool = True, claim_trial: bool = False,
+) -> bool:
+    """Записать активацию в SQLite (один upsert) и Redis (один скрипт)
+
+    Скрипт выполняется внутри транзакции записи SQLite: если Redis недоступен,
+    upsert откатывается. При claim_trial строка обновляется только если триал
+    еще не использован; иначе ничего не пишется и возвращается False.
+    """
+    ttl = max(1, int((end_date - datetime.now()).total_seconds()))
+    with metrics.timer("activation"):
+        async with db_pool.write() as db:
+            cursor = await db.execute(
+                CLAIM_TRIAL_SQL if claim_trial else UPSERT_SUBSCRIPTION_SQL,
+                (user_id, end_date.strftime("%Y-%m-%d %H:%M:%S"), 1, int(trial_used), int(auto_renewal), "ru", plan),
+            )
+            if cursor.rowcount == 0:
+                return False
+            await _activate_script(
+                keys=[
+                    f"user:{user_id}:token", f"token:{token}", f"user:{user_id}:info",
+                    EXPIRY_INDEX_KEY, ACTIVE_PLAN_KEY, PLAN_COUNTS_KEY,
+                ],
+                args=[str(user_id), token, ttl, str(chat_id), plan, end_date.timestamp()],
+            )
+    await subscription_cache.publish(user_id)
+    return True
+
 async def activate_trial(user_id: int, chat_id: int) -> str | None:
     """Активирует триал, если он еще не был использован."""
-    if await user_has_used_trial(user_id):
+    # Токен — учетные данные для API, поэтому он не должен выводиться из user_id
+    token = f"trial-{uuid.uuid4()}"
+    end_date = datetime.now() + timedelta(days=config.subscription.trial_days)
+    # Флаг trial_used проверяется и выставляется тем же upsert, поэтому параллельные запросы не выдадут два триала
+    if not await _activate(user_id, chat_id, "trial", token, end_date, trial_used=True, claim_trial=True):
         logger.info(f"User {user_id} has already used the trial. No new trial granted.")
         return None
-
-    token = f"trial-{user_id}"
-    trial_days = config.subscription.trial_days
-    await r.set(f"user:{user_id}:token", token, ex=trial_days * 86400)
-    await r.set(f"token:{token}", user_id, ex=trial_days * 86400)
-    await r.hset(f"user:{user_id}:info", mapping={"chat_id": str(chat_id)})
-    # Сохраняем в SQLite и выставляем флаг trial_used
-    end_date = datetime.now() + timedelta(days=trial_days)
-    await save_subscription_to_sqlite(user_id, end_date, True, trial_used=True)
     logger.info(f"Trial activated for user_id: {user_id}")
     return token
 
 async def activate_subscription(user_id: int, chat_id: int, subscription_type: str) -> str:
-    sub_info = await r.hgetall(f"subscription:{subscription_type}")
+    sub_info = await plan_catalog.get(subscription_type)
     if not sub_info:
         logger.error(f"Subscription type {subscription_type} not found")
         raise ValueError(f"Subscription type {subscription_type} not found")
     duration_days = int(sub_info["duration_days"])
     token = str(uuid.uuid4())
-    await r.set(f"user:{user_id}:token", token, ex=duration_days * 86400)
-    await r.set(f"token:{token}", user_id, ex=duration_days * 86400)
-    await r.hset(f"user:{user_id}:info", mapping={"chat_id": str(chat_id), "subscription_type": subscription_type})
-    # Сохраняем в SQLite
     end_date = datetime.now() + timedelta(days=duration_days)
-    await save_subscription_to_sqlite(user_id, end_date, True, trial_used=await user_has_used_trial(user_id), auto_renewal=True)
+    await _activate(user_id, chat_id, subscription_type, token, end_date)
     logger.info(f"Subscription {subscription_type} activated for user_id: {user_id}")
     return token
 
 async def renew_subscription(user_id: int, chat_id: int, subscription_type: str) -> str:
-    sub_info = await r.hgetall(f"subscription:{subscription_type}")
+    sub_info = await plan_catalog.get(subscription_type)
     if not sub_info:
         logger.error(f"Subscription type {subscription_type} not found")
         raise ValueError(f"Subscription type {subscription_type} not found")
@@ -69,8 +187,13 @@ async def renew_subscription(user_id: int, chat_id: int, subscription_type: str)
         # В этом случае, ведем себя как при активации новой подписки.
         return await activate_subscription(user_id, chat_id, subscription_type)
 
-    # Получаем текущую дату окончания подписки
-    current_sub = await get_user_subscription(user_id)
+    legacy_token = token if LEGACY_TRIAL_TOKEN.fullmatch(token) else None
+    if legacy_token:
+        # Старые триальные токены trial-{user_id} угадываемы и API их не принимает
+        token = str(uuid.uuid4())
+
+    # Получаем текущую дату окончания подписки (мимо кэша: от нее считается новая)
+    current_sub = await _load_user_subscription(user_id)
     # Если по какой-то причине подписки нет в БД, считаем от сегодня
     current_end_date = datetime.now()
     if current_sub and current_sub.get('end_date'):
@@ -80,15 +203,10 @@ async def renew_subscription(user_id: int, chat_id: int, subscription_type: str)
     base_date = max(datetime.now(), current_end_date)
     new_end_date = base_date + timedelta(days=duration_days)
 
-    # Обновляем TTL в Redis
-    new_ttl_seconds = (new_end_date - datetime.now()).total_seconds()
-
-    await r.set(f"user:{user_id}:token", token, ex=int(new_ttl_seconds))
-    await r.set(f"token:{token}", user_id, ex=int(new_ttl_seconds))
-    await r.hset(f"user:{user_id}:info", mapping={"chat_id": str(chat_id), "subscription_type": subscription_type})
-
-    # Сохраняем новую дату в SQLite
-    await save_subscription_to_sqlite(user_id, new_end_date, True, trial_used=True, auto_renewal=True)
+    # TTL токена в Redis, реестр и SQLite обновляются вместе
+    await _activate(user_id, chat_id, subscription_type, token, new_end_date, trial_used=True)
+    if legacy_token:
+        await r.delete(f"token:{legacy_token}")
 
     logger.info(f"Subscription {subscription_type} renewed for user_id: {user_id}. New end date: {new_end_date.strftime('%Y-%m-%d')}")
     return token
@@ -103,6 +221,17 @@ async def is_token_valid(token: str) -> bool:
     logger.debug(f"Token {token} validity check: {exists}")
     return exists
 
+async def revoke_api_sessions(user_id: int) -> int:
+    """Отозвать все сессии пользователя в API: выданные раньше JWT перестают приниматься"""
+    # iat в JWT — целые секунды, API сравнивает его с моментом отзыва без дробной части
+    revoked_before = int(time.time())
+    pipe = r.pipeline(transaction=False)
+    pipe.hset(API_REVOKED_USERS_KEY, str(user_id), revoked_before)
+    pipe.publish(API_REVOCATION_CHANNEL, json.dumps({"users": {str(user_id): revoked_before}}))
+    await pipe.execute()
+    logger.info(f"API sessions of user {user_id} revoked")
+    return revoked_before
+
 async def create_promo(code: str, discount: int, days: int = 30):
     await r.set(f"promo:{code}", discount, ex=days * 86400)
     logger.info(f"Promo code {code} created with {discount}% discount")
@@ -112,18 +241,25 @@ async def get_promo_discount(code: str) -> int | None:
     logger.debug(f"Promo code {code} discount: {value}")
     return int(value) if value else None
 
-async def get_users_with_expiring_tokens() -> list[dict]:
-    users = []
-    cursor = "0"
-    while cursor != 0:
-        cursor, keys = await r.scan(cursor=cursor, match="user:*:token")
-        for key in keys:
-            ttl = await r.ttl(key)
-            if 0 < ttl <= 86400:
-                user_id = key.split(":")[1]
-                chat_id = await r.hget(f"user:{user_id}:info", "chat_id")
-                if chat_id:
-                    users.append({"user_id": user_id, "chat_id": int(chat_id)})
+async def get_users_with_expiring_tokens(hours: int = 24) -> list[dict]:
+    """Пользователи, чья подписка истекает в ближайшие `hours` часов
+
+    Один ZRANGEBYSCORE по индексу EXPIRY_INDEX_KEY и один pipeline с HGET chat_id,
+    независимо от общего числа пользователей.
+    """
+    now = time.time()
+    user_ids = await r.zrangebyscore(EXPIRY_INDEX_KEY, now, now + hours * 3600)
+
+    pipe = r.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.hget(f"user:{user_id}:info", "chat_id")
+    chat_ids = await pipe.execute() if user_ids else []
+
+    users = [
+        {"user_id": user_id, "chat_id": int(chat_id)}
+        for user_id, chat_id in zip(user_ids, chat_ids)
+        if chat_id
+    ]
     logger.info(f"Found {len(users)} users with expiring tokens")
     return users
 
@@ -142,61 +278,79 @@ async def set_promo_cooldown(user_id: int):
     logger.debug(f"Promo cooldown set for user_id: {user_id}")
 
 async def create_subscription_type(sub_type: str, duration_days: int, price: int):
-    await r.hset(f"subscription:{sub_type}", mapping={
-        "duration_days": str(duration_days),
-        "price": str(price)
-    })
+    await plan_catalog.upsert(sub_type, duration_days, price)
     logger.info(f"Subscription type {sub_type} created: {duration_days} days, {price} ⭐")
 
 async def delete_subscription_type(sub_type: str) -> bool:
-    deleted = await r.delete(f"subscription:{sub_type}") == 1
+    deleted = await plan_catalog.delete(sub_type)
     logger.info(f"Subscription type {sub_type} deleted: {deleted}")
     return deleted
 
 async def get_subscription_types() -> list[dict]:
-    cursor = "0"
-    subs = []
-    while cursor != 0:
-        cursor, keys = await r.scan(cursor=cursor, match="subscription:*")
-        for key in keys:
-            sub_info = await r.hgetall(key)
-            subs.append({
-                "type": key.split(":")[1],
-                "duration_days": int(sub_info["duration_days"]),
-                "price": int(sub_info["price"])
-            })
+    subs = await plan_catalog.get_all()
     logger.debug(f"Retrieved {len(subs)} subscription types")
     return subs
 
 async def get_subscription_price(sub_type: str) -> int | None:
-    price = await r.hget(f"subscription:{sub_type}", "price")
+    plan = await plan_catalog.get(sub_type)
+    price = plan["price"] if plan else None
     logger.debug(f"Subscription {sub_type} price: {price}")
-    return int(price) if price else None
+    return price
+
+async def get_active_subscriptions(offset: int = 0, limit: int = 20) -> tuple[list[dict], int]:
+    """Страница активных подписок из реестра (ближайшие к окончанию первыми)
+
+    Стоимость пропорциональна размеру страницы: ZCOUNT + ZRANGEBYSCORE LIMIT
+    и один pipeline с токенами и типами подписок.
+
+    Returns:
+        tuple[list[dict], int]: (подписки на странице, общее число активных)
+    """
+    now = time.time()
+    pipe = r.pipeline(transaction=False)
+    pipe.zcount(EXPIRY_INDEX_KEY, now, "+inf")
+    pipe.zrangebyscore(EXPIRY_INDEX_KEY, now, "+inf", start=offset, num=limit, withscores=True)
+    total, page = await pipe.execute()
+    if not page:
+        return [], total
+
+    pipe = r.pipeline(transaction=False)
+    for user_id, _ in page:
+        pipe.get(f"user:{user_id}:token")
+        pipe.hget(ACTIVE_PLAN_KEY, user_id)
+    values = await pipe.execute()
 
-async def get_active_subscriptions() -> list[dict]:
-    cursor = "0"
     active_subs = []
-    while cursor != 0:
-        cursor, keys = await r.scan(cursor=cursor, match="user:*:token")
-        for key in keys:
-            user_id = key.split(":")[1]
-            token = await r.get(key)
-            ttl = await r.ttl(key)
-            sub_type = await r.hget(f"user:{user_id}:info", "subscription_type") or "trial"
-            sub_info = await r.hgetall(f"subscription:{sub_type}") if sub_type != "trial" else {"duration_days": 14}
-            active_subs.append({
-                "user_id": user_id,
-                "token": token,
-                "subscription_type": sub_type,
-                "days_left": ttl // 86400,
-                "duration_days": int(sub_info["duration_days"])
-            })
-    logger.info(f"Retrieved {len(active_subs)} active subscriptions")
-    return active_subs
+    for i, (user_id, expires_at) in enumerate(page):
+        token, sub_type = values[2 * i], values[2 * i + 1] or "trial"
+        active_subs.append({
+            "user_id": user_id,
+            "token": token,
+            "subscription_type": sub_type,
+            "days_left": int(expires_at - now) // 86400,
+        })
+    logger.debug(f"Retrieved {len(active_subs)} of {total} active subscriptions")
+    return active_subs, total
+
+async def get_active_plan_counts() -> dict[str, int]:
+    """Количество активных подписок по типам"""
+    counts = await r.hgetall(PLAN_COUNTS_KEY)
+    return {plan: int(count) for plan, count in counts.items() if int(count) > 0}
 
 async def get_user_subscription(user_id: int) -> dict | None:
+    """Состояние подписки пользователя; повторные запросы в течение TTL кэша обходятся без I/O"""
+    found, state = subscription_cache.get(user_id)
+    if found:
+        return state
+    epoch = subscription_cache.epoch
+    state = await _load_user_subscription(user_id)
+    if not (state and state.get("error")):
+        subscription_cache.set(user_id, state, epoch)
+    return state
+
+async def _load_user_subscription(user_id: int) -> dict | None:
     try:
-        async with aiosqlite.connect(config.database.path) as db:
+        async with db_pool.read() as db:
             async with db.execute("SELECT end_date, active, trial_used, auto_renewal, lang, subtype FROM subscriptions WHERE user_id = ?", (user_id,)) as cursor:
                 sub_info = await cursor.fetchone()
     except (aiosqlite.OperationalError, Exception) as e:
@@ -217,8 +371,11 @@ async def get_user_subscription(user_id: int) -> dict | None:
 
     days_left = (end_date - datetime.now()).days
 
-    token = await r.get(f"user:{user_id}:token")
-    sub_type = await r.hget(f"user:{user_id}:info", "subscription_type") or "trial"
+    pipe = r.pipeline(transaction=False)
+    pipe.get(f"user:{user_id}:token")
+    pipe.hget(f"user:{user_id}:info", "subscription_type")
+    token, sub_type = await pipe.execute()
+    sub_type = sub_type or "trial"
 
     logger.debug(f"Retrieved subscription for user_id: {user_id}")
     return {
@@ -236,32 +393,22 @@ async def get_user_subscription(user_id: int) -> dict | None:
 async def disable_auto_renewal(user_id: int) -> bool:
     """Отключает автопродление подписки для пользователя."""
     try:
-        async with aiosqlite.connect(config.database.path) as db:
+        async with db_pool.write() as db:
             await db.execute(
                 "UPDATE subscriptions SET auto_renewal = 0 WHERE user_id = ?",
                 (user_id,)
             )
-            await db.commit()
-            logger.info(f"Auto-renewal disabled for user_id: {user_id}")
-            return True
+        await subscription_cache.publish(user_id)
+        logger.info(f"Auto-renewal disabled for user_id: {user_id}")
+        return True
     except Exception as e:
         logger.error(f"Failed to disable auto-renewal for user_id {user_id}: {e}")
         return False
 
 async def save_subscription_to_sqlite(user_id: int, end_date: datetime, active: bool, trial_used: bool = False, auto_renewal: bool = True, lang: str = "ru", subtype: str = "trial"):
-    async with aiosqlite.connect(config.database.path) as db:
+    async with db_pool.write() as db:
         await db.execute(
-            """
-            INSERT INTO subscriptions (user_id, end_date, active, trial_used, auto_renewal, lang, subtype)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                end_date=excluded.end_date,
-                active=excluded.active,
-                trial_used=subscriptions.trial_used OR excluded.trial_used,
-                auto_renewal=excluded.auto_renewal,
-                lang=excluded.lang,
-                subtype=excluded.subtype
-            """,
+            UPSERT_SUBSCRIPTION_SQL,
             (user_id, end_date.strftime("%Y-%m-%d %H:%M:%S"), int(active), int(trial_used), int(auto_renewal), lang, subtype)
         )
-        await db.commit()
+    await subscription_cache.publish(user_id)
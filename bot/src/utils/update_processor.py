@@ -0,0 +1,97 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, Hashable, List
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from src.utils.metrics import metrics
+
+DEFAULT_CONCURRENCY = 16
+# Сколько обновлений может ждать своей очереди внутри процессора
+DEFAULT_MAX_PENDING = 1000
+
+
+def update_ordering_keys(update: object) -> List[Hashable]:
+    """Ключи, в пределах которых обновления обрабатываются строго по порядку"""
+    if not isinstance(update, Update):
+        return []
+    keys = []
+    if update.effective_user:
+        keys.append(("user", update.effective_user.id))
+    if update.effective_chat:
+        keys.append(("chat", update.effective_chat.id))
+    return keys
+
+
+def update_label(update: object) -> str:
+    """Имя обработчика для метрик: команда, префикс callback_data или тип обновления"""
+    if not isinstance(update, Update):
+        return type(update).__name__
+    message = update.effective_message
+    if update.callback_query and update.callback_query.data:
+        return "callback " + update.callback_query.data.rsplit("_", 1)[0]
+    if update.pre_checkout_query:
+        return "pre_checkout_query"
+    if message and message.successful_payment:
+        return "successful_payment"
+    if message and message.text and message.text.startswith("/"):
+        return message.text.split()[0].split("@")[0]
+    return "message" if message else "other"
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для пользователя и чата
+
+    Обновления разных пользователей обрабатываются одновременно (не больше
+    concurrency), обновления одного пользователя или чата — строго по
+    очереди: платеж и /status одного пользователя не переставляются.
+    Слот параллелизма занимается только после того, как подошла очередь
+    пользователя, поэтому пачка обновлений от одного пользователя не
+    блокирует остальных. Базовый семафор PTB ограничивает число ожидающих.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, max_pending: int = DEFAULT_MAX_PENDING):
+        super().__init__(max(max_pending, concurrency))
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._holders: Dict[Hashable, int] = {}
+        self._running = 0
+
+    @asynccontextmanager
+    async def _ordered(self, key: Hashable) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._holders[key] = self._holders.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[key] -= 1
+            if not self._holders[key]:
+                del self._holders[key]
+                del self._locks[key]
+
+    async def _process(self, update: object, coroutine: Awaitable[Any], keys: List[Hashable]) -> None:
+        if keys:
+            async with self._ordered(keys[0]):
+                await self._process(update, coroutine, keys[1:])
+            return
+        async with self._slots:
+            self._running += 1
+            metrics.gauge("updates running", self._running)
+            started = time.perf_counter()
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+                metrics.latency(f"update {update_label(update)}").observe(time.perf_counter() - started)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        metrics.gauge("updates queued", self.current_concurrent_updates - self._running)
+        await self._process(update, coroutine, update_ordering_keys(update))
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
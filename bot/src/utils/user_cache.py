@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который API и бот публикуют JSON-список user_id с измененной подпиской
+SUBSCRIPTION_INVALIDATION_CHANNEL = "subscription:invalidate"
+DEFAULT_TTL = 30.0
+DEFAULT_MAX_SIZE = 10000
+
+
+class SubscriptionStateCache:
+    """Кэш собранного состояния подписки пользователя в памяти процесса
+
+    Запись живет ttl секунд (days_left и active считаются от текущего
+    времени) и сбрасывается при изменении подписки — локально и сообщением
+    в SUBSCRIPTION_INVALIDATION_CHANNEL от других процессов. Значение,
+    прочитанное до сброса, в кэш не попадает.
+    """
+
+    def __init__(self, client, ttl: float = DEFAULT_TTL, max_size: int = DEFAULT_MAX_SIZE):
+        self.client = client
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, Tuple[float, Optional[dict]]]" = OrderedDict()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def epoch(self) -> int:
+        """Номер поколения: меняется при каждом сбросе"""
+        return self._epoch
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.gauge("subscription_cache hit ratio", round(self.hit_ratio, 3))
+
+    def get(self, user_id: int) -> Tuple[bool, Optional[dict]]:
+        """(найдено, копия состояния); состояние None — у пользователя нет подписки"""
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._record(False)
+            return False, None
+        self._entries.move_to_end(user_id)
+        self._record(True)
+        return True, dict(entry[1]) if entry[1] is not None else None
+
+    def set(self, user_id: int, state: Optional[dict], epoch: int) -> None:
+        """Сохранить состояние, прочитанное в поколении epoch"""
+        if epoch != self._epoch:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl, dict(state) if state is not None else None)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._epoch += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._entries.clear()
+
+    async def publish(self, user_id: int) -> None:
+        """Сбросить запись пользователя здесь и в остальных процессах"""
+        self.invalidate(user_id)
+        try:
+            await self.client.publish(SUBSCRIPTION_INVALIDATION_CHANNEL, json.dumps([user_id]))
+        except Exception as e:
+            logger.warning(f"Failed to publish subscription invalidation for {user_id}: {e}")
+
+    def _handle_message(self, data) -> None:
+        try:
+            user_ids = json.loads(data)
+        except (TypeError, ValueError):
+            self.clear()
+            return
+        for user_id in user_ids:
+            self.invalidate(int(user_id))
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(SUBSCRIPTION_INVALIDATION_CHANNEL)
+                    # Пока не были подписаны, сообщения могли потеряться
+                    self.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._handle_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Subscription cache listener failed: {e}, reconnecting")
+                self.clear()
+                await asyncio.sleep(5)
+
+    def start_listener(self) -> None:
+        """Запустить фоновую подписку на канал инвалидации"""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen(), name="subscription_cache_listener")
+
+    async def stop_listener(self) -> None:
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+        self._listener = None
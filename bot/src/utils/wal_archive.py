@@ -0,0 +1,435 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import struct
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from glob import glob
+from typing import List, Optional, Tuple
+from src.configs.config import config
+from src.utils.backup import (
+    BackupManager, backup_manager, open_backup_for_read,
+    open_compressed, preferred_compression,
+)
+from src.utils.db import SQLitePool, db_pool
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 5.0
+# После скольких страниц в WAL архиватор сам делает checkpoint (как wal_autocheckpoint по умолчанию)
+DEFAULT_CHECKPOINT_PAGES = 1000
+WAL_HEADER = struct.Struct(">IIIIII8x")
+WAL_FRAME_HEADER = struct.Struct(">IIII8x")
+WAL_MAGIC = (0x377F0682, 0x377F0683)
+SEGMENT_PREFIX = "wal_"
+SEGMENT_RECORD = struct.Struct(">II")
+STATE_FILE = "state.json"
+
+
+@dataclass
+class WalSegment:
+    """Сегмент архива: закоммиченные кадры WAL, снятые за один проход архиватора"""
+
+    seq: int
+    path: str
+    archived_at: float
+    page_size: int
+    frames: int
+    db_pages: int
+
+
+def segment_seq_from_name(path: str) -> Optional[int]:
+    match = re.match(rf"{SEGMENT_PREFIX}(\d+)\.wal", os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+
+def read_segment_header(path: str) -> dict:
+    with open_backup_for_read(path) as f:
+        return json.loads(f.readline())
+
+
+def list_segments(archive_dir: str) -> List[str]:
+    """Сегменты архива в порядке записи"""
+    paths = [p for p in glob(os.path.join(archive_dir, f"{SEGMENT_PREFIX}*.wal*")) if not p.endswith(".part")]
+    return sorted((p for p in paths if segment_seq_from_name(p) is not None), key=segment_seq_from_name)
+
+
+class WalArchiver:
+    """Непрерывная отправка закоммиченных кадров WAL в каталог бэкапов
+
+    Автоматический checkpoint у писателя пула отключается, и WAL переносится
+    в базу архиватором после того, как его кадры сохранены в сжатый сегмент.
+    Блокировка записи пула упорядочивает только писателей бота: база общая
+    с API, и его соединения коммитят и делают checkpoint независимо. Поэтому
+    архиватор делает checkpoint в режиме RESTART и сверяет число перенесенных
+    кадров с отправленными (досылая закоммиченные в промежутке), а каждое
+    новое поколение WAL (другие salt или укороченный файл), начатое не после
+    такого проверенного checkpoint (в том числе после удаления WAL при
+    закрытии последнего соединения), считает потерей кадров: в архив пишется
+    маркер разрыва, и снимается новый базовый бэкап. restore_to_time не
+    применяет сегменты через разрыв. Кадры WAL — полные образы страниц:
+    сегменты, снятые во время снимка, можно применить к нему повторно, но
+    только вместе с сегментом, снятым после окончания снимка.
+    """
+
+    def __init__(
+        self,
+        pool: SQLitePool = None,
+        archive_dir: Optional[str] = None,
+        interval: Optional[float] = None,
+        checkpoint_pages: Optional[int] = None,
+        manager: BackupManager = None,
+    ):
+        self.pool = pool or db_pool
+        self.manager = manager or backup_manager
+        self.archive_dir = archive_dir or config.wal_archive.dir or os.path.join(backup_manager.backup_dir, "wal")
+        self.interval = interval or config.wal_archive.interval or DEFAULT_INTERVAL
+        self.checkpoint_pages = checkpoint_pages or config.wal_archive.checkpoint_pages or DEFAULT_CHECKPOINT_PAGES
+        self._salts: Optional[Tuple[int, int]] = None
+        self._offset = WAL_HEADER.size
+        self._shipped_frames = 0
+        # Поколение закрыто проверенным checkpoint: следующее начнется с salt1 + 1
+        self._sealed = False
+        # После разрыва нужен новый базовый бэкап
+        self._needs_base = False
+        self._gaps = 0
+        self._seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self._load_state()
+
+    @property
+    def wal_path(self) -> str:
+        return self.pool.path + "-wal"
+
+    def _state_path(self) -> str:
+        return os.path.join(self.archive_dir, STATE_FILE)
+
+    def _load_state(self) -> None:
+        segments = list_segments(self.archive_dir) if os.path.isdir(self.archive_dir) else []
+        self._seq = segment_seq_from_name(segments[-1]) if segments else 0
+        try:
+            with open(self._state_path(), "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._salts = tuple(state["salts"]) if state["salts"] else None
+            self._offset = state["offset"]
+            self._sealed = state.get("sealed", False)
+            self._needs_base = state.get("needs_base", False)
+        except (OSError, ValueError, KeyError):
+            # Без состояния WAL архивируется с начала: лишние кадры безопасны
+            pass
+
+    def _save_state(self) -> None:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        partial_path = self._state_path() + ".part"
+        with open(partial_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "salts": list(self._salts) if self._salts else None,
+                "offset": self._offset,
+                "seq": self._seq,
+                "sealed": self._sealed,
+                "needs_base": self._needs_base,
+            }, f)
+        os.replace(partial_path, self._state_path())
+
+    def _ship(self) -> Tuple[Optional[WalSegment], int]:
+        """Скопировать новые закоммиченные кадры WAL в сегмент
+
+        Returns:
+            (сегмент или None, число кадров в WAL)
+        """
+        try:
+            wal = open(self.wal_path, "rb")
+        except FileNotFoundError:
+            return None, 0
+        with wal:
+            header = wal.read(WAL_HEADER.size)
+            if len(header) < WAL_HEADER.size:
+                return None, 0
+            magic, _, page_size, _, salt1, salt2 = WAL_HEADER.unpack(header)
+            if magic not in WAL_MAGIC:
+                raise ValueError(f"{self.wal_path} is not a WAL file")
+            frame_size = WAL_FRAME_HEADER.size + page_size
+            if self._salts != (salt1, salt2):
+                # Новое поколение WAL: читаем с первого кадра. Хвост прошлого
+                # поколения мог быть перенесен в базу, минуя архив (checkpoint
+                # API или закрытие последнего соединения)
+                verified = self._sealed and self._salts and salt1 == (self._salts[0] + 1) & 0xFFFFFFFF
+                if not verified and (self._salts is not None or self._seq):
+                    self._mark_gap(f"WAL restarted from salts {self._salts} to {(salt1, salt2)}")
+                self._salts = (salt1, salt2)
+                self._offset = WAL_HEADER.size
+                self._sealed = False
+            elif os.fstat(wal.fileno()).st_size < self._offset:
+                self._mark_gap(f"WAL shrank below archived offset {self._offset}")
+                self._offset = WAL_HEADER.size
+
+            wal.seek(self._offset)
+            records, committed, db_pages, position = [], 0, 0, self._offset
+            while True:
+                frame = wal.read(frame_size)
+                if len(frame) < frame_size:
+                    break
+                page_no, commit_size, frame_salt1, frame_salt2 = WAL_FRAME_HEADER.unpack_from(frame)
+                if (frame_salt1, frame_salt2) != self._salts:
+                    break
+                records.append(SEGMENT_RECORD.pack(page_no, commit_size) + frame[WAL_FRAME_HEADER.size:])
+                position += frame_size
+                if commit_size:
+                    # Отправляем только кадры до последнего коммита включительно
+                    committed, db_pages, self._offset = len(records), commit_size, position
+            total_frames = (position - WAL_HEADER.size) // frame_size
+            self._shipped_frames = (self._offset - WAL_HEADER.size) // frame_size
+
+        if not committed:
+            if self._needs_base:
+                self._save_state()
+            return None, total_frames
+
+        archived_at, path = self._write_segment({
+            "page_size": page_size,
+            "frames": committed,
+            "db_pages": db_pages,
+        }, records[:committed])
+        self._save_state()
+        segment = WalSegment(
+            seq=self._seq,
+            path=path,
+            archived_at=archived_at,
+            page_size=page_size,
+            frames=committed,
+            db_pages=db_pages,
+        )
+        return segment, total_frames
+
+    def _write_segment(self, header: dict, records: List[bytes]) -> Tuple[float, str]:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        algorithm, suffix = preferred_compression()
+        self._seq += 1
+        archived_at = time.time()
+        path = os.path.join(self.archive_dir, f"{SEGMENT_PREFIX}{self._seq:010d}.wal{suffix}")
+        partial_path = path + ".part"
+        with open_compressed(partial_path, algorithm) as dst:
+            dst.write(json.dumps({"seq": self._seq, "archived_at": archived_at, **header}).encode() + b"\n")
+            for record in records:
+                dst.write(record)
+        os.replace(partial_path, path)
+        return archived_at, path
+
+    def _mark_gap(self, reason: str) -> None:
+        """Записать маркер разрыва: сегменты после него нельзя применять к прежним бэкапам"""
+        self._write_segment({"gap": True, "reason": reason, "frames": 0}, [])
+        self._needs_base = True
+        self._gaps += 1
+        metrics.incr("wal_archive gaps")
+        logger.error(f"WAL archive gap: {reason}, a new base backup is required")
+
+    async def _checkpoint(self, db) -> None:
+        """Перенести WAL в базу и закрыть поколение, если все его кадры в архиве"""
+        async with db.execute("PRAGMA wal_checkpoint(RESTART)") as cursor:
+            busy, log_frames, _ = await cursor.fetchone()
+        if busy:
+            # Чтение в другом процессе не дало завершить checkpoint — повторим в следующий проход
+            return
+        # Между копированием и checkpoint мог закоммитить API (или начать новое
+        # поколение): до следующей записи кадры перенесенного поколения еще в файле
+        gaps = self._gaps
+        await asyncio.to_thread(self._ship)
+        self._sealed = self._gaps == gaps and log_frames <= self._shipped_frames
+        self._save_state()
+
+    async def _rebase(self) -> None:
+        success, _ = await self.manager.create_backup_async(include_time=True)
+        if success:
+            self._needs_base = False
+            self._save_state()
+            logger.info("New base backup taken after WAL archive gap")
+
+    async def archive(self) -> Optional[WalSegment]:
+        """Один проход: отправить новые коммиты и при необходимости сделать checkpoint"""
+        async with self.pool.write() as db:
+            await db.execute("PRAGMA wal_autocheckpoint=0")
+            segment, total_frames = await asyncio.to_thread(self._ship)
+            if total_frames >= self.checkpoint_pages:
+                await self._checkpoint(db)
+        if self._needs_base:
+            await self._rebase()
+        if segment:
+            metrics.incr("wal_archive segments")
+            metrics.incr("wal_archive frames", segment.frames)
+            metrics.gauge("wal_archive last segment", segment.seq)
+        return segment
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.archive()
+            except Exception as e:
+                metrics.incr("wal_archive errors")
+                logger.error(f"WAL archiving failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"WAL archiver started: {self.archive_dir} every {self.interval}s")
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу и отправить последние коммиты (до закрытия пула)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.archive()
+        except Exception as e:
+            logger.error(f"Final WAL archiving failed: {e}")
+
+    def prune(self, manager: BackupManager = None) -> int:
+        """Удалить сегменты, снятые до начала самого старого бэкапа: применить их не к чему"""
+        manager = manager or self.manager
+        manifests = [m for m in map(manager.read_manifest, manager.get_backup_files()) if m]
+        if not manifests:
+            return 0
+        before = min(snapshot_started_at(m) for m in manifests)
+        deleted = 0
+        for path in list_segments(self.archive_dir):
+            if read_segment_header(path)["archived_at"] < before:
+                os.remove(path)
+                deleted += 1
+        if deleted:
+            logger.info(f"Pruned {deleted} WAL segments older than the oldest backup")
+        return deleted
+
+
+def snapshot_started_at(manifest: dict) -> float:
+    """Момент начала снимка; в старых манифестах — по created_at с точностью до секунды"""
+    if manifest.get("started_at"):
+        return manifest["started_at"]
+    return datetime.fromisoformat(manifest["created_at"]).timestamp() - manifest.get("duration", 0) - 1
+
+
+def snapshot_finished_at(manifest: dict) -> float:
+    """Момент окончания снимка; в старых манифестах — верхняя граница по created_at"""
+    if manifest.get("finished_at"):
+        return manifest["finished_at"]
+    return datetime.fromisoformat(manifest["created_at"]).timestamp() + 1
+
+
+def restore_to_time(
+    target: Optional[datetime],
+    output_path: str,
+    archive_dir: str,
+    manager: BackupManager = None,
+) -> Tuple[str, int]:
+    """
+    Восстанавливает базу на момент target: последний подходящий бэкап плюс сегменты WAL
+
+    Точность — период архиватора: сегмент применяется целиком, если снят не позже target.
+    Сегменты, снятые во время снимка, содержат страницы старше снимка: они
+    применяются, только если последний выбранный сегмент снят после окончания
+    снимка, иначе база восстанавливается из одного снимка.
+
+    Args:
+        target: Момент восстановления; None — последнее заархивированное состояние
+        output_path: Куда записать восстановленную базу
+        archive_dir: Каталог сегментов WAL
+        manager: Менеджер бэкапов, из каталога которого берется базовый снимок
+
+    Returns:
+        Tuple[str, int]: (использованный бэкап, число примененных сегментов)
+    """
+    manager = manager or backup_manager
+    # datetime хранит микросекунды: допуск, чтобы момент сегмента включал сам сегмент
+    target_ts = target.timestamp() + 1e-6 if target else float("inf")
+
+    base_path, base_manifest = None, None
+    for path in manager.get_backup_files():
+        manifest = manager.read_manifest(path)
+        if manifest and snapshot_finished_at(manifest) <= target_ts:
+            base_path, base_manifest = path, manifest
+            break
+    if base_path is None:
+        raise FileNotFoundError(f"No backup taken before {target}")
+
+    start_ts = snapshot_started_at(base_manifest)
+    segments = []
+    for path in list_segments(archive_dir):
+        header = read_segment_header(path)
+        if start_ts <= header["archived_at"] <= target_ts:
+            segments.append((path, header))
+    if segments and segments[-1][1]["archived_at"] < snapshot_finished_at(base_manifest):
+        # Иначе страницы, измененные во время снимка, откатились бы к образам до него
+        segments = []
+    for (_, previous), (path, header) in zip(segments, segments[1:]):
+        if header["seq"] != previous["seq"] + 1:
+            raise ValueError(f"WAL archive gap before {os.path.basename(path)}")
+    for path, header in segments:
+        if header.get("gap"):
+            raise ValueError(
+                f"WAL archive lost commits at {datetime.fromtimestamp(header['archived_at'])} "
+                f"({header.get('reason')}), restore from a backup taken after it"
+            )
+
+    partial_path = output_path + ".pitr"
+    try:
+        manager.materialize(base_path, partial_path)
+        with open(partial_path, "r+b") as db:
+            for path, header in segments:
+                page_size = header["page_size"]
+                with open_backup_for_read(path) as src:
+                    src.readline()
+                    for _ in range(header["frames"]):
+                        page_no, _ = SEGMENT_RECORD.unpack(src.read(SEGMENT_RECORD.size))
+                        db.seek((page_no - 1) * page_size)
+                        db.write(src.read(page_size))
+                db.truncate(header["db_pages"] * page_size)
+
+        conn = sqlite3.connect(partial_path)
+        try:
+            # Заголовок со страницы 1 из WAL помечает базу как WAL; файла журнала рядом нет
+            conn.execute("PRAGMA journal_mode=DELETE")
+            result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            conn.close()
+        if result != "ok":
+            raise ValueError(f"Integrity check failed: {result}")
+
+        os.replace(partial_path, output_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(output_path + suffix):
+                os.remove(output_path + suffix)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    logger.info(
+        f"Database restored to {target or 'latest'} from {os.path.basename(base_path)} "
+        f"and {len(segments)} WAL segments"
+    )
+    return base_path, len(segments)
+
+
+# Создаем глобальный архиватор WAL
+wal_archiver = WalArchiver()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Восстановление базы подписок на момент времени (бот должен быть остановлен)")
+    parser.add_argument("--to", help="Момент восстановления, например '2024-05-01 12:30:00'; по умолчанию — последний")
+    parser.add_argument("--output", default=config.database.path, help="Путь к восстанавливаемой базе")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    restore_to_time(
+        datetime.fromisoformat(args.to) if args.to else None,
+        args.output,
+        wal_archiver.archive_dir,
+    )
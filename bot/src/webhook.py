@@ -0,0 +1,133 @@
+import hmac
+import json
+import logging
+import time
+from typing import Optional
+import uvicorn
+from telegram import Update
+from telegram.ext import Application
+from src.configs.config import config
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = "/telegram/webhook"
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8443
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+# Telegram не присылает обновления больше нескольких десятков КБ
+MAX_BODY_SIZE = 1024 * 1024
+
+
+async def _respond(send, status: int, body: bytes = b"") -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    """Тело запроса целиком или None, если оно больше MAX_BODY_SIZE"""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def create_webhook_app(application: Application, secret_token: str, path: str = DEFAULT_PATH):
+    """
+    ASGI-приложение, принимающее обновления Telegram
+
+    Проверяет заголовок X-Telegram-Bot-Api-Secret-Token, разбирает обновление
+    и кладет его в application.update_queue; обработка идет в Application
+    как при polling. Жизненным циклом Application управляет вызывающий код,
+    а run_webhook только поднимает его под uvicorn.
+    """
+    expected = secret_token.encode()
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        if scope["path"].rstrip("/") != path.rstrip("/"):
+            await _respond(send, 404)
+            return
+        if scope["method"] != "POST":
+            await _respond(send, 405)
+            return
+
+        received = dict(scope["headers"]).get(SECRET_HEADER, b"")
+        if not hmac.compare_digest(received, expected):
+            metrics.incr("webhook rejected")
+            await _respond(send, 403)
+            return
+
+        started = time.perf_counter()
+        body = await _read_body(receive)
+        if body is None:
+            await _respond(send, 413)
+            return
+        try:
+            update = Update.de_json(json.loads(body), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Invalid webhook update: {e}")
+            await _respond(send, 400)
+            return
+
+        await application.update_queue.put(update)
+        metrics.latency("webhook ingest").observe(time.perf_counter() - started)
+        metrics.gauge("webhook queue depth", application.update_queue.qsize())
+        await _respond(send, 200)
+
+    return app
+
+
+async def run_webhook(application: Application) -> None:
+    """Запустить бота в режиме вебхука: Application + ASGI-сервер uvicorn"""
+    if not config.webhook.url or not config.webhook.secret_token:
+        raise RuntimeError("webhook.url and webhook.secret_token must be set in webhook mode")
+
+    path = config.webhook.path or DEFAULT_PATH
+    server = uvicorn.Server(uvicorn.Config(
+        create_webhook_app(application, config.webhook.secret_token, path),
+        host=config.webhook.host or DEFAULT_HOST,
+        port=config.webhook.port or DEFAULT_PORT,
+        lifespan="off",
+        log_level="warning",
+    ))
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await application.bot.set_webhook(
+            url=config.webhook.url.rstrip("/") + path,
+            secret_token=config.webhook.secret_token,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(f"Webhook set to {config.webhook.url.rstrip('/') + path}")
+        await server.serve()
+    finally:
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
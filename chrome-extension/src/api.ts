@@ -1,4 +1,5 @@
 import { CONFIG, getApiUrl, getAuthHeaders } from './config';
+import { StorageManager } from './utils/storage';
 
 interface UserProfile {
   user_id: number;
@@ -32,12 +33,60 @@ const getHeaders = (token?: string) => {
   return headers;
 };
 
+// Токен обновления одноразовый: параллельные запросы ждут одного обмена
+let refreshInFlight: Promise<string | null> | null = null;
+
+// Обменять токен обновления на новую пару токенов; возвращает новый токен доступа
+export function refreshAccessToken(): Promise<string | null> {
+  if (!refreshInFlight) {
+    refreshInFlight = exchangeRefreshToken().finally(() => {
+      refreshInFlight = null;
+    });
+  }
+  return refreshInFlight;
+}
+
+async function exchangeRefreshToken(): Promise<string | null> {
+  const refreshToken = await StorageManager.getRefreshToken();
+  if (!refreshToken) {
+    return null;
+  }
+  try {
+    const res = await fetch(getApiUrl(CONFIG.API.ENDPOINTS.AUTH_REFRESH), {
+      method: 'POST',
+      headers: getAuthHeaders(),
+      body: JSON.stringify({ refresh_token: refreshToken })
+    });
+    if (!res.ok) {
+      console.error('Token refresh failed:', res.status);
+      return null;
+    }
+    const data = await res.json();
+    await StorageManager.setTokens(data.token, data.refresh_token);
+    return data.token;
+  } catch (error) {
+    console.error('Token refresh request failed:', error);
+    return null;
+  }
+}
+
+// Запрос с токеном доступа: при 401 (токен истек) один раз обновляет токен и повторяет
+async function fetchWithAuth(endpoint: string, token: string, init: RequestInit = {}): Promise<Response> {
+  const res = await fetch(getApiUrl(endpoint), { ...init, headers: getAuthHeaders(token) });
+  if (res.status !== 401) {
+    return res;
+  }
+  const refreshed = await refreshAccessToken();
+  if (!refreshed) {
+    return res;
+  }
+  return fetch(getApiUrl(endpoint), { ...init, headers: getAuthHeaders(refreshed) });
+}
+
 export async function fetchUserProfile(token: string): Promise<UserProfile | null> {
   console.log('Fetching user profile with token:', token);
   try {
-    const res = await fetch(getApiUrl(CONFIG.API.ENDPOINTS.PROFILE), {
-      headers: getAuthHeaders(token)
-    });
+    const res = await fetchWithAuth(CONFIG.API.ENDPOINTS.PROFILE, token);
     console.log('Profile API response status:', res.status);
     
     if (res.status === 401) {
@@ -69,12 +118,26 @@ export async function fetchUserProfile(token: string): Promise<UserProfile | nul
   }
 }
 
+// Новый подписанный снимок права доступа; null, если сервер их не выдает
+export async function fetchEntitlementSnapshot(token: string): Promise<{ snapshot: string; refresh_at: number } | null> {
+  try {
+    const res = await fetchWithAuth(CONFIG.API.ENDPOINTS.ENTITLEMENT, token);
+    if (!res.ok) {
+      console.error('Entitlement API error:', res.status);
+      return null;
+    }
+    return await res.json();
+  } catch (error) {
+    console.error('Entitlement API request failed:', error);
+    return null;
+  }
+}
+
 export async function applyPromoCode(token: string, promoCode: string): Promise<PromoResponse | null> {
   console.log('Applying promo code:', promoCode);
   try {
-    const res = await fetch(getApiUrl(CONFIG.API.ENDPOINTS.APPLY_PROMO), {
+    const res = await fetchWithAuth(CONFIG.API.ENDPOINTS.APPLY_PROMO, token, {
       method: 'POST',
-      headers: getAuthHeaders(token),
       body: JSON.stringify({
         promo_code: promoCode
       })
@@ -114,9 +177,7 @@ export async function applyPromoCode(token: string, promoCode: string): Promise<
 export async function getSubscription(token: string): Promise<any> {
   console.log('Fetching subscription');
   try {
-    const res = await fetch(getApiUrl(CONFIG.API.ENDPOINTS.SUBSCRIPTION), {
-      headers: getAuthHeaders(token)
-    });
+    const res = await fetchWithAuth(CONFIG.API.ENDPOINTS.SUBSCRIPTION, token);
     
     console.log('Subscription API response status:', res.status);
     
@@ -9,7 +9,12 @@ chrome.runtime.onInstalled.addListener(() => {
 chrome.runtime.onMessage.addListener((message, sender, sendResponse) => {
   console.log('Background received message:', message);
   if (message.type === CONFIG.MESSAGES.TELEGRAM_TOKEN && message.token) {
-    chrome.storage.local.set({ [CONFIG.STORAGE.TOKEN]: message.token }, () => {
+    chrome.storage.local.set({
+      [CONFIG.STORAGE.TOKEN]: message.token,
+      [CONFIG.STORAGE.REFRESH_TOKEN]: message.refresh_token || null,
+    }, () => {
+      // Снимок права доступа предыдущего входа больше не действителен
+      chrome.storage.local.remove([CONFIG.STORAGE.ENTITLEMENT]);
       console.log('Token saved in background:', message.token);
       sendResponse({ success: true });
       chrome.runtime.sendMessage({ type: CONFIG.MESSAGES.TOKEN_UPDATED });
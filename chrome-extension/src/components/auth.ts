@@ -14,7 +14,11 @@ export function initTelegramLoginButton(container: HTMLElement) {
     // Слушаем postMessage с токеном
     function handler(event: MessageEvent) {
       if (event.data?.type === CONFIG.MESSAGES.TELEGRAM_TOKEN && event.data.token) {
-        chrome.runtime.sendMessage({ type: CONFIG.MESSAGES.TELEGRAM_TOKEN, token: event.data.token });
+        chrome.runtime.sendMessage({
+          type: CONFIG.MESSAGES.TELEGRAM_TOKEN,
+          token: event.data.token,
+          refresh_token: event.data.refresh_token,
+        });
         window.removeEventListener('message', handler);
         if (win) win.close();
       }
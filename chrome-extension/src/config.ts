@@ -9,6 +9,22 @@ import {
   API_HEADERS
 } from './constants';
 
+// Открытые ключи подписи снимков прав доступа фиксируются при сборке
+// (VITE_ENTITLEMENT_PUBLIC_JWKS — ответ /api/v1/entitlement/keys): ключу из
+// сети или из хранилища доверять нельзя, его можно подменить вместе со снимком
+const parsePinnedJwks = (value?: string): JsonWebKey[] => {
+  if (!value) {
+    return [];
+  }
+  try {
+    const parsed = JSON.parse(value);
+    return Array.isArray(parsed) ? parsed : parsed.keys || [];
+  } catch {
+    console.error('Invalid VITE_ENTITLEMENT_PUBLIC_JWKS, offline entitlement is disabled');
+    return [];
+  }
+};
+
 // Конфигурация расширения FindMyLink
 export const CONFIG = {
   // Название и информация о боте
@@ -48,6 +64,11 @@ export const CONFIG = {
 
   // Настройки хранилища
   STORAGE: STORAGE_KEYS,
+
+  // Проверка снимков прав доступа
+  ENTITLEMENT: {
+    PUBLIC_KEYS: parsePinnedJwks(import.meta.env.VITE_ENTITLEMENT_PUBLIC_JWKS),
+  },
 } as const;
 
 // Типы для конфигурации
@@ -1,10 +1,12 @@
 // Константы расширения FindMyLink
 export const STORAGE_KEYS = {
   TOKEN: 'findmylink_token',
+  REFRESH_TOKEN: 'findmylink_refresh_token',
   USER_ID: 'findmylink_user_id',
   TOKEN_EXPIRY: 'findmylink_token_expiry',
   LANGUAGE: 'findmylink_language',
   SETTINGS: 'findmylink_settings',
+  ENTITLEMENT: 'findmylink_entitlement',
 } as const;
 
 export const MESSAGE_TYPES = {
@@ -19,6 +21,9 @@ export const API_ENDPOINTS = {
   SUBSCRIPTION: '/api/v1/subscription',
   APPLY_PROMO: '/api/v1/apply_promo',
   TELEGRAM_AUTH: '/api/v1/auth/telegram',
+  AUTH_REFRESH: '/api/v1/auth/refresh',
+  AUTH_LOGOUT: '/api/v1/auth/logout',
+  ENTITLEMENT: '/api/v1/entitlement',
   TELEGRAM_LOGIN: '/api/v1/telegram-login',
   TELEGRAM_CALLBACK: '/api/v1/telegram-callback',
   EXTENSION_AUTH: '/extension-auth',
@@ -1,4 +1,5 @@
 import { fetchUserProfile } from './api';
+import { clearEntitlement, getEntitlement } from './utils/entitlement';
 import { loadTranslations, t as translate } from './i18n';
 import './styles.css';
 import { CONFIG, getBotStartUrl } from './config';
@@ -523,7 +524,8 @@ function renderLoggedInNoSubscriptionView(userId: string) {
     refreshButton.type = 'button';
     refreshButton.className = 'w-full mt-2 text-sm text-gray-500 hover:text-gray-700';
     refreshButton.textContent = t('subscription.refresh_status');
-    refreshButton.onclick = () => {
+    refreshButton.onclick = async () => {
+      await clearEntitlement();
       window.location.reload();
     };
     // Вставляем кнопки сразу после футера
@@ -604,12 +606,24 @@ async function main() {
         return;
       }
 
-      console.log('Token found, fetching user profile...');
-      const user = await fetchUserProfile(token);
+      // Подписанный снимок проверяется локально; профиль запрашивается, только если снимка нет
+      const entitlement = await getEntitlement(token);
+      const user = entitlement
+        ? {
+            user_id: entitlement.uid,
+            subscription: entitlement.end
+              ? { end_date: new Date(entitlement.end * 1000).toISOString(), active: entitlement.act }
+              : undefined,
+          }
+        : await fetchUserProfile(token);
 
       if (!user) {
         console.log('Invalid token, rendering logged out view');
-        chrome.storage.local.remove([CONFIG.STORAGE.TOKEN]);
+        chrome.storage.local.remove([
+          CONFIG.STORAGE.TOKEN,
+          CONFIG.STORAGE.REFRESH_TOKEN,
+          CONFIG.STORAGE.ENTITLEMENT,
+        ]);
         renderLoggedOutView();
         return;
       }
@@ -643,7 +657,12 @@ function openTelegramAuthPopup() {
   function handleMessage(event: MessageEvent) {
     if (event.origin !== 'https://findmylink.ru') return;
     if (event.data?.type === 'telegram_token' && event.data.token) {
-      chrome.storage.local.set({ findmylink_token: event.data.token }, () => {
+      chrome.storage.local.set({
+        [CONFIG.STORAGE.TOKEN]: event.data.token,
+        [CONFIG.STORAGE.REFRESH_TOKEN]: event.data.refresh_token || null,
+      }, async () => {
+        // Снимок предыдущего входа может относиться к другому пользователю
+        await clearEntitlement();
         window.location.reload();
       });
       window.removeEventListener('message', handleMessage);
@@ -0,0 +1,97 @@
+import { CONFIG } from '../config';
+import { fetchEntitlementSnapshot } from '../api';
+
+// Данные подписанного снимка права доступа (выдается /api/v1/entitlement)
+export interface EntitlementClaims {
+  uid: number;
+  plan: string | null;
+  end: number | null;
+  act: boolean;
+  iat: number;
+  exp: number;
+}
+
+const base64UrlDecode = (value: string): Uint8Array => {
+  const base64 = value.replace(/-/g, '+').replace(/_/g, '/');
+  const binary = atob(base64 + '='.repeat((4 - (base64.length % 4)) % 4));
+  return Uint8Array.from(binary, (char) => char.charCodeAt(0));
+};
+
+const storageGet = (keys: string[]): Promise<Record<string, any>> =>
+  new Promise((resolve) => chrome.storage.local.get(keys, resolve));
+
+const storageSet = (items: Record<string, any>): Promise<void> =>
+  new Promise((resolve) => chrome.storage.local.set(items, resolve));
+
+// Проверить подпись ES256 (r||s) снимка ключом, зафиксированным при сборке; возвращает данные или null
+async function verifySnapshot(snapshot: string): Promise<EntitlementClaims | null> {
+  const keys: readonly JsonWebKey[] = CONFIG.ENTITLEMENT.PUBLIC_KEYS;
+  const [header, payload, signature] = snapshot.split('.');
+  if (!header || !payload || !signature) {
+    return null;
+  }
+  try {
+    const { kid } = JSON.parse(new TextDecoder().decode(base64UrlDecode(header)));
+    const jwk = keys.find((key: any) => key.kid === kid);
+    if (!jwk) {
+      return null;
+    }
+    const key = await crypto.subtle.importKey(
+      'jwk',
+      { kty: jwk.kty, crv: jwk.crv, x: jwk.x, y: jwk.y },
+      { name: 'ECDSA', namedCurve: 'P-256' },
+      false,
+      ['verify']
+    );
+    const valid = await crypto.subtle.verify(
+      { name: 'ECDSA', hash: 'SHA-256' },
+      key,
+      base64UrlDecode(signature),
+      new TextEncoder().encode(`${header}.${payload}`)
+    );
+    return valid ? JSON.parse(new TextDecoder().decode(base64UrlDecode(payload))) : null;
+  } catch (error) {
+    console.error('Entitlement verification failed:', error);
+    return null;
+  }
+}
+
+/**
+ * Право доступа пользователя: до срока обновления берется из сохраненного
+ * снимка без обращения к серверу, затем запрашивается новый снимок.
+ * null — снимок получить не удалось (нужно запросить профиль).
+ */
+export async function getEntitlement(token: string): Promise<EntitlementClaims | null> {
+  // Без ключа в сборке снимкам не на что опереться
+  if (!CONFIG.ENTITLEMENT.PUBLIC_KEYS.length) {
+    return null;
+  }
+  const stored = await storageGet([CONFIG.STORAGE.ENTITLEMENT]);
+  const now = Date.now() / 1000;
+
+  const cached = stored[CONFIG.STORAGE.ENTITLEMENT];
+  if (cached) {
+    const claims = await verifySnapshot(cached);
+    if (claims && claims.exp > now) {
+      return claims;
+    }
+  }
+
+  const issued = await fetchEntitlementSnapshot(token);
+  if (!issued) {
+    return null;
+  }
+  const claims = await verifySnapshot(issued.snapshot);
+  if (!claims) {
+    return null;
+  }
+  await storageSet({ [CONFIG.STORAGE.ENTITLEMENT]: issued.snapshot });
+  return claims;
+}
+
+// Удалить сохраненный снимок (при выходе или ручном обновлении статуса)
+export async function clearEntitlement(): Promise<void> {
+  return new Promise((resolve) => {
+    chrome.storage.local.remove([CONFIG.STORAGE.ENTITLEMENT], resolve);
+  });
+}
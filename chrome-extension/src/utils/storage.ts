@@ -18,10 +18,32 @@ export class StorageManager {
     });
   }
 
-  // Удалить токен из хранилища
+  // Получить токен обновления из хранилища
+  static async getRefreshToken(): Promise<string | null> {
+    return new Promise((resolve) => {
+      chrome.storage.local.get([CONFIG.STORAGE.REFRESH_TOKEN], (result) => {
+        resolve(result[CONFIG.STORAGE.REFRESH_TOKEN] || null);
+      });
+    });
+  }
+
+  // Сохранить токен доступа и токен обновления
+  static async setTokens(token: string, refreshToken: string): Promise<void> {
+    return new Promise((resolve) => {
+      chrome.storage.local.set(
+        { [CONFIG.STORAGE.TOKEN]: token, [CONFIG.STORAGE.REFRESH_TOKEN]: refreshToken },
+        resolve
+      );
+    });
+  }
+
+  // Удалить токены из хранилища
   static async removeToken(): Promise<void> {
     return new Promise((resolve) => {
-      chrome.storage.local.remove([CONFIG.STORAGE.TOKEN], resolve);
+      chrome.storage.local.remove(
+        [CONFIG.STORAGE.TOKEN, CONFIG.STORAGE.REFRESH_TOKEN, CONFIG.STORAGE.ENTITLEMENT],
+        resolve
+      );
     });
   }
 